@@ -1,9 +1,26 @@
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for, flash
+from flask import Flask, Response, render_template, request, jsonify, session, redirect, url_for, flash, stream_with_context, send_file, send_from_directory
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
-from models import db, User, Property, Unit, Lease, Payment, Message, Notification, MaintenanceRequest
+from models import db, User, Property, Unit, Lease, Payment, Message, Notification, MaintenanceRequest, Conversation, ConversationMember, ShardAssignment
 from config import Config
+from pagination import paginate
+from streaming import stream_page, stream_rows
+from notifications import notify, stream_cursor, parse_stream_cursor, changed_since
+from conversations import conversation_between, record_message, mark_conversation_read, backfill_conversations
+from template_cache import init_template_cache, precompile_templates, versioned
+from instrumentation import init_instrumentation
+from metrics import init_metrics, record_event, render_metrics
+from slow_queries import init_slow_query_log, top_offenders
+from profiling import init_profiling, list_profiles
+from sharding import init_sharding, each_shard, place_landlord, route_tenant
+from sqlalchemy import and_, case, extract, func, or_, text, union
+from sqlalchemy.orm import aliased, joinedload, configure_mappers
 from datetime import datetime, timedelta
+import click
+import heapq
+import hmac
 import json
+import os
+import time
 
 
 app = Flask(__name__)
@@ -11,18 +28,90 @@ app.config.from_object(Config)
 
 # Initialize extensions
 db.init_app(app)
+init_sharding(app)
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'login'
+init_template_cache(app)
+init_instrumentation(app)
+init_metrics(app)
+init_slow_query_log(app)
+init_profiling(app)
+
+# Rarely used subsystems (full-text search, ...) are imported inside the views
+# and commands that need them so a serverless cold start does not pay for them.
 
 @login_manager.user_loader
 def load_user(user_id):
     return User.query.get(int(user_id))
 
+def add_missing_columns(engine=None, tables=None):
+    # create_all() only creates missing tables; bring existing ones up to the models
+    from sqlalchemy import inspect
+    from sqlalchemy.schema import CreateColumn
+    
+    engine = engine or db.engine
+    inspector = inspect(engine)
+    added = []
+    with engine.begin() as conn:
+        for table in tables or db.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            columns = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in columns:
+                    conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {CreateColumn(column).compile(dialect=engine.dialect)}'))
+                    added.append(f'{table.name}.{column.name}')
+            indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in indexes:
+                    index.create(conn)
+    return added
+
+def rebuild_with_autoincrement(table, engine=None):
+    # SQLite only applies AUTOINCREMENT when a table is created, so copy older tables into a new one
+    engine = engine or db.engine
+    if engine.dialect.name != 'sqlite':
+        return False
+    with engine.begin() as conn:
+        sql = conn.scalar(text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                          {'name': table.name})
+        if sql is None or 'AUTOINCREMENT' in sql.upper():
+            return False
+        indexes = conn.scalars(text("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = :name "
+                                    "AND sql IS NOT NULL"), {'name': table.name}).all()
+        columns = [row[1] for row in conn.execute(text(f'PRAGMA table_info({table.name})'))]
+        columns = ', '.join(column.name for column in table.columns if column.name in columns)
+        for index in indexes:
+            conn.execute(text(f'DROP INDEX {index}'))
+        conn.execute(text(f'ALTER TABLE {table.name} RENAME TO {table.name}_old'))
+        table.create(conn)
+        conn.execute(text(f'INSERT INTO {table.name} ({columns}) SELECT {columns} FROM {table.name}_old'))
+        conn.execute(text(f'DROP TABLE {table.name}_old'))
+    return True
+
 def init_db():
+    # Schema setup runs from the CLI or the server entry point, never per request
+    from search import ensure_search_index
+    from sharding import init_shards
+    
     with app.app_context():
         # Create all tables
         db.create_all()
+        for column in add_missing_columns():
+            print(f"Added column {column}")
+            if column.endswith('notification.updated_at'):
+                table = column.split('.')[0]
+                db.session.execute(text(f'UPDATE {table} SET updated_at = created_at WHERE updated_at IS NULL'))
+                db.session.commit()
+        if rebuild_with_autoincrement(Notification.__table__):
+            print("Rebuilt notification with AUTOINCREMENT ids")
+        # Messages from before conversation threads
+        linked = backfill_conversations()
+        if linked:
+            print(f"Linked {linked} messages to conversations")
+        ensure_search_index()
+        init_shards(add_missing_columns)
         
         # Create admin user if not exists
         if not User.query.filter_by(role='admin').first():
@@ -36,6 +125,116 @@ def init_db():
             db.session.commit()
             print("Admin user created: admin / admin123")
 
+def warm_up():
+    # Do the first-request work up front, before any worker accepts traffic
+    with app.app_context():
+        configure_mappers()
+        for name in app.jinja_env.list_templates(extensions=['html']):
+            app.jinja_env.get_template(name)
+        with db.engine.connect() as conn:
+            conn.execute(text('SELECT 1'))
+        # Connections must not be shared with forked workers
+        for engine in db.engines.values():
+            engine.dispose()
+
+@app.cli.command('init-db')
+def init_db_command():
+    """Create tables, search indexes and the admin user."""
+    init_db()
+    print("Database initialized")
+
+@app.cli.command('precompile-templates')
+def precompile_templates_command():
+    """Write Jinja bytecode for every template into JINJA_PRECOMPILED_DIR."""
+    names = precompile_templates(app, app.config['JINJA_PRECOMPILED_DIR'])
+    print(f"Precompiled {len(names)} templates into {versioned(app.config['JINJA_PRECOMPILED_DIR'])}")
+
+@app.cli.command('rebuild-search')
+def rebuild_search_command():
+    """Rebuild the full-text search index from the source tables."""
+    from search import rebuild_search_index
+    from sharding import shard_count, shard_engine
+    
+    if rebuild_search_index():
+        for shard in range(shard_count()):
+            rebuild_search_index(shard_engine(shard), tables=['maintenance_request'])
+        print("Search index rebuilt")
+    else:
+        print("Full-text index is only available on SQLite; using substring search")
+
+@app.cli.command('archive')
+@click.option('--dry-run', is_flag=True, help='Only count the rows past retention.')
+def archive_command(dry_run):
+    """Move rows past their retention period into the archive tables."""
+    from archive import archive_cold_rows
+    
+    from sharding import shard_label
+    
+    for shard in each_shard():
+        moved = archive_cold_rows(app.config, dry_run=dry_run)
+        for label, count in moved.items():
+            print(f"{shard_label(shard)} {label}: {count} {'to archive' if dry_run else 'archived'}")
+
+@app.cli.command('prune-attachments')
+def prune_attachments_command():
+    """Delete stored attachment files that no attachment row refers to."""
+    from attachments import prune_blobs
+    
+    print(f"Removed {prune_blobs(app.config['ATTACHMENT_DIR'])} unreferenced file(s)")
+
+@app.cli.command('expire-leases')
+@click.option('--dry-run', is_flag=True, help='Only count the active leases past their end date.')
+def expire_leases_command(dry_run):
+    """Mark active leases past their end date as expired and free their units."""
+    from leases import expire_leases
+    
+    from sharding import shard_label
+    
+    for shard in each_shard():
+        result = expire_leases(dry_run=dry_run)
+        if dry_run:
+            print(f"{shard_label(shard)}: {result['leases']} lease(s) to expire")
+        else:
+            print(f"{shard_label(shard)}: expired {result['leases']} lease(s) and freed {result['units']} unit(s)")
+
+@app.cli.command('shard-status')
+def shard_status_command():
+    """Show the landlords and units in each shard."""
+    from sharding import shard_loads, shard_label
+    
+    for shard, landlords in shard_loads().items():
+        print(f"{shard_label(shard)}: {len(landlords)} landlord(s), {sum(landlords.values())} unit(s)")
+
+@app.cli.command('shard-move')
+@click.argument('landlord_id', type=int)
+@click.argument('shard', type=int)
+def shard_move_command(landlord_id, shard):
+    """Move a landlord, their tenants and all their rows to another shard."""
+    from sharding import move_landlord, ShardMoveError
+    
+    try:
+        moved = move_landlord(landlord_id, shard)
+    except ShardMoveError as e:
+        raise click.ClickException(str(e))
+    print(f"Moved landlord {landlord_id} to shard {shard}: " +
+          (', '.join(f"{count} {table}" for table, count in moved.items() if count) or 'already there'))
+
+@app.cli.command('shard-rebalance')
+@click.option('--include-unassigned', is_flag=True, help='Also move landlords still in the directory database.')
+@click.option('--dry-run', is_flag=True, help='Only print the moves.')
+def shard_rebalance_command(include_unassigned, dry_run):
+    """Move landlords between shards until their unit counts are even."""
+    from sharding import move_landlord, plan_rebalance, shard_loads, shard_label
+    
+    if not app.config['SHARD_URLS']:
+        raise click.ClickException('Sharding is not enabled (SHARD_URLS)')
+    plan = plan_rebalance(shard_loads(), include_unassigned=include_unassigned)
+    for landlord_id, source, target in plan:
+        print(f"Landlord {landlord_id}: {shard_label(source)} -> {shard_label(target)}")
+        if not dry_run:
+            move_landlord(landlord_id, target)
+    print(f"{len(plan)} move(s){' planned' if dry_run else ''}")
+
 # Routes
 @app.route('/')
 def index():
@@ -91,8 +290,19 @@ def admin_users():
     if current_user.role != 'admin':
         return redirect(url_for('index'))
     
-    users = User.query.all()
-    return render_template('admin/users.html', users=users)
+    sort_columns = {
+        'username': User.username,
+        'email': User.email,
+        'role': User.role,
+        'joined': func.coalesce(User.created_at, datetime.min)
+    }
+    query = User.query
+    role = request.args.get('role')
+    if role:
+        query = query.filter(User.role == role)
+    
+    page = paginate(query, sort_columns, User.id, default_sort='joined', default_direction='desc')
+    return render_template('admin/users.html', users=page.items, page=page, role=role)
 
 @app.route('/admin/create-user', methods=['POST'])
 @login_required
@@ -121,6 +331,9 @@ def create_user():
     
     try:
         db.session.add(user)
+        if user.role == 'landlord':
+            db.session.flush()
+            place_landlord(user.id)
         db.session.commit()
         return jsonify({'success': True, 'message': 'User created successfully'})
     except Exception as e:
@@ -156,9 +369,9 @@ def admin_register_tenant():
             return jsonify({'error': str(e)}), 400
     
     # GET request - show form
-    properties = Property.query.all()
-    vacant_units = Unit.query.filter_by(status='vacant').all()
-    return render_template('admin/register_tenant.html', properties=properties, vacant_units=vacant_units)
+    # Vacant units are searched as the admin types (search_vacant_units)
+    properties = Property.query.order_by(Property.name).all()
+    return render_template('admin/register_tenant.html', properties=properties)
 
 @app.route('/admin/assign-unit', methods=['POST'])
 @login_required
@@ -174,52 +387,124 @@ def admin_assign_unit():
     if not tenant or not unit:
         return jsonify({'error': 'Tenant or unit not found'}), 404
     
+    # A fast path only: the UPDATE that claims the unit checks again
     if unit.status != 'vacant':
         return jsonify({'error': 'Unit is not vacant'}), 400
     
-    # Create lease
-    lease = Lease(
-        tenant_id=tenant.id,
-        unit_id=unit.id,
-        start_date=datetime.strptime(data.get('start_date'), '%Y-%m-%d').date(),
-        end_date=datetime.strptime(data.get('end_date'), '%Y-%m-%d').date(),
-        monthly_rent=unit.rent_amount,
-        security_deposit=data.get('security_deposit', 0),
-        status='active'
-    )
-    
-    # Update unit status
-    unit.status = 'occupied'
-    
-    # Update property occupancy
-    unit.property.occupied_units += 1
+    from leases import start_lease
     
     try:
-        db.session.add(lease)
+        # The vacancy check happens in the UPDATE that claims the unit, so
+        # of two concurrent assignments only one can succeed
+        landlord_id = unit.property.landlord_id
+        lease = start_lease(
+            tenant.id, unit,
+            start_date=datetime.strptime(data.get('start_date'), '%Y-%m-%d').date(),
+            end_date=datetime.strptime(data.get('end_date'), '%Y-%m-%d').date(),
+            monthly_rent=unit.rent_amount,
+            security_deposit=data.get('security_deposit', 0)
+        )
+        if lease is None:
+            db.session.rollback()
+            return jsonify({'error': 'Unit is not vacant'}), 400
+        route_tenant(tenant.id, landlord_id)
         db.session.commit()
         return jsonify({'success': True, 'message': 'Unit assigned successfully'})
     except Exception as e:
+        db.session.rollback()
         return jsonify({'error': str(e)}), 400
 
+TENANT_SORT_COLUMNS = {
+    'name': func.coalesce(User.full_name, ''),
+    'username': User.username,
+    'email': User.email,
+    'joined': func.coalesce(User.created_at, datetime.min),
+    'property': func.coalesce(Property.name, ''),
+    'unit': func.coalesce(Unit.unit_number, ''),
+    'rent': func.coalesce(Lease.monthly_rent, 0),
+    'lease_end': func.coalesce(Lease.end_date, datetime.min.date())
+}
+
 @app.route('/admin/tenants')
 @login_required
 def admin_tenants():
     if current_user.role != 'admin':
         return redirect(url_for('index'))
     
-    tenants = User.query.filter_by(role='tenant').all()
-    tenants_data = []
+    lease_filter = request.args.get('lease', '')
+    property_id = request.args.get('property_id', type=int)
+    arrears = request.args.get('arrears') == '1'
+
+    # One outer-joined query: tenant -> active lease -> unit -> property
+    query = db.session.query(User, Lease, Unit, Property).select_from(User)\
+        .outerjoin(Lease, and_(Lease.tenant_id == User.id, Lease.status == 'active'))\
+        .outerjoin(Unit, Unit.id == Lease.unit_id)\
+        .outerjoin(Property, Property.id == Unit.property_id)\
+        .filter(User.role == 'tenant')
+
+    if lease_filter == 'yes':
+        query = query.filter(Lease.id.isnot(None))
+    elif lease_filter == 'no':
+        query = query.filter(Lease.id.is_(None))
+
+    if property_id:
+        query = query.filter(Property.id == property_id)
+
+    if arrears:
+        # Active lease with no approved payment covering today
+        today = datetime.now().date()
+        paid_up = db.session.query(Payment.id).filter(
+            Payment.lease_id == Lease.id,
+            Payment.status == 'approved',
+            Payment.due_date >= today
+        ).exists()
+        query = query.filter(Lease.id.isnot(None), Lease.start_date <= today, ~paid_up)
+
+    page = paginate(query, TENANT_SORT_COLUMNS, User.id, default_sort='name', default_per_page=50, max_per_page=200)
+    tenants_data = [
+        {'tenant': tenant, 'lease': lease, 'unit': unit, 'property': prop}
+        for tenant, lease, unit, prop in page.items
+    ]
+
+    properties = db.session.query(Property.id, Property.name).order_by(Property.name).all()
+    filters = {
+        'sort': page.sort,
+        'dir': page.direction,
+        'lease': lease_filter,
+        'property_id': property_id,
+        'arrears': '1' if arrears else ''
+    }
+
+    return render_template('admin/tenants.html', tenants_data=tenants_data, page=page,
+                           properties=properties, filters=filters)
+
+@app.route('/admin/slow-queries')
+@login_required
+def admin_slow_queries():
+    if current_user.role != 'admin':
+        return redirect(url_for('index'))
+    
+    offenders = top_offenders(app.config['SLOW_QUERY_LOG'], app.config['SLOW_QUERY_LOG_BACKUPS'])
     
-    for tenant in tenants:
-        lease = Lease.query.filter_by(tenant_id=tenant.id, status='active').first()
-        tenants_data.append({
-            'tenant': tenant,
-            'lease': lease,
-            'unit': lease.unit if lease else None,
-            'property': lease.unit.property if lease and lease.unit else None
-        })
+    return render_template('admin/slow_queries.html', offenders=offenders,
+                           threshold=app.config['SLOW_QUERY_THRESHOLD_MS'])
+
+@app.route('/admin/profiles')
+@login_required
+def admin_profiles():
+    if current_user.role != 'admin':
+        return redirect(url_for('index'))
+    
+    return render_template('admin/profiles.html', profiles=list_profiles(),
+                           sample_routes=app.config['PROFILE_SAMPLE_ROUTES'])
+
+@app.route('/admin/profiles/<path:filename>')
+@login_required
+def admin_profile_file(filename):
+    if current_user.role != 'admin':
+        return redirect(url_for('index'))
     
-    return render_template('admin/tenants.html', tenants_data=tenants_data)
+    return send_from_directory(app.config['PROFILE_DIR'], filename, as_attachment=True)
 
 # Landlord Routes
 @app.route('/landlord/dashboard')
@@ -233,18 +518,17 @@ def landlord_dashboard():
     # Calculate stats
     total_units = sum([prop.total_units for prop in properties])
     occupied_units = sum([prop.occupied_units for prop in properties])
-    total_rent = sum([unit.rent_amount for prop in properties for unit in prop.units if unit.status == 'occupied'])
-    
-    # Get recent payments
-    recent_payments = []
-    for prop in properties:
-        for unit in prop.units:
-            for lease in unit.leases:
-                recent_payments.extend(lease.payments)
-    
-    # Sort by creation date and get latest 5
-    recent_payments.sort(key=lambda x: x.created_at, reverse=True)
-    recent_payments = recent_payments[:5]
+    total_rent = db.session.query(func.coalesce(func.sum(Unit.rent_amount), 0))\
+        .join(Property, Property.id == Unit.property_id)\
+        .filter(Property.landlord_id == current_user.id, Unit.status == 'occupied').scalar()
+    
+    # Latest 5 payments with their tenant and property in one query
+    recent_payments = Payment.query.join(Lease, Lease.id == Payment.lease_id)\
+        .join(Unit, Unit.id == Lease.unit_id)\
+        .filter(Unit.property_id.in_([p.id for p in properties]))\
+        .options(joinedload(Payment.lease).joinedload(Lease.tenant),
+                 joinedload(Payment.lease).joinedload(Lease.unit).joinedload(Unit.property))\
+        .order_by(Payment.created_at.desc(), Payment.id.desc()).limit(5).all()
     
     stats = {
         'total_properties': len(properties),
@@ -272,19 +556,10 @@ def landlord_payments():
     if current_user.role != 'landlord':
         return redirect(url_for('index'))
     
-    properties = Property.query.filter_by(landlord_id=current_user.id).all()
-    
-    # Get all payments for this landlord's properties
-    all_payments = []
-    for prop in properties:
-        for unit in prop.units:
-            for lease in unit.leases:
-                all_payments.extend(lease.payments)
-    
-    # Sort by creation date (newest first)
-    all_payments.sort(key=lambda x: x.created_at, reverse=True)
+    # Streamed newest first straight from the query, however long the history is
+    payments = landlord_payment_query(current_user.id).order_by(Payment.created_at.desc(), Payment.id.desc())
     
-    return render_template('landlord/payments.html', payments=all_payments)
+    return stream_page('landlord/payments.html', payments=stream_rows(payments))
 
 @app.route('/landlord/tenants')
 @login_required
@@ -292,20 +567,19 @@ def landlord_tenants():
     if current_user.role != 'landlord':
         return redirect(url_for('index'))
     
-    properties = Property.query.filter_by(landlord_id=current_user.id).all()
+    # Active leases for this landlord's properties with tenant, unit and property joined in
+    leases = Lease.query.join(Unit, Unit.id == Lease.unit_id)\
+        .join(Property, Property.id == Unit.property_id)\
+        .filter(Property.landlord_id == current_user.id, Lease.status == 'active')\
+        .options(joinedload(Lease.tenant), joinedload(Lease.unit).joinedload(Unit.property))\
+        .order_by(Property.id, Unit.id, Lease.id).all()
     
-    # Get all tenants for this landlord's properties
-    tenants = []
-    for prop in properties:
-        for unit in prop.units:
-            for lease in unit.leases:
-                if lease.status == 'active':
-                    tenants.append({
-                        'tenant': lease.tenant,
-                        'lease': lease,
-                        'unit': unit,
-                        'property': prop
-                    })
+    tenants = [{
+        'tenant': lease.tenant,
+        'lease': lease,
+        'unit': lease.unit,
+        'property': lease.unit.property
+    } for lease in leases]
     
     return render_template('landlord/tenants.html', tenants=tenants)
 
@@ -316,10 +590,10 @@ def landlord_units():
     if current_user.role != 'landlord':
         return redirect(url_for('index'))
     
-    properties = Property.query.filter_by(landlord_id=current_user.id).all()
-    units = Unit.query.filter(Unit.property_id.in_([p.id for p in properties])).all()
+    # Unit grids are collapsed and loaded per property from api_property_units
+    properties = Property.query.filter_by(landlord_id=current_user.id).order_by(Property.name).all()
     
-    return render_template('landlord/units.html', properties=properties, units=units)
+    return render_template('landlord/units.html', properties=properties)
 
 @app.route('/landlord/maintenance-reports')
 @login_required
@@ -330,9 +604,37 @@ def landlord_maintenance_reports():
     properties = Property.query.filter_by(landlord_id=current_user.id).all()
     property_ids = [p.id for p in properties]
     
-    maintenance_requests = MaintenanceRequest.query.join(Unit).filter(Unit.property_id.in_(property_ids)).order_by(MaintenanceRequest.created_at.desc()).all()
+    base_query = MaintenanceRequest.query.join(Unit).filter(Unit.property_id.in_(property_ids))
+    
+    # Status totals come from one aggregate instead of counting loaded rows
+    status_counts = dict(
+        base_query.with_entities(MaintenanceRequest.status, func.count(MaintenanceRequest.id))
+        .group_by(MaintenanceRequest.status).all()
+    )
+    
+    status = request.args.get('status')
+    query = base_query.options(
+        joinedload(MaintenanceRequest.unit).joinedload(Unit.property),
+        joinedload(MaintenanceRequest.tenant)
+    )
+    if status:
+        query = query.filter(MaintenanceRequest.status == status)
+    
+    sort_columns = {
+        'submitted': MaintenanceRequest.created_at,
+        'updated': MaintenanceRequest.updated_at,
+        'urgency': MaintenanceRequest.urgency,
+        'status': MaintenanceRequest.status
+    }
+    page = paginate(query, sort_columns, MaintenanceRequest.id, default_sort='submitted', default_direction='desc', count=False)
     
-    return render_template('landlord/maintenance_reports.html', maintenance_requests=maintenance_requests)
+    from attachments import attachments_for
+    
+    # Names and sizes only; files are fetched when a link is opened
+    attachments = attachments_for('maintenance_request', [r.id for r in page.items])
+    
+    return render_template('landlord/maintenance_reports.html', maintenance_requests=page.items, page=page,
+                           status_counts=status_counts, status=status, attachments=attachments)
 
 @app.route('/landlord/tenant-payments')
 @login_required
@@ -340,26 +642,52 @@ def landlord_tenant_payments():
     if current_user.role != 'landlord':
         return redirect(url_for('index'))
     
-    properties = Property.query.filter_by(landlord_id=current_user.id).all()
+    from archive import ArchivedLease, ArchivedPayment
     
-    # Get all payments for this landlord's properties
-    all_payments = []
-    for prop in properties:
-        for unit in prop.units:
-            for lease in unit.leases:
-                payments = Payment.query.filter_by(lease_id=lease.id).all()
-                for payment in payments:
-                    all_payments.append({
-                        'payment': payment,
-                        'tenant': lease.tenant,
-                        'unit': unit,
-                        'property': prop
-                    })
-    
-    # Sort by creation date (newest first)
-    all_payments.sort(key=lambda x: x['payment'].created_at, reverse=True)
-    
-    return render_template('landlord/tenant_payments.html', payments_data=all_payments, today=datetime.now())
+    # Hot and archived payments are each read newest first and merged as they stream
+    sources = [
+        landlord_payment_query(current_user.id, payment_model, lease_model)
+        .order_by(payment_model.created_at.desc(), payment_model.id.desc())
+        .yield_per(app.config['STREAM_FLUSH_ROWS'])
+        for payment_model, lease_model in ((Payment, Lease), (ArchivedPayment, ArchivedLease))
+    ]
+    rows = heapq.merge(*sources, key=lambda row: row[0].created_at, reverse=True)
+    payments_data = stream_rows(
+        rows, lambda row: {'payment': row[0], 'tenant': row[1], 'unit': row[2], 'property': row[3]}
+    )
+    
+    stats = landlord_payment_summary(current_user.id, datetime.now(),
+                                     ((Payment, Lease), (ArchivedPayment, ArchivedLease)))
+    return stream_page('landlord/tenant_payments.html', payments_data=payments_data, stats=stats)
+
+def landlord_payment_query(landlord_id, payment_model=Payment, lease_model=Lease):
+    # A landlord's payments with their tenant, unit and property
+    return db.session.query(payment_model, User, Unit, Property)\
+        .join(lease_model, lease_model.id == payment_model.lease_id)\
+        .join(User, User.id == lease_model.tenant_id)\
+        .join(Unit, Unit.id == lease_model.unit_id)\
+        .join(Property, Property.id == Unit.property_id)\
+        .filter(Property.landlord_id == landlord_id)
+
+def landlord_payment_summary(landlord_id, today, models):
+    # Summary cards computed in SQL so the payment rows themselves can stream
+    stats = {'approved': 0, 'pending': 0, 'this_month': 0}
+    tenant_ids = []
+    for payment_model, lease_model in models:
+        query = landlord_payment_query(landlord_id, payment_model, lease_model)
+        approved, pending, this_month = query.with_entities(
+            func.sum(case((payment_model.status == 'approved', payment_model.amount), else_=0)),
+            func.sum(case((payment_model.status == 'pending', payment_model.amount), else_=0)),
+            func.sum(case((and_(payment_model.status == 'approved',
+                                extract('month', payment_model.payment_date) == today.month),
+                           payment_model.amount), else_=0))
+        ).one()
+        stats['approved'] += approved or 0
+        stats['pending'] += pending or 0
+        stats['this_month'] += this_month or 0
+        tenant_ids.append(query.with_entities(lease_model.tenant_id).statement)
+    stats['tenants'] = db.session.query(func.count()).select_from(union(*tenant_ids).subquery()).scalar()
+    return stats
 
 # Landlord Tenant Management Routes
 @app.route('/landlord/add-tenant', methods=['GET', 'POST'])
@@ -395,15 +723,17 @@ def landlord_add_tenant():
         
         try:
             db.session.add(tenant)
+            db.session.flush()
+            route_tenant(tenant.id, current_user.id)
             db.session.commit()
             return jsonify({'success': True, 'message': 'Tenant registered successfully', 'tenant_id': tenant.id})
         except Exception as e:
             return jsonify({'error': str(e)}), 400
     
     # GET request - show form
-    properties = Property.query.filter_by(landlord_id=current_user.id).all()
-    vacant_units = Unit.query.filter(Unit.property_id.in_([p.id for p in properties]), Unit.status == 'vacant').all()
-    return render_template('landlord/add_tenant.html', properties=properties, vacant_units=vacant_units)
+    # Vacant units are searched as the landlord types (search_vacant_units)
+    properties = Property.query.filter_by(landlord_id=current_user.id).order_by(Property.name).all()
+    return render_template('landlord/add_tenant.html', properties=properties)
 
 @app.route('/landlord/assign-unit', methods=['POST'])
 @login_required
@@ -426,34 +756,33 @@ def landlord_assign_unit():
     if unit.property_id not in property_ids:
         return jsonify({'error': 'Unauthorized - Unit does not belong to you'}), 403
     
+    # A fast path only: the UPDATE that claims the unit checks again
     if unit.status != 'vacant':
         return jsonify({'error': 'Unit is not vacant'}), 400
     
     # Use custom rent amount if provided, otherwise use unit's default rent
     monthly_rent = data.get('monthly_rent', unit.rent_amount)
     
-    # Create lease
-    lease = Lease(
-        tenant_id=tenant.id,
-        unit_id=unit.id,
-        start_date=datetime.strptime(data.get('start_date'), '%Y-%m-%d').date(),
-        end_date=datetime.strptime(data.get('end_date'), '%Y-%m-%d').date(),
-        monthly_rent=monthly_rent,  # Use custom rent amount
-        security_deposit=data.get('security_deposit', 0),
-        status='active'
-    )
-    
-    # Update unit status
-    unit.status = 'occupied'
-    
-    # Update property occupancy
-    unit.property.occupied_units += 1
+    from leases import start_lease
     
     try:
-        db.session.add(lease)
+        # The vacancy check happens in the UPDATE that claims the unit, so
+        # of two concurrent assignments only one can succeed
+        lease = start_lease(
+            tenant.id, unit,
+            start_date=datetime.strptime(data.get('start_date'), '%Y-%m-%d').date(),
+            end_date=datetime.strptime(data.get('end_date'), '%Y-%m-%d').date(),
+            monthly_rent=monthly_rent,
+            security_deposit=data.get('security_deposit', 0)
+        )
+        if lease is None:
+            db.session.rollback()
+            return jsonify({'error': 'Unit is not vacant'}), 400
+        route_tenant(tenant.id, current_user.id)
         db.session.commit()
         return jsonify({'success': True, 'message': 'Unit assigned successfully'})
     except Exception as e:
+        db.session.rollback()
         return jsonify({'error': str(e)}), 400
 
 @app.route('/landlord/remove-tenant/<int:tenant_id>', methods=['POST'])
@@ -475,24 +804,18 @@ def landlord_remove_tenant(tenant_id):
     if lease.unit.property_id not in property_ids:
         return jsonify({'error': 'Unauthorized - Tenant does not belong to your property'}), 403
     
-    # End the lease
-    lease.status = 'ended'
-    lease.end_date = datetime.now().date()
+    from leases import end_lease
     
-    # Free up the unit
-    lease.unit.status = 'vacant'
-    
-    # Update property occupancy
-    lease.unit.property.occupied_units -= 1
+    # End the lease and free up the unit; a concurrent removal ends it only once
+    lease_id, unit_number = lease.id, lease.unit.unit_number
+    if not end_lease(lease, datetime.now().date()):
+        db.session.rollback()
+        return jsonify({'error': 'No active lease found for this tenant'}), 404
     
     # Create notification for tenant
-    notification = Notification(
-        user_id=tenant_id,
-        title='Lease Ended',
-        message=f'Your lease for unit {lease.unit.unit_number} has been ended by the landlord.',
-        type='lease_ended'
-    )
-    db.session.add(notification)
+    notify(tenant_id, 'lease_ended', 'Lease Ended',
+           f'Your lease for unit {unit_number} has been ended by the landlord.',
+           ref=('lease', lease_id))
     
     db.session.commit()
     
@@ -521,12 +844,34 @@ def landlord_delete_tenant(tenant_id):
     
     # Delete tenant (only if they don't have active leases with this landlord)
     try:
-        # Delete related records
+        from occupancy import invalidate_occupancy
+        
+        # Their leases drop out of the occupancy history
+        for property_id, since in db.session.query(Unit.property_id, func.min(Lease.start_date))\
+                .join(Lease, Lease.unit_id == Unit.id).filter(Lease.tenant_id == tenant_id).group_by(Unit.property_id):
+            invalidate_occupancy([property_id], since)
+        
+        from attachments import Attachment
+        
+        # Delete related records; stored files are removed by `flask prune-attachments`
+        Attachment.query.filter(or_(
+            and_(Attachment.owner_type == 'maintenance_request',
+                 Attachment.owner_id.in_(db.session.query(MaintenanceRequest.id).filter_by(tenant_id=tenant_id))),
+            and_(Attachment.owner_type == 'message',
+                 Attachment.owner_id.in_(db.session.query(Message.id).filter(
+                     (Message.sender_id == tenant_id) | (Message.receiver_id == tenant_id))))
+        )).delete(synchronize_session=False)
         Payment.query.filter(Payment.lease.has(tenant_id=tenant_id)).delete(synchronize_session=False)
         MaintenanceRequest.query.filter_by(tenant_id=tenant_id).delete(synchronize_session=False)
         Lease.query.filter_by(tenant_id=tenant_id).delete(synchronize_session=False)
         Message.query.filter((Message.sender_id == tenant_id) | (Message.receiver_id == tenant_id)).delete(synchronize_session=False)
+        tenant_conversations = db.session.query(Conversation.id).filter(
+            (Conversation.user_low_id == tenant_id) | (Conversation.user_high_id == tenant_id))
+        ConversationMember.query.filter(ConversationMember.conversation_id.in_(tenant_conversations)).delete(synchronize_session=False)
+        Conversation.query.filter((Conversation.user_low_id == tenant_id) | (Conversation.user_high_id == tenant_id)).delete(synchronize_session=False)
         Notification.query.filter_by(user_id=tenant_id).delete(synchronize_session=False)
+        if app.config['SHARD_URLS']:
+            ShardAssignment.query.filter_by(user_id=tenant_id).delete(synchronize_session=False)
         
         # Delete tenant user
         db.session.delete(tenant)
@@ -559,21 +904,52 @@ def create_unit():
     if not property or property.landlord_id != current_user.id:
         return jsonify({'error': 'Unauthorized - Property does not belong to you'}), 403
     
-    unit = Unit(
-        unit_number=data.get('unit_number'),
-        unit_name=data.get('unit_name'),
-        rent_amount=data.get('rent_amount'),
-        bedrooms=data.get('bedrooms', 1),
-        bathrooms=data.get('bathrooms', 1),
-        property_id=data.get('property_id')
-    )
+    from units import create_units, clean_unit_rows, UnitBatchError
     
     try:
-        db.session.add(unit)
+        create_units(property, clean_unit_rows([data]))
         db.session.commit()
         return jsonify({'success': True, 'message': 'Unit created successfully'})
-    except Exception as e:
+    except UnitBatchError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+
+@app.route('/api/landlord/create-units', methods=['POST'])
+@login_required
+def bulk_create_units():
+    if current_user.role != 'landlord':
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    from units import create_units, expand_pattern, clean_unit_rows, read_unit_file, UnitBatchError
+    
+    # JSON with a pattern or a units list, or a form with a CSV file
+    upload = request.files.get('file')
+    data = {} if upload is not None else (request.get_json(silent=True) or {})
+    try:
+        property_id = int(request.form.get('property_id') if upload is not None else data.get('property_id'))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'property_id must be a number'}), 400
+    property = db.session.get(Property, property_id)
+    if not property or property.landlord_id != current_user.id:
+        return jsonify({'error': 'Unauthorized - Property does not belong to you'}), 403
+    
+    try:
+        if upload is not None:
+            rows = read_unit_file(upload.stream)
+        elif isinstance(data.get('pattern'), dict):
+            rows = expand_pattern(data['pattern'])
+        elif isinstance(data.get('units'), list):
+            rows = clean_unit_rows(data['units'])
+        else:
+            return jsonify({'error': 'Either a pattern, a units list or a file is required'}), 400
+        created = create_units(property, rows)
+        db.session.commit()
+    except UnitBatchError as e:
+        db.session.rollback()
         return jsonify({'error': str(e)}), 400
+    
+    return jsonify({'success': True, 'message': f'{created} units created', 'count': created,
+                    'total_units': property.total_units})
 
 @app.route('/api/payment/approve/<int:payment_id>', methods=['POST'])
 @login_required
@@ -591,14 +967,11 @@ def approve_payment(payment_id):
     payment.receipt_generated = True
     
     # Create notification for tenant
-    notification = Notification(
-        user_id=payment.lease.tenant_id,
-        title='Payment Approved',
-        message=f'Your payment of KES {payment.amount:,.2f} has been approved. Receipt has been generated.',
-        type='payment_approved'
-    )
-    db.session.add(notification)
+    notify(payment.lease.tenant_id, 'payment_approved', 'Payment Approved',
+           f'Your payment of KES {payment.amount:,.2f} has been approved. Receipt has been generated.',
+           ref=('payment', payment.id))
     db.session.commit()
+    record_event('payment_approved')
     
     return jsonify({'success': True, 'message': 'Payment approved successfully'})
 
@@ -617,14 +990,11 @@ def reject_payment(payment_id):
     payment.status = 'rejected'
     
     # Create notification for tenant
-    notification = Notification(
-        user_id=payment.lease.tenant_id,
-        title='Payment Rejected',
-        message=f'Your payment of KES {payment.amount:,.2f} was rejected. Please contact your landlord.',
-        type='payment_rejected'
-    )
-    db.session.add(notification)
+    notify(payment.lease.tenant_id, 'payment_rejected', 'Payment Rejected',
+           f'Your payment of KES {payment.amount:,.2f} was rejected. Please contact your landlord.',
+           ref=('payment', payment.id))
     db.session.commit()
+    record_event('payment_rejected')
     
     return jsonify({'success': True, 'message': 'Payment rejected'})
 
@@ -723,17 +1093,15 @@ def submit_payment():
     )
     
     db.session.add(payment)
+    db.session.flush()  # assign the id referenced by the notification
     
     # Create notification for landlord
-    notification = Notification(
-        user_id=lease.unit.property.landlord_id,
-        title='New Payment Submitted',
-        message=f'Tenant {current_user.username} submitted a payment of KES {payment.amount:,.2f}. Transaction: {data.get("transaction_code")}',
-        type='payment_submitted'
-    )
-    db.session.add(notification)
+    notify(lease.unit.property.landlord_id, 'payment_submitted', 'New Payment Submitted',
+           f'Tenant {current_user.username} submitted a payment of KES {payment.amount:,.2f}. Transaction: {data.get("transaction_code")}',
+           ref=('payment', payment.id))
     
     db.session.commit()
+    record_event('payment_submitted')
     
     return jsonify({'success': True, 'message': 'Payment submitted successfully'})
 
@@ -763,15 +1131,12 @@ def edit_payment(payment_id):
     payment.transaction_code = data.get('transaction_code', payment.transaction_code)
     
     # Create notification for landlord
-    notification = Notification(
-        user_id=payment.lease.unit.property.landlord_id,
-        title='Payment Updated',
-        message=f'Tenant {current_user.username} updated payment amount to KES {new_amount:,.2f}',
-        type='payment_updated'
-    )
-    db.session.add(notification)
+    notify(payment.lease.unit.property.landlord_id, 'payment_updated', 'Payment Updated',
+           f'Tenant {current_user.username} updated payment amount to KES {new_amount:,.2f}',
+           ref=('payment', payment.id))
     
     db.session.commit()
+    record_event('payment_updated')
     
     return jsonify({'success': True, 'message': 'Payment updated successfully'})
 
@@ -808,19 +1173,18 @@ def submit_maintenance():
     )
     
     db.session.add(maintenance)
+    db.session.flush()  # assign the id referenced by the notification
     
     # Create notification for landlord
-    notification = Notification(
-        user_id=lease.unit.property.landlord_id,
-        title='New Maintenance Request',
-        message=f'Tenant {current_user.full_name or current_user.username} submitted a maintenance request: {data.get("title")}',
-        type='maintenance_request'
-    )
-    db.session.add(notification)
+    notify(lease.unit.property.landlord_id, 'maintenance_request', 'New Maintenance Request',
+           f'Tenant {current_user.full_name or current_user.username} submitted a maintenance request: {data.get("title")}',
+           ref=('maintenance_request', maintenance.id))
     
+    maintenance_id = maintenance.id
     db.session.commit()
+    record_event('maintenance_submitted')
     
-    return jsonify({'success': True, 'message': 'Maintenance request submitted successfully'})
+    return jsonify({'success': True, 'message': 'Maintenance request submitted successfully', 'id': maintenance_id})
 
 # API Routes for Charts and Data
 @app.route('/api/landlord/payment-stats')
@@ -866,6 +1230,150 @@ def landlord_occupancy_stats():
     
     return jsonify(data)
 
+@app.route('/api/landlord/occupancy-history')
+@login_required
+def landlord_occupancy_history():
+    if current_user.role != 'landlord':
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    from occupancy import occupancy_history, next_month
+    
+    granularity = request.args.get('granularity', 'month')
+    if granularity not in ('day', 'month'):
+        return jsonify({'error': 'granularity must be day or month'}), 400
+    
+    # start and end take YYYY-MM-DD, or YYYY-MM for whole months; the default is the last 12 months
+    def parse_day(value, last=False):
+        try:
+            if len(value) == 7:
+                day = datetime.strptime(value, '%Y-%m').date()
+                return next_month(day) - timedelta(days=1) if last else day
+            return datetime.strptime(value, '%Y-%m-%d').date()
+        except ValueError:
+            return None
+    
+    today = datetime.now().date()
+    end = parse_day(request.args.get('end') or today.isoformat(), last=True)
+    start = parse_day(request.args.get('start') or (today - timedelta(days=365)).isoformat())
+    if start is None or end is None or start > end:
+        return jsonify({'error': 'Invalid date range'}), 400
+    if granularity == 'month':
+        start, end = start.replace(day=1), next_month(end) - timedelta(days=1)
+    # History stops at today; the current month is partial
+    end = min(end, today)
+    if start > end:
+        return jsonify({'error': 'Invalid date range'}), 400
+    if (end - start).days > 366 * 10:
+        return jsonify({'error': 'Date range is limited to 10 years'}), 400
+    
+    query = Property.query.filter_by(landlord_id=current_user.id)
+    property_ids = request.args.getlist('property_id', type=int)
+    if property_ids:
+        query = query.filter(Property.id.in_(property_ids))
+    properties = query.order_by(Property.name).all()
+    
+    return jsonify(occupancy_history(properties, start, end, granularity,
+                                     include_units=request.args.get('units') == '1', today=today))
+
+@app.route('/api/landlord/lease-expirations')
+@login_required
+def landlord_lease_expirations():
+    if current_user.role != 'landlord':
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    from leases import expiring_leases_query, expiry_summary
+    
+    # Leases ending within the next days (30, 60, 90, ...); overdue active leases are always included
+    days = request.args.get('days', 90, type=int)
+    if not 0 < days <= 365:
+        return jsonify({'error': 'days must be between 1 and 365'}), 400
+    
+    today = datetime.now().date()
+    property_ids = request.args.getlist('property_id', type=int)
+    page = paginate(expiring_leases_query(current_user.id, today, days, property_ids),
+                    {'end_date': Lease.end_date, 'rent': Lease.monthly_rent}, Lease.id,
+                    default_sort='end_date', default_per_page=50, max_per_page=200, count=False)
+    
+    return jsonify({
+        'as_of': today.isoformat(),
+        'days': days,
+        'summary': expiry_summary(current_user.id, today, property_ids),
+        'leases': [{
+            'id': lease.id,
+            'tenant_id': tenant.id,
+            'tenant_name': tenant.full_name or tenant.username,
+            'tenant_email': tenant.email,
+            'unit_id': lease.unit_id,
+            'unit_number': unit_number,
+            'property_id': property_id,
+            'property_name': property_name,
+            'start_date': lease.start_date.isoformat(),
+            'end_date': lease.end_date.isoformat(),
+            'days_left': (lease.end_date - today).days,
+            'monthly_rent': lease.monthly_rent
+        } for lease, tenant, unit_number, property_id, property_name in page.items],
+        'next_cursor': page.next_cursor
+    })
+
+@app.route('/api/landlord/renew-leases', methods=['POST'])
+@login_required
+def landlord_renew_leases():
+    if current_user.role != 'landlord':
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    from leases import renew_leases, MAX_RENEWALS
+    
+    data = request.get_json() or {}
+    lease_ids = data.get('lease_ids')
+    if not isinstance(lease_ids, list) or not lease_ids or not all(isinstance(i, int) for i in lease_ids):
+        return jsonify({'error': 'lease_ids must be a list of lease ids'}), 400
+    if len(lease_ids) > MAX_RENEWALS:
+        return jsonify({'error': f'At most {MAX_RENEWALS} leases can be renewed at once'}), 400
+    
+    # The new term: an end date for every lease, or a number of months added to each lease's own end date
+    end_date = months = None
+    try:
+        if data.get('end_date'):
+            end_date = datetime.strptime(data['end_date'], '%Y-%m-%d').date()
+        elif data.get('months') is not None:
+            months = int(data['months'])
+            if not 0 < months <= 120:
+                raise ValueError
+        else:
+            return jsonify({'error': 'Either end_date or months is required'}), 400
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid end_date or months'}), 400
+    
+    # Optional rent change: a new monthly rent, or a percentage applied to each lease's current rent
+    monthly_rent = rent_change_percent = None
+    try:
+        if data.get('monthly_rent') is not None:
+            monthly_rent = float(data['monthly_rent'])
+            if monthly_rent <= 0:
+                raise ValueError
+        elif data.get('rent_change_percent') is not None:
+            rent_change_percent = float(data['rent_change_percent'])
+            if rent_change_percent <= -100:
+                raise ValueError
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid monthly_rent or rent_change_percent'}), 400
+    
+    try:
+        renewed, error = renew_leases(current_user.id, lease_ids, end_date=end_date, months=months,
+                                      monthly_rent=monthly_rent, rent_change_percent=rent_change_percent)
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    if error:
+        return jsonify({'error': error}), 400
+    
+    return jsonify({
+        'success': True,
+        'renewed': len(renewed),
+        'leases': [{'id': change['id'], 'end_date': change['end_date'].isoformat(),
+                    'monthly_rent': change['monthly_rent']} for change in renewed]
+    })
+
 @app.route('/api/tenant/payment-history')
 @login_required
 def tenant_payment_history():
@@ -891,6 +1399,88 @@ def tenant_payment_history():
     
     return jsonify(data)
 
+SUMMARY_MAX_ITEMS = 20
+
+@app.route('/api/tenant/summary')
+@login_required
+def tenant_summary():
+    # Everything the tenant home screen draws, in one response and four indexed queries
+    if current_user.role != 'tenant':
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    from leases import add_months
+    
+    payment_limit = max(0, min(request.args.get('payments', 5, type=int), SUMMARY_MAX_ITEMS))
+    notification_limit = max(0, min(request.args.get('notifications', 5, type=int), SUMMARY_MAX_ITEMS))
+    today = datetime.now().date()
+    
+    # Lease, unit and property, plus the last due date paid for (ix_lease_tenant_status, ix_payment_lease_status_due)
+    paid_through = db.session.query(func.max(Payment.due_date))\
+        .filter(Payment.lease_id == Lease.id, Payment.status.in_(['approved', 'pending']))\
+        .correlate(Lease).scalar_subquery()
+    row = db.session.query(
+        Lease.id, Lease.start_date, Lease.end_date, Lease.monthly_rent, Lease.security_deposit,
+        Unit.id, Unit.unit_number, Unit.unit_name, Unit.bedrooms, Unit.bathrooms,
+        Property.id, Property.name, Property.address, paid_through
+    ).join(Unit, Unit.id == Lease.unit_id).join(Property, Property.id == Unit.property_id)\
+        .filter(Lease.tenant_id == current_user.id, Lease.status == 'active')\
+        .order_by(Lease.start_date.desc()).first()
+    
+    # Unread notifications (ix_notification_user_unread_updated) and messages (ix_conversation_member_inbox)
+    unread_notifications, unread_messages = db.session.query(
+        db.session.query(func.count()).select_from(Notification)
+        .filter(Notification.user_id == current_user.id, Notification.is_read == False).scalar_subquery(),
+        db.session.query(func.coalesce(func.sum(ConversationMember.unread_count), 0))
+        .filter(ConversationMember.user_id == current_user.id).scalar_subquery()
+    ).one()
+    notifications = Notification.query.filter_by(user_id=current_user.id)\
+        .order_by(Notification.updated_at.desc(), Notification.id.desc()).limit(notification_limit).all() \
+        if notification_limit else []
+    
+    summary = {
+        'lease': None,
+        'payments': [],
+        'next_due': None,
+        'unread': {'notifications': unread_notifications, 'messages': unread_messages},
+        'notifications': [serialize_notification(notification) for notification in notifications]
+    }
+    if row:
+        (lease_id, start_date, end_date, monthly_rent, security_deposit, unit_id, unit_number, unit_name,
+         bedrooms, bathrooms, property_id, property_name, address, paid_due) = row
+        summary['lease'] = {
+            'id': lease_id,
+            'start_date': start_date.isoformat(),
+            'end_date': end_date.isoformat(),
+            'monthly_rent': monthly_rent,
+            'security_deposit': security_deposit,
+            'unit': {'id': unit_id, 'unit_number': unit_number, 'unit_name': unit_name,
+                     'bedrooms': bedrooms, 'bathrooms': bathrooms},
+            'property': {'id': property_id, 'name': property_name, 'address': address}
+        }
+        if payment_limit:
+            payments = db.session.query(Payment.id, Payment.amount, Payment.payment_date, Payment.due_date,
+                                        Payment.status, Payment.payment_method)\
+                .filter(Payment.lease_id == lease_id)\
+                .order_by(Payment.created_at.desc(), Payment.id.desc()).limit(payment_limit).all()
+            summary['payments'] = [{
+                'id': payment_id,
+                'amount': amount,
+                'payment_date': payment_date.isoformat(),
+                'due_date': due_date.isoformat(),
+                'status': status,
+                'payment_method': payment_method
+            } for payment_id, amount, payment_date, due_date, status, payment_method in payments]
+        # Rent falls due monthly from the lease start; the month after the last one paid (or awaiting approval) is next
+        next_due = add_months(paid_due, 1) if paid_due else start_date
+        if next_due <= end_date:
+            summary['next_due'] = {'date': next_due.isoformat(), 'amount': monthly_rent, 'overdue': next_due < today}
+    
+    # Unchanged summaries cost a 304 and no body on the next refresh
+    response = jsonify(summary)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.add_etag()
+    return response.make_conditional(request)
+
 # Maintenance API Routes
 @app.route('/api/maintenance/update-status/<int:request_id>', methods=['POST'])
 @login_required
@@ -909,23 +1499,58 @@ def update_maintenance_status(request_id):
     maintenance.updated_at = datetime.utcnow()
     
     # Create notification for tenant
-    notification = Notification(
-        user_id=maintenance.tenant_id,
-        title='Maintenance Status Updated',
-        message=f'Your maintenance request "{maintenance.title}" has been marked as {data.get("status").replace("_", " ")}.',
-        type='maintenance_update'
-    )
-    db.session.add(notification)
+    notify(maintenance.tenant_id, 'maintenance_update', 'Maintenance Status Updated',
+           f'Your maintenance request "{maintenance.title}" has been marked as {data.get("status").replace("_", " ")}.',
+           ref=('maintenance_request', maintenance.id))
     
     db.session.commit()
+    record_event('maintenance_status_updated')
     
     return jsonify({'success': True, 'message': 'Maintenance status updated'})
 
+# Search API Routes
+@app.route('/api/search/maintenance')
+@login_required
+def search_maintenance_requests():
+    if current_user.role != 'landlord':
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    from search import search_maintenance
+    
+    results = search_maintenance(
+        current_user.id,
+        request.args.get('q', ''),
+        property_id=request.args.get('property_id', type=int),
+        limit=request.args.get('limit', type=int)
+    )
+    
+    return jsonify(results)
+
+@app.route('/api/search/messages')
+@login_required
+def search_user_messages():
+    from search import search_messages
+    
+    results = search_messages(
+        current_user.id,
+        request.args.get('q', ''),
+        limit=request.args.get('limit', type=int)
+    )
+    
+    return jsonify(results)
+
 # API to get vacant units for a property
 @app.route('/api/property/<int:property_id>/vacant-units')
 @login_required
 def get_vacant_units(property_id):
-    vacant_units = Unit.query.filter_by(property_id=property_id, status='vacant').all()
+    if current_user.role not in ('admin', 'landlord'):
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    property = Property.query.get(property_id)
+    if not property or (current_user.role == 'landlord' and property.landlord_id != current_user.id):
+        return jsonify({'error': 'Property not found'}), 404
+    
+    vacant_units = Unit.query.filter_by(property_id=property_id, status='vacant').order_by(Unit.unit_number).all()
     
     units_data = []
     for unit in vacant_units:
@@ -940,6 +1565,114 @@ def get_vacant_units(property_id):
     
     return jsonify(units_data)
 
+VACANCY_SORT_COLUMNS = {
+    'rent': Unit.rent_amount,
+    'unit_number': Unit.unit_number,
+    'bedrooms': func.coalesce(Unit.bedrooms, 0),
+    'square_feet': func.coalesce(Unit.square_feet, 0)
+}
+
+# API to search vacant units across the properties the user manages
+@app.route('/api/units/vacant')
+@login_required
+def search_vacant_units():
+    if current_user.role not in ('admin', 'landlord'):
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    # Served by ix_unit_status_property_rent: status and property first, then the rent range
+    query = db.session.query(Unit, Property.name).join(Property, Property.id == Unit.property_id)\
+        .filter(Unit.status == 'vacant')
+    if current_user.role == 'landlord':
+        query = query.filter(Property.landlord_id == current_user.id)
+    
+    property_ids = request.args.getlist('property_id', type=int)
+    if property_ids:
+        query = query.filter(Unit.property_id.in_(property_ids))
+    
+    q = request.args.get('q', '').strip()
+    if q:
+        # Prefix match as the user types a unit number or name
+        query = query.filter(or_(Unit.unit_number.istartswith(q, autoescape=True),
+                                 Unit.unit_name.istartswith(q, autoescape=True)))
+    
+    filters = {
+        'bedrooms': lambda value: Unit.bedrooms == value,
+        'bathrooms': lambda value: Unit.bathrooms == value,
+        'min_bedrooms': lambda value: Unit.bedrooms >= value,
+        'min_rent': lambda value: Unit.rent_amount >= value,
+        'max_rent': lambda value: Unit.rent_amount <= value,
+        'min_square_feet': lambda value: Unit.square_feet >= value,
+        'max_square_feet': lambda value: Unit.square_feet <= value
+    }
+    for name, condition in filters.items():
+        value = request.args.get(name, type=float)
+        if value is not None:
+            query = query.filter(condition(value))
+    
+    page = paginate(query, VACANCY_SORT_COLUMNS, Unit.id, default_sort='rent', default_per_page=20, count=False)
+    
+    return jsonify({
+        'units': [{
+            'id': unit.id,
+            'unit_number': unit.unit_number,
+            'unit_name': unit.unit_name,
+            'property_id': unit.property_id,
+            'property_name': property_name,
+            'rent_amount': unit.rent_amount,
+            'bedrooms': unit.bedrooms,
+            'bathrooms': unit.bathrooms,
+            'square_feet': unit.square_feet
+        } for unit, property_name in page.items],
+        'next_cursor': page.next_cursor
+    })
+
+def unit_grid_query(property_id):
+    # Each unit with its current active lease and tenant in one query
+    active_leases = db.session.query(Lease.unit_id, func.max(Lease.id).label('lease_id')) \
+        .join(Unit).filter(Unit.property_id == property_id, Lease.status == 'active') \
+        .group_by(Lease.unit_id).subquery()
+    return db.session.query(Unit, Lease, User) \
+        .filter(Unit.property_id == property_id) \
+        .outerjoin(active_leases, active_leases.c.unit_id == Unit.id) \
+        .outerjoin(Lease, Lease.id == active_leases.c.lease_id) \
+        .outerjoin(User, User.id == Lease.tenant_id)
+
+def serialize_unit_row(unit, lease, tenant):
+    return {
+        'id': unit.id,
+        'unit_number': unit.unit_number,
+        'unit_name': unit.unit_name,
+        'rent_amount': unit.rent_amount,
+        'bedrooms': unit.bedrooms,
+        'bathrooms': unit.bathrooms,
+        'status': unit.status,
+        'lease_id': lease.id if lease else None,
+        'tenant_id': tenant.id if tenant else None,
+        'tenant_name': (tenant.full_name or tenant.username) if tenant else None,
+        'tenant_email': tenant.email if tenant else None,
+        'tenant_phone': tenant.phone if tenant else None,
+        'lease_end': lease.end_date.strftime('%Y-%m-%d') if lease else None
+    }
+
+# API for one page of a property's unit grid
+@app.route('/api/property/<int:property_id>/units')
+@login_required
+def api_property_units(property_id):
+    if current_user.role != 'landlord':
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    property = Property.query.filter_by(id=property_id, landlord_id=current_user.id).first()
+    if not property:
+        return jsonify({'error': 'Property not found'}), 404
+    
+    page = paginate(unit_grid_query(property_id), {'unit_number': Unit.unit_number}, Unit.id,
+                    default_sort='unit_number', default_per_page=50, max_per_page=200, count=False)
+    
+    return jsonify({
+        'units': [serialize_unit_row(*row) for row in page.items],
+        'next_cursor': page.next_cursor
+    })
+
 # API to create sample units for a property
 @app.route('/api/property/<int:property_id>/create-sample-units', methods=['POST'])
 @login_required
@@ -948,6 +1681,10 @@ def create_sample_units(property_id):
         return jsonify({'error': 'Unauthorized'}), 403
     
     property = Property.query.get_or_404(property_id)
+    if current_user.role == 'landlord' and property.landlord_id != current_user.id:
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    from units import create_units, UnitBatchError
     
     # Create sample units
     units_data = [
@@ -959,40 +1696,69 @@ def create_sample_units(property_id):
         {'unit_number': 'B102', 'unit_name': 'Cozy Studio', 'rent_amount': 24000, 'bedrooms': 1, 'bathrooms': 1},
     ]
     
-    for unit_data in units_data:
-        unit = Unit(
-            unit_number=unit_data['unit_number'],
-            unit_name=unit_data['unit_name'],
-            rent_amount=unit_data['rent_amount'],
-            bedrooms=unit_data['bedrooms'],
-            bathrooms=unit_data['bathrooms'],
-            property_id=property_id
-        )
-        db.session.add(unit)
-    
-    db.session.commit()
+    try:
+        create_units(property, [dict(unit_data, square_feet=None) for unit_data in units_data])
+        db.session.commit()
+    except UnitBatchError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
     
     return jsonify({'success': True, 'message': 'Sample units created successfully'})
 
 # Notification Routes
+def serialize_notification(notification):
+    return {
+        'id': notification.id,
+        'title': notification.title,
+        'message': notification.message,
+        'type': notification.type,
+        'count': notification.count,
+        'refs': notification.ref_list,
+        'created_at': notification.created_at.strftime('%Y-%m-%d %H:%M'),
+        'updated_at': notification.updated_at.strftime('%Y-%m-%d %H:%M'),
+        'is_read': notification.is_read
+    }
+
 @app.route('/api/notifications')
 @login_required
 def get_notifications():
-    notifications = Notification.query.filter_by(user_id=current_user.id, is_read=False).order_by(Notification.created_at.desc()).all()
-    
-    notifications_data = []
-    for notification in notifications:
-        notifications_data.append({
-            'id': notification.id,
-            'title': notification.title,
-            'message': notification.message,
-            'type': notification.type,
-            'created_at': notification.created_at.strftime('%Y-%m-%d %H:%M'),
-            'is_read': notification.is_read
-        })
+    notifications = Notification.query.filter_by(user_id=current_user.id, is_read=False).order_by(Notification.updated_at.desc()).all()
+    
+    notifications_data = [serialize_notification(notification) for notification in notifications]
     
     return jsonify(notifications_data)
 
+@app.route('/api/notifications/stream')
+@login_required
+def stream_notifications():
+    # Server-sent events; under the WSGI server each open stream holds a worker thread.
+    # The ASGI mode (asgi.py) serves this endpoint from a shared poller instead.
+    user_id = current_user.id
+    # Merged digests are new rows, so the stream follows the id
+    cursor = parse_stream_cursor(request.headers.get('Last-Event-ID') or request.args.get('cursor')) or 0
+    interval = app.config['NOTIFICATION_STREAM_INTERVAL']
+    
+    def generate():
+        nonlocal cursor
+        yield 'retry: 5000\n\n'
+        while True:
+            notifications = Notification.query.filter(
+                Notification.user_id == user_id,
+                Notification.is_read == False,
+                changed_since(cursor)
+            ).order_by(Notification.id).all()
+            for notification in notifications:
+                cursor = notification.id
+                yield f'id: {stream_cursor(notification)}\ndata: {json.dumps(serialize_notification(notification))}\n\n'
+            if not notifications:
+                yield ': keep-alive\n\n'
+            # Release the connection between polls
+            db.session.close()
+            time.sleep(interval)
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @app.route('/api/notifications/mark-read/<int:notification_id>', methods=['POST'])
 @login_required
 def mark_notification_read(notification_id):
@@ -1010,15 +1776,27 @@ def mark_notification_read(notification_id):
 @app.route('/api/messages')
 @login_required
 def get_messages():
+    from archive import ArchivedMessage
+    
     # Get messages where current user is either sender or receiver
     sent_messages = Message.query.filter_by(sender_id=current_user.id).order_by(Message.created_at.desc()).all()
     received_messages = Message.query.filter_by(receiver_id=current_user.id).order_by(Message.created_at.desc()).all()
     
     messages = sent_messages + received_messages
+    if len(messages) < 10:
+        # Older conversations may have been archived
+        messages += ArchivedMessage.query.filter(
+            (ArchivedMessage.sender_id == current_user.id) | (ArchivedMessage.receiver_id == current_user.id)
+        ).order_by(ArchivedMessage.created_at.desc()).limit(10 - len(messages)).all()
     messages.sort(key=lambda x: x.created_at, reverse=True)
     
+    from attachments import attachments_for
+    
+    messages = messages[:10]  # Last 10 messages
+    attachments = attachments_for('message', [message.id for message in messages])
+    
     messages_data = []
-    for message in messages[:10]:  # Last 10 messages
+    for message in messages:
         messages_data.append({
             'id': message.id,
             'subject': message.subject,
@@ -1027,7 +1805,8 @@ def get_messages():
             'receiver': message.receiver.username,
             'is_read': message.is_read,
             'created_at': message.created_at.strftime('%Y-%m-%d %H:%M'),
-            'direction': 'sent' if message.sender_id == current_user.id else 'received'
+            'direction': 'sent' if message.sender_id == current_user.id else 'received',
+            'attachments': attachments.get(message.id, [])
         })
     
     return jsonify(messages_data)
@@ -1037,28 +1816,218 @@ def get_messages():
 def send_message():
     data = request.get_json()
     
+    receiver = User.query.get(data.get('receiver_id'))
+    if not receiver or receiver.id == current_user.id:
+        return jsonify({'error': 'Receiver not found'}), 404
+    if not data.get('message'):
+        return jsonify({'error': 'Message is required'}), 400
+    
+    now = datetime.utcnow()
+    conversation = conversation_between(current_user.id, receiver.id, now)
+    
     message = Message(
         sender_id=current_user.id,
-        receiver_id=data.get('receiver_id'),
+        receiver_id=receiver.id,
         subject=data.get('subject'),
         message=data.get('message'),
-        is_read=False
+        is_read=False,
+        created_at=now,
+        conversation_id=conversation.id
     )
     
     db.session.add(message)
+    db.session.flush()  # assign the id referenced by the notification
+    record_message(conversation.id, message)
     
     # Create notification for receiver
-    notification = Notification(
-        user_id=data.get('receiver_id'),
-        title='New Message',
-        message=f'You have a new message from {current_user.username}',
-        type='new_message'
-    )
-    db.session.add(notification)
+    notify(data.get('receiver_id'), 'new_message', 'New Message',
+           f'You have a new message from {current_user.username}',
+           ref=('message', message.id))
+    
+    message_id, conversation_id = message.id, conversation.id
+    db.session.commit()
+    
+    return jsonify({'success': True, 'message': 'Message sent successfully', 'id': message_id,
+                    'conversation_id': conversation_id})
+
+# Conversations
+@app.route('/api/conversations')
+@login_required
+def get_conversations():
+    # Served by ix_conversation_member_inbox: the user's member rows by latest activity
+    other = aliased(User)
+    other_id = case((Conversation.user_low_id == current_user.id, Conversation.user_high_id), else_=Conversation.user_low_id)
+    query = db.session.query(ConversationMember.unread_count, Conversation, other)\
+        .join(Conversation, Conversation.id == ConversationMember.conversation_id)\
+        .join(other, other.id == other_id)\
+        .filter(ConversationMember.user_id == current_user.id)
+    page = paginate(query, {'recent': ConversationMember.last_message_at}, ConversationMember.conversation_id,
+                    default_sort='recent', default_direction='desc', default_per_page=20, count=False)
+    
+    unread_total = db.session.query(func.coalesce(func.sum(ConversationMember.unread_count), 0))\
+        .filter(ConversationMember.user_id == current_user.id).scalar()
+    
+    return jsonify({
+        'conversations': [{
+            'id': conversation.id,
+            'with': {'id': user.id, 'username': user.username, 'full_name': user.full_name, 'role': user.role},
+            'unread_count': unread_count,
+            'last_message': {
+                'id': conversation.last_message_id,
+                'subject': conversation.last_subject,
+                'preview': conversation.last_preview,
+                'direction': 'sent' if conversation.last_sender_id == current_user.id else 'received',
+                'created_at': conversation.last_message_at.strftime('%Y-%m-%d %H:%M')
+            } if conversation.last_message_id else None
+        } for unread_count, conversation, user in page.items],
+        'unread_total': unread_total,
+        'next_cursor': page.next_cursor
+    })
+
+@app.route('/api/conversations/<int:conversation_id>/messages')
+@login_required
+def get_conversation_messages(conversation_id):
+    member = ConversationMember.query.get((conversation_id, current_user.id))
+    if not member:
+        return jsonify({'error': 'Conversation not found'}), 404
+    
+    # Newest first; `after` pages back through older messages. Archived messages are not included.
+    query = Message.query.filter(Message.conversation_id == conversation_id)
+    page = paginate(query, {'sent': Message.created_at}, Message.id, default_sort='sent', default_direction='desc',
+                    default_per_page=50, max_per_page=200, count=False)
+    
+    from attachments import attachments_for
+    
+    attachments = attachments_for('message', [message.id for message in page.items])
     
+    return jsonify({
+        'messages': [{
+            'id': message.id,
+            'subject': message.subject,
+            'message': message.message,
+            'sender_id': message.sender_id,
+            'is_read': message.is_read,
+            'created_at': message.created_at.strftime('%Y-%m-%d %H:%M'),
+            'direction': 'sent' if message.sender_id == current_user.id else 'received',
+            'attachments': attachments.get(message.id, [])
+        } for message in page.items],
+        'unread_count': member.unread_count,
+        'next_cursor': page.next_cursor
+    })
+
+@app.route('/api/conversations/<int:conversation_id>/read', methods=['POST'])
+@login_required
+def mark_conversation_as_read(conversation_id):
+    member = ConversationMember.query.get((conversation_id, current_user.id))
+    if not member:
+        return jsonify({'error': 'Conversation not found'}), 404
+    
+    marked = mark_conversation_read(conversation_id, current_user.id)
     db.session.commit()
     
-    return jsonify({'success': True, 'message': 'Message sent successfully'})
+    return jsonify({'success': True, 'marked': marked})
+
+# Attachments
+def save_attachment(owner_type, owner_id):
+    # The body is the file itself (or a multipart form with a `file` field), read in chunks
+    from attachments import Attachment, AttachmentError, clean_filename, store_stream
+    
+    if request.content_length and request.content_length > app.config['ATTACHMENT_MAX_BYTES']:
+        return jsonify({'error': f"Attachments are limited to {app.config['ATTACHMENT_MAX_BYTES'] // (1024 * 1024)} MB"}), 413
+    
+    existing = Attachment.query.filter_by(owner_type=owner_type, owner_id=owner_id).count()
+    if existing >= app.config['ATTACHMENT_MAX_PER_ITEM']:
+        return jsonify({'error': f"At most {app.config['ATTACHMENT_MAX_PER_ITEM']} attachments are allowed"}), 400
+    
+    if request.mimetype == 'multipart/form-data':
+        upload = request.files.get('file')
+        if upload is None:
+            return jsonify({'error': 'No file uploaded'}), 400
+        stream, filename = upload.stream, upload.filename
+    else:
+        stream, filename = request.stream, request.args.get('filename')
+    
+    try:
+        sha256, size, content_type = store_stream(stream, app.config)
+    except AttachmentError as e:
+        return jsonify({'error': str(e)}), e.status
+    
+    attachment = Attachment(owner_type=owner_type, owner_id=owner_id, sha256=sha256, filename=clean_filename(filename),
+                            content_type=content_type, size=size, uploaded_by=current_user.id)
+    db.session.add(attachment)
+    db.session.commit()
+    
+    return jsonify({'success': True, 'attachment': {
+        'id': attachment.id,
+        'filename': attachment.filename,
+        'content_type': attachment.content_type,
+        'size': attachment.size,
+        'url': url_for('download_attachment', attachment_id=attachment.id)
+    }})
+
+@app.route('/api/maintenance/<int:request_id>/attachments', methods=['POST'])
+@login_required
+def upload_maintenance_attachment(request_id):
+    from attachments import owner_parties
+    
+    # The tenant who reported the issue or the landlord of the unit
+    parties = owner_parties('maintenance_request', request_id)
+    if parties is None:
+        return jsonify({'error': 'Maintenance request not found'}), 404
+    if current_user.id not in parties:
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    return save_attachment('maintenance_request', request_id)
+
+@app.route('/api/messages/<int:message_id>/attachments', methods=['POST'])
+@login_required
+def upload_message_attachment(message_id):
+    message = Message.query.get(message_id)
+    if not message:
+        return jsonify({'error': 'Message not found'}), 404
+    if message.sender_id != current_user.id:
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    return save_attachment('message', message_id)
+
+@app.route('/attachments/<int:attachment_id>')
+@login_required
+def download_attachment(attachment_id):
+    from attachments import Attachment, blob_path, owner_parties
+    
+    attachment = Attachment.query.get(attachment_id)
+    if not attachment:
+        return jsonify({'error': 'Attachment not found'}), 404
+    
+    parties = owner_parties(attachment.owner_type, attachment.owner_id) or set()
+    if current_user.role != 'admin' and current_user.id not in parties:
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    path = blob_path(app.config['ATTACHMENT_DIR'], attachment.sha256)
+    if not os.path.exists(path):
+        return jsonify({'error': 'Attachment not found'}), 404
+    
+    # Conditional and range requests are answered by send_file; with USE_X_SENDFILE the web server sends the body
+    response = send_file(path, mimetype=attachment.content_type, download_name=attachment.filename,
+                         as_attachment=not attachment.content_type.startswith('image/'),
+                         conditional=True, etag=attachment.sha256, max_age=365 * 24 * 3600)
+    # The content behind a sha256 never changes, but only logged-in parties may see it
+    response.cache_control.public = False
+    response.cache_control.private = True
+    response.cache_control.immutable = True
+    return response
+
+# Monitoring
+@app.route('/metrics')
+def metrics():
+    # Endpoint names and traffic are not public: scrapers send METRICS_TOKEN, people log in as admin
+    token = app.config.get('METRICS_TOKEN')
+    authorization = request.headers.get('Authorization', '').encode()
+    scraper = bool(token) and hmac.compare_digest(authorization, f'Bearer {token}'.encode())
+    admin = current_user.is_authenticated and current_user.role == 'admin'
+    if not (scraper or admin or app.debug):
+        return jsonify({'error': 'Unauthorized'}), 403
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
 
 # Error Handlers
 @app.errorhandler(404)
@@ -1077,4 +2046,5 @@ if __name__ == '__main__':
     print("Admin:    admin / admin123")
     print("Landlord: landlord1 / pass123")
     print("Tenant:   tenant1 / pass123")
+    print("\nThis is the development server; in production run: gunicorn -c gunicorn.conf.py")
     app.run(debug=True, host='0.0.0.0', port=5000)
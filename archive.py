@@ -0,0 +1,67 @@
+from sqlalchemy import and_, delete, exists, insert, literal, select
+from datetime import datetime, timedelta
+from models import db, User, Lease, Payment, Message, Notification, ArchivedLease, ArchivedPayment, ArchivedMessage, ArchivedNotification
+
+# Retention and archival of cold rows.
+# Rows past their retention period move from the hot tables into archived_*
+# tables with the same columns plus archived_at, in chunks of
+# ARCHIVE_CHUNK_SIZE rows per transaction. Archive tables have no foreign
+# keys or unique constraints, only the indexes the history views need.
+# Archived messages drop out of full-text search.
+
+
+def retention_policies(config, now):
+    """(label, hot model, archived model, condition) for each table, children before parents."""
+    lease_cutoff = (now - timedelta(days=config['ARCHIVE_LEASES_AFTER_DAYS'])).date()
+    # Leases with a pending payment stay hot until the landlord has reviewed it
+    cold_lease = and_(
+        Lease.status != 'active',
+        Lease.end_date < lease_cutoff,
+        ~exists().where(and_(Payment.lease_id == Lease.id, Payment.status == 'pending'))
+    )
+    return [
+        ('notifications', Notification, ArchivedNotification, and_(
+            Notification.is_read == True,
+            Notification.created_at < now - timedelta(days=config['ARCHIVE_NOTIFICATIONS_AFTER_DAYS']))),
+        ('messages', Message, ArchivedMessage, and_(
+            Message.is_read == True,
+            Message.created_at < now - timedelta(days=config['ARCHIVE_MESSAGES_AFTER_DAYS']))),
+        ('payments', Payment, ArchivedPayment, Payment.lease_id.in_(select(Lease.id).where(cold_lease))),
+        ('leases', Lease, ArchivedLease, cold_lease)
+    ]
+
+
+def _move_chunk(model, archived_model, ids, now):
+    source, target = model.__table__, archived_model.__table__
+    columns = [c.name for c in source.columns]
+    db.session.execute(insert(target).from_select(
+        columns + ['archived_at'],
+        select(*source.columns, literal(now, DateTime)).where(source.c.id.in_(ids))
+    ))
+    db.session.execute(delete(source).where(source.c.id.in_(ids)))
+
+
+def archive_cold_rows(config, now=None, dry_run=False):
+    """Move rows past retention into the archive tables; returns {label: rows moved}."""
+    now = now or datetime.utcnow()
+    chunk_size = config['ARCHIVE_CHUNK_SIZE']
+    moved = {}
+    for label, model, archived_model, condition in retention_policies(config, now):
+        if dry_run:
+            moved[label] = db.session.scalar(select(db.func.count()).select_from(model).where(condition))
+            continue
+
+        moved[label] = 0
+        last_id = 0
+        while True:
+            # Walk ids upwards so each chunk is a short, independent transaction
+            ids = db.session.scalars(
+                select(model.id).where(condition, model.id > last_id).order_by(model.id).limit(chunk_size)
+            ).all()
+            if not ids:
+                break
+            _move_chunk(model, archived_model, ids, now)
+            db.session.commit()
+            moved[label] += len(ids)
+            last_id = ids[-1]
+    return moved
@@ -0,0 +1,365 @@
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+from sqlalchemy import select, func, or_
+from sqlalchemy.orm import aliased
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from http.cookies import SimpleCookie
+from itsdangerous import BadSignature
+from urllib.parse import parse_qs
+from app import app as flask_app, serialize_notification
+from models import db, User, Property, Unit, Message, Notification
+from archive import ArchivedMessage
+from attachments import attachments_query, group_attachments
+from notifications import changed_since, parse_stream_cursor, stream_cursor
+import asyncio
+import json
+import re
+
+# ASGI serving mode: `uvicorn asgi:application`
+#
+# The read-heavy /api/* endpoints below run as coroutines on async SQLAlchemy
+# sessions, so an idle connection (e.g. a notification stream) costs a small
+# coroutine instead of a worker thread. Every other path, including all HTML
+# views and POST endpoints, is handed to the unchanged Flask app in a thread.
+
+ASYNC_DRIVERS = {
+    'sqlite': 'sqlite+aiosqlite',
+    'postgresql': 'postgresql+asyncpg',
+    'mysql': 'mysql+aiomysql'
+}
+
+KEEPALIVE_SECONDS = 15
+
+
+def async_database_url():
+    # Resolve the URL through Flask-SQLAlchemy so relative SQLite paths match the WSGI app
+    with flask_app.app_context():
+        url = db.engine.url
+    driver = ASYNC_DRIVERS.get(url.get_backend_name())
+    if driver is None:
+        raise RuntimeError(f'No async driver configured for {url.get_backend_name()}')
+    return url.set(drivername=driver)
+
+
+engine = create_async_engine(async_database_url())
+Session = async_sessionmaker(engine, expire_on_commit=False)
+
+
+class Request:
+    def __init__(self, scope, receive):
+        self.scope = scope
+        self.receive = receive
+        self.path = scope['path']
+        self.method = scope['method']
+        self.args = {key: values[-1] for key, values in parse_qs(scope.get('query_string', b'').decode()).items()}
+        self.headers = {key.decode().lower(): value.decode() for key, value in scope.get('headers', [])}
+
+
+async def send_json(send, data, status=200):
+    body = json.dumps(data).encode()
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def send_redirect(send, location):
+    await send({'type': 'http.response.start', 'status': 302, 'headers': [(b'location', location.encode())]})
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+def session_user_id(request):
+    # Read the Flask-Login user id out of Flask's signed session cookie
+    cookie = SimpleCookie(request.headers.get('cookie', ''))
+    morsel = cookie.get(flask_app.config['SESSION_COOKIE_NAME'])
+    if morsel is None:
+        return None
+
+    serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+    try:
+        data = serializer.loads(morsel.value, max_age=int(flask_app.permanent_session_lifetime.total_seconds()))
+    except BadSignature:
+        return None
+
+    user_id = data.get('_user_id')
+    return int(user_id) if user_id is not None else None
+
+
+async def load_current_user(request):
+    user_id = session_user_id(request)
+    if user_id is None:
+        return None
+    async with Session() as session:
+        row = (await session.execute(select(User.id, User.role).where(User.id == user_id))).first()
+    return row
+
+
+# Async API handlers; response bodies match the Flask views they replace
+
+async def api_notifications(request, send, user):
+    async with Session() as session:
+        result = await session.execute(
+            select(Notification)
+            .where(Notification.user_id == user.id, Notification.is_read == False)
+            .order_by(Notification.updated_at.desc())
+        )
+        notifications = result.scalars().all()
+    await send_json(send, [serialize_notification(n) for n in notifications])
+
+
+async def api_messages(request, send, user):
+    sender = aliased(User)
+    receiver = aliased(User)
+    async with Session() as session:
+        result = await session.execute(
+            select(Message, sender.username, receiver.username)
+            .join(sender, sender.id == Message.sender_id)
+            .join(receiver, receiver.id == Message.receiver_id)
+            .where(or_(Message.sender_id == user.id, Message.receiver_id == user.id))
+            .order_by(Message.created_at.desc())
+            .limit(10)
+        )
+        rows = result.all()
+        if len(rows) < 10:
+            # Older conversations may have been archived
+            result = await session.execute(
+                select(ArchivedMessage, sender.username, receiver.username)
+                .join(sender, sender.id == ArchivedMessage.sender_id)
+                .join(receiver, receiver.id == ArchivedMessage.receiver_id)
+                .where(or_(ArchivedMessage.sender_id == user.id, ArchivedMessage.receiver_id == user.id))
+                .order_by(ArchivedMessage.created_at.desc())
+                .limit(10 - len(rows))
+            )
+            rows += result.all()
+        attachments = {}
+        if rows:
+            attachments = group_attachments(await session.execute(
+                attachments_query('message', [message.id for message, _, _ in rows])))
+
+    await send_json(send, [{
+        'id': message.id,
+        'subject': message.subject,
+        'message': message.message,
+        'sender': sender_name,
+        'receiver': receiver_name,
+        'is_read': message.is_read,
+        'created_at': message.created_at.strftime('%Y-%m-%d %H:%M'),
+        'direction': 'sent' if message.sender_id == user.id else 'received',
+        'attachments': attachments.get(message.id, [])
+    } for message, sender_name, receiver_name in rows])
+
+
+async def api_vacant_units(request, send, user, property_id):
+    if user.role not in ('admin', 'landlord'):
+        return await send_json(send, {'error': 'Unauthorized'}, 403)
+
+    async with Session() as session:
+        property = await session.get(Property, property_id)
+        if property is None or (user.role == 'landlord' and property.landlord_id != user.id):
+            return await send_json(send, {'error': 'Property not found'}, 404)
+        result = await session.execute(
+            select(Unit).where(Unit.property_id == property_id, Unit.status == 'vacant').order_by(Unit.unit_number)
+        )
+        units = result.scalars().all()
+
+    await send_json(send, [{
+        'id': unit.id,
+        'unit_number': unit.unit_number,
+        'unit_name': unit.unit_name,
+        'rent_amount': unit.rent_amount,
+        'bedrooms': unit.bedrooms,
+        'bathrooms': unit.bathrooms
+    } for unit in units])
+
+
+async def api_occupancy_stats(request, send, user):
+    if user.role != 'landlord':
+        return await send_json(send, {'error': 'Unauthorized'}, 403)
+
+    async with Session() as session:
+        total_units, occupied_units = (await session.execute(
+            select(func.coalesce(func.sum(Property.total_units), 0), func.coalesce(func.sum(Property.occupied_units), 0))
+            .where(Property.landlord_id == user.id)
+        )).one()
+
+    await send_json(send, {
+        'labels': ['Occupied', 'Vacant'],
+        'datasets': [{
+            'data': [occupied_units, total_units - occupied_units],
+            'backgroundColor': ['#27ae60', '#e74c3c'],
+            'borderWidth': 1
+        }]
+    })
+
+
+class NotificationHub:
+    # One poller per process fans new notifications out to every open stream,
+    # so thousands of idle streams cost one query per interval, not one each.
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.subscribers = {}
+        self.cursor = None
+        self.task = None
+        self.starting = asyncio.Lock()
+
+    async def subscribe(self, user_id):
+        queue = asyncio.Queue()
+        self.subscribers.setdefault(user_id, set()).add(queue)
+        async with self.starting:
+            if self.task is None or self.task.done():
+                # A restarted poller begins at the present, not where an earlier one stopped;
+                # each stream replays what it missed from its own cursor
+                async with Session() as session:
+                    self.cursor = await session.scalar(select(func.max(Notification.id))) or 0
+                self.task = asyncio.create_task(self.poll())
+        return queue
+
+    def unsubscribe(self, user_id, queue):
+        queues = self.subscribers.get(user_id)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self.subscribers[user_id]
+
+    async def poll(self):
+        # Merged digests are new rows, so the id is the stream position
+        while self.subscribers:
+            await asyncio.sleep(self.interval)
+            async with Session() as session:
+                result = await session.execute(
+                    select(Notification)
+                    .where(Notification.is_read == False, changed_since(self.cursor))
+                    .order_by(Notification.id)
+                )
+                notifications = result.scalars().all()
+            for notification in notifications:
+                self.cursor = notification.id
+                for queue in self.subscribers.get(notification.user_id, ()):
+                    queue.put_nowait(notification)
+
+
+hub = NotificationHub(flask_app.config['NOTIFICATION_STREAM_INTERVAL'])
+
+
+async def api_notification_stream(request, send, user):
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [
+            (b'content-type', b'text/event-stream'),
+            (b'cache-control', b'no-cache'),
+            (b'x-accel-buffering', b'no')
+        ]
+    })
+    await send({'type': 'http.response.body', 'body': b'retry: 5000\n\n', 'more_body': True})
+
+    # Replay what is unread since the client's last event (all of it without one), then go live.
+    # Subscribe first so nothing committed during the replay is missed, and merge
+    # what the hub pushed meanwhile so events still go out in stream order.
+    cursor = parse_stream_cursor(request.args.get('cursor') or request.headers.get('last-event-id')) or 0
+    queue = await hub.subscribe(user.id)
+    disconnected = asyncio.create_task(wait_for_disconnect(request.receive))
+    try:
+        async with Session() as session:
+            result = await session.execute(
+                select(Notification)
+                .where(Notification.user_id == user.id, Notification.is_read == False, changed_since(cursor))
+                .order_by(Notification.id)
+            )
+            replay = {notification.id: notification for notification in result.scalars()}
+        while not queue.empty():
+            notification = queue.get_nowait()
+            replay.setdefault(notification.id, notification)
+        for notification_id in sorted(replay):
+            queue.put_nowait(replay[notification_id])
+
+        while not disconnected.done():
+            getter = asyncio.create_task(queue.get())
+            done, _ = await asyncio.wait({getter, disconnected}, timeout=KEEPALIVE_SECONDS,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if getter in done:
+                notification = getter.result()
+                if notification.id <= cursor:
+                    continue
+                cursor = notification.id
+                payload = json.dumps(serialize_notification(notification))
+                chunk = f'id: {stream_cursor(notification)}\ndata: {payload}\n\n'
+            else:
+                getter.cancel()
+                if disconnected.done():
+                    break
+                chunk = ': keep-alive\n\n'
+            await send({'type': 'http.response.body', 'body': chunk.encode(), 'more_body': True})
+    finally:
+        hub.unsubscribe(user.id, queue)
+        disconnected.cancel()
+
+
+async def wait_for_disconnect(receive):
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return
+
+
+ROUTES = [
+    ('GET', re.compile(r'^/api/notifications$'), api_notifications),
+    ('GET', re.compile(r'^/api/notifications/stream$'), api_notification_stream),
+    ('GET', re.compile(r'^/api/messages$'), api_messages),
+    ('GET', re.compile(r'^/api/property/(?P<property_id>\d+)/vacant-units$'), api_vacant_units),
+    ('GET', re.compile(r'^/api/landlord/occupancy-stats$'), api_occupancy_stats)
+]
+
+
+class ThreadedWsgiToAsgiInstance(WsgiToAsgiInstance):
+    # asgiref runs every WSGI call on one shared thread by default; the Flask
+    # views are thread-safe, so let them use the executor's thread pool instead
+    run_wsgi_app = sync_to_async(WsgiToAsgiInstance.__dict__['run_wsgi_app'].func, thread_sensitive=False)
+
+
+class ThreadedWsgiToAsgi(WsgiToAsgi):
+    async def __call__(self, scope, receive, send):
+        await ThreadedWsgiToAsgiInstance(self.wsgi_application, self.duplicate_header_limit)(scope, receive, send)
+
+
+class RoomTrackASGI:
+    def __init__(self, wsgi_app):
+        self.wsgi = ThreadedWsgiToAsgi(wsgi_app)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+
+        # The async engine only knows the main database; sharded requests take the routed Flask path
+        if scope['type'] == 'http' and not flask_app.config['SHARD_URLS']:
+            for method, pattern, handler in ROUTES:
+                match = pattern.match(scope['path'])
+                if match and scope['method'] == method:
+                    return await self.dispatch(handler, match, scope, receive, send)
+
+        await self.wsgi(scope, receive, send)
+
+    async def dispatch(self, handler, match, scope, receive, send):
+        request = Request(scope, receive)
+        user = await load_current_user(request)
+        if user is None:
+            # Same behaviour as @login_required on the Flask views
+            return await send_redirect(send, f'/login?next={request.path}')
+        kwargs = {key: int(value) for key, value in match.groupdict().items()}
+        await handler(request, send, user, **kwargs)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await engine.dispose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+application = RoomTrackASGI(flask_app)
@@ -0,0 +1,154 @@
+from sqlalchemy import select
+from datetime import datetime
+from models import db, Property, Unit, MaintenanceRequest, Message, ArchivedMessage, Attachment
+import hashlib
+import os
+import tempfile
+import time
+
+# Photo and document attachments for maintenance requests and messages.
+# Uploads are read from the request body in ATTACHMENT_CHUNK_BYTES chunks,
+# hashed and written to a temporary file as they arrive, so a file is never
+# held in memory. The file is then moved to ATTACHMENT_DIR/ab/cd/<sha256>:
+# identical uploads share one file on disk, and a stored file never changes,
+# so downloads can be cached for good. The type is taken from the file's
+# first bytes, not from what the client claims.
+
+# Leading bytes -> content type
+SIGNATURES = [
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+    (b'%PDF-', 'application/pdf')
+]
+SNIFF_BYTES = 12
+
+
+class AttachmentError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def sniff_content_type(head):
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp'
+    for signature, content_type in SIGNATURES:
+        if head.startswith(signature):
+            return content_type
+    return None
+
+
+def blob_path(root, sha256):
+    return os.path.join(root, sha256[:2], sha256[2:4], sha256)
+
+
+def clean_filename(name):
+    # Only used for display and Content-Disposition, never as a path on disk
+    name = os.path.basename((name or '').replace('\\', '/')).strip()
+    return name[:255] or 'attachment'
+
+
+def store_stream(stream, config):
+    """Copy an upload stream into content-addressed storage; returns (sha256, size, content type)."""
+    root = config['ATTACHMENT_DIR']
+    max_bytes = config['ATTACHMENT_MAX_BYTES']
+    chunk_size = config['ATTACHMENT_CHUNK_BYTES']
+    os.makedirs(os.path.join(root, 'tmp'), exist_ok=True)
+
+    digest = hashlib.sha256()
+    size = 0
+    head = b''
+    content_type = None
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.join(root, 'tmp'))
+    try:
+        with os.fdopen(fd, 'wb') as tmp:
+            while True:
+                chunk = stream.read(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise AttachmentError(f'Attachments are limited to {max_bytes // (1024 * 1024)} MB', 413)
+                if content_type is None:
+                    head += chunk[:SNIFF_BYTES]
+                    if len(head) >= SNIFF_BYTES:
+                        content_type = sniff_content_type(head)
+                        if content_type not in config['ATTACHMENT_TYPES']:
+                            raise AttachmentError('Unsupported file type', 415)
+                digest.update(chunk)
+                tmp.write(chunk)
+        if size == 0:
+            raise AttachmentError('Empty upload')
+        if content_type is None:
+            content_type = sniff_content_type(head)
+            if content_type not in config['ATTACHMENT_TYPES']:
+                raise AttachmentError('Unsupported file type', 415)
+
+        sha256 = digest.hexdigest()
+        path = blob_path(root, sha256)
+        if os.path.exists(path):
+            os.unlink(tmp_path)  # already stored
+            os.utime(path)  # keeps prune_blobs() off it until the new row is committed
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp_path, path)
+        return sha256, size, content_type
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def owner_parties(owner_type, owner_id):
+    """User ids that may read an owner's attachments, or None when the owner does not exist."""
+    if owner_type == 'maintenance_request':
+        row = db.session.execute(
+            select(MaintenanceRequest.tenant_id, Property.landlord_id)
+            .join(Unit, Unit.id == MaintenanceRequest.unit_id).join(Property, Property.id == Unit.property_id)
+            .where(MaintenanceRequest.id == owner_id)
+        ).first()
+    else:
+        row = db.session.execute(select(Message.sender_id, Message.receiver_id).where(Message.id == owner_id)).first() \
+            or db.session.execute(select(ArchivedMessage.sender_id, ArchivedMessage.receiver_id)
+                                  .where(ArchivedMessage.id == owner_id)).first()
+    return set(row) if row else None
+
+
+def attachments_query(owner_type, owner_ids):
+    return select(Attachment.id, Attachment.owner_id, Attachment.filename, Attachment.content_type, Attachment.size)\
+        .where(Attachment.owner_type == owner_type, Attachment.owner_id.in_(list(owner_ids)))\
+        .order_by(Attachment.id)
+
+
+def group_attachments(rows):
+    """{owner id: [metadata, ...]} from attachments_query() rows."""
+    attachments = {}
+    for attachment_id, owner_id, filename, content_type, size in rows:
+        attachments.setdefault(owner_id, []).append(
+            {'id': attachment_id, 'filename': filename, 'content_type': content_type, 'size': size})
+    return attachments
+
+
+def attachments_for(owner_type, owner_ids):
+    """{owner id: [metadata, ...]} for a page of owners; file bodies are never read."""
+    if not owner_ids:
+        return {}
+    return group_attachments(db.session.execute(attachments_query(owner_type, owner_ids)))
+
+
+def prune_blobs(root, older_than=3600):
+    """Delete stored files no attachment refers to any more; returns the number removed."""
+    referenced = set(db.session.scalars(select(Attachment.sha256).distinct()))
+    cutoff = time.time() - older_than
+    removed = 0
+    for directory, _, filenames in os.walk(root):
+        for filename in filenames:
+            path = os.path.join(directory, filename)
+            # Recent files may belong to an upload whose row is not committed yet
+            if filename in referenced or os.path.getmtime(path) > cutoff:
+                continue
+            os.unlink(path)
+            removed += 1
+    return removed
@@ -0,0 +1,151 @@
+"""Hammer unit assignment from many threads and check for double-bookings.
+
+Seeds one landlord with --units vacant units and --tenants tenants, then for
+each thread count runs --seconds of concurrent /landlord/assign-unit calls on
+random units, mixed with /landlord/remove-tenant calls that free units again,
+all from separate logged-in clients. Afterwards it checks that no unit has
+two active leases, that unit status matches its leases and that every
+property's occupied_units matches its occupied units. Prints the throughput
+for each thread count and exits non-zero on any violation.
+
+    python benchmarks/assignment.py --threads 1 4 16 --seconds 5
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REMOVE_RATIO = 0.3
+
+
+def seed(units, tenants):
+    from app import app, db, init_db
+    from models import User, Property, Unit
+
+    init_db()
+    with app.app_context():
+        landlord = User(username='bench', email='bench@roomtrack.com', password='bench', role='landlord')
+        db.session.add(landlord)
+        db.session.flush()
+        db.session.add_all([User(username=f'tenant{i}', email=f'tenant{i}@roomtrack.com', password='bench',
+                                 role='tenant') for i in range(tenants)])
+        prop = Property(name='Bench Court', address='Bench Road', total_units=units, occupied_units=0,
+                        landlord_id=landlord.id)
+        db.session.add(prop)
+        db.session.flush()
+        db.session.add_all([Unit(unit_number=f'U{i:04d}', rent_amount=15000, status='vacant', property_id=prop.id)
+                            for i in range(units)])
+        db.session.commit()
+        return ([unit_id for unit_id, in db.session.query(Unit.id)],
+                [user_id for user_id, in db.session.query(User.id).filter(User.role == 'tenant')])
+
+
+def reset():
+    from app import app, db
+    from models import Property, Unit, Lease, Notification
+    from occupancy import OccupancyMonth
+
+    with app.app_context():
+        for model in (Lease, Notification, OccupancyMonth):
+            db.session.query(model).delete()
+        db.session.query(Unit).update({'status': 'vacant'})
+        db.session.query(Property).update({'occupied_units': 0})
+        db.session.commit()
+
+
+def hammer(threads, seconds, unit_ids, tenant_ids):
+    from app import app
+
+    counts = {'assigned': 0, 'taken': 0, 'removed': 0, 'errors': 0}
+    lock = threading.Lock()
+    start = threading.Barrier(threads + 1)
+    deadline = []
+
+    def run(seed):
+        rng = random.Random(seed)
+        client = app.test_client()
+        client.post('/login', data={'username': 'bench', 'password': 'bench'})
+        local = dict.fromkeys(counts, 0)
+        start.wait()
+        while time.perf_counter() < deadline[0]:
+            if rng.random() < REMOVE_RATIO:
+                response = client.post(f'/landlord/remove-tenant/{rng.choice(tenant_ids)}')
+                outcome = 'removed' if response.status_code == 200 else 'errors' if response.status_code != 404 else None
+            else:
+                response = client.post('/landlord/assign-unit', json={
+                    'tenant_id': rng.choice(tenant_ids), 'unit_id': rng.choice(unit_ids),
+                    'start_date': date.today().isoformat(), 'end_date': (date.today() + timedelta(days=365)).isoformat()})
+                outcome = {200: 'assigned', 400: 'taken'}.get(response.status_code, 'errors')
+            if outcome:
+                local[outcome] += 1
+        with lock:
+            for key, value in local.items():
+                counts[key] += value
+
+    workers = [threading.Thread(target=run, args=(i,)) for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    deadline.append(time.perf_counter() + seconds)
+    start.wait()
+    for worker in workers:
+        worker.join()
+    return counts
+
+
+def violations():
+    from sqlalchemy import func, select
+    from app import app, db
+    from models import Property, Unit, Lease
+
+    with app.app_context():
+        active = select(Lease.unit_id, func.count().label('leases')).where(Lease.status == 'active')\
+            .group_by(Lease.unit_id).subquery()
+        double_booked = db.session.scalar(select(func.count()).select_from(active).where(active.c.leases > 1))
+        status_mismatch = db.session.scalar(
+            select(func.count()).select_from(Unit).outerjoin(active, active.c.unit_id == Unit.id)
+            .where((Unit.status == 'occupied') != active.c.unit_id.is_not(None)))
+        occupied = select(func.count()).select_from(Unit)\
+            .where(Unit.property_id == Property.id, Unit.status == 'occupied').scalar_subquery()
+        counter_mismatch = db.session.scalar(
+            select(func.count()).select_from(Property).where(Property.occupied_units != occupied))
+    return {'double-booked units': double_booked, 'unit status mismatches': status_mismatch,
+            'occupied_units mismatches': counter_mismatch}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--units', type=int, default=50, help='few units keep most assignments contended')
+    parser.add_argument('--tenants', type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['DATABASE_URL'] = f'sqlite:///{os.path.join(tmp, "assignment.db")}'
+        os.environ['SQL_INSTRUMENTATION'] = '0'
+        os.environ['METRICS_ENABLED'] = '0'
+        sys.path.insert(0, ROOT)
+        unit_ids, tenant_ids = seed(args.units, args.tenants)
+
+        failed = False
+        print(f'{"threads":>7} {"req/s":>8} {"assigned":>9} {"taken":>7} {"removed":>8} {"errors":>7}  violations')
+        for threads in args.threads:
+            reset()
+            counts = hammer(threads, args.seconds, unit_ids, tenant_ids)
+            found = {label: count for label, count in violations().items() if count}
+            failed = failed or bool(found) or counts['errors'] > 0
+            total = sum(counts.values())
+            print(f'{threads:>7} {total / args.seconds:>8.0f} {counts["assigned"]:>9} {counts["taken"]:>7} '
+                  f'{counts["removed"]:>8} {counts["errors"]:>7}  '
+                  f'{", ".join(f"{count} {label}" for label, count in found.items()) or "none"}')
+        if failed:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
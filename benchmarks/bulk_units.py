@@ -0,0 +1,86 @@
+"""Time creating many units one ORM object at a time against units.create_units.
+
+Seeds a landlord, then for each --units count adds that many units to a new
+property twice: as Unit objects added to the session and committed together
+(what create_unit and the old create_sample_units did per unit), and with
+create_units from a floors x units-per-floor pattern, which checks for
+duplicates with one query and inserts with one executemany statement.
+Prints the time and the number of statements for each.
+
+    python benchmarks/bulk_units.py --units 100 1000 5000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def new_property(landlord_id):
+    from app import db
+    from models import Property
+
+    prop = Property(name='Bench Tower', address='Bench Road', total_units=0, occupied_units=0, landlord_id=landlord_id)
+    db.session.add(prop)
+    db.session.commit()
+    return prop
+
+
+def one_by_one(landlord_id, rows):
+    from app import db
+    from models import Unit
+
+    prop = new_property(landlord_id)
+    for row in rows:
+        db.session.add(Unit(property_id=prop.id, **row))
+    db.session.commit()
+
+
+def batched(landlord_id, rows):
+    from app import db
+    from units import create_units
+
+    create_units(new_property(landlord_id), rows)
+    db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--units', type=int, nargs='+', default=[100, 1000, 5000])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['DATABASE_URL'] = f'sqlite:///{os.path.join(tmp, "bulk_units.db")}'
+        os.environ['SQL_INSTRUMENTATION'] = '0'
+        os.environ['METRICS_ENABLED'] = '0'
+        sys.path.insert(0, ROOT)
+        from sqlalchemy import event
+        from app import app, db, init_db
+        from models import User
+        from units import expand_pattern
+
+        init_db()
+        with app.app_context():
+            landlord = User(username='bench', email='bench@roomtrack.com', password='bench', role='landlord')
+            db.session.add(landlord)
+            db.session.commit()
+            statements = []
+            event.listen(db.engine, 'before_cursor_execute', lambda *args: statements.append(1))
+
+            print(f'{"units":>6} {"one by one":>12} {"statements":>11} {"batched":>10} {"statements":>11}')
+            for count in args.units:
+                rows = expand_pattern({'floors': -(-count // 50), 'units_per_floor': 50, 'format': 'A{floor}{nn}',
+                                       'rent_amount': [20000, 25000], 'bedrooms': [1, 2, 3]})[:count]
+                results = []
+                for create in (one_by_one, batched):
+                    statements.clear()
+                    start = time.perf_counter()
+                    create(landlord.id, rows)
+                    results += [(time.perf_counter() - start) * 1000, len(statements)]
+                print(f'{count:>6} {results[0]:>10.1f}ms {results[1]:>11} {results[2]:>8.1f}ms {results[3]:>11}')
+
+
+if __name__ == '__main__':
+    main()
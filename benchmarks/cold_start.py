@@ -0,0 +1,94 @@
+"""Measure serverless cold-start cost and enforce a budget.
+
+Each sample is a fresh interpreter that imports app.py and serves its first
+requests through the test client, which is what a cold Vercel invocation
+does. Samples run with an empty bytecode cache and with templates
+precompiled by `flask precompile-templates`, as the deploy build does.
+Exits non-zero when a median exceeds its budget.
+
+    python benchmarks/cold_start.py --samples 7
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Milliseconds, medians over the samples
+BUDGET = {
+    'import': 800,
+    'first_response': 50,
+    'first_db_response': 100
+}
+
+PROBE = r'''
+import json, time
+start = time.perf_counter()
+import app as roomtrack
+imported = time.perf_counter()
+client = roomtrack.app.test_client()
+client.get('/login')
+first = time.perf_counter()
+client.post('/login', data={'username': 'nobody', 'password': 'wrong'})
+first_db = time.perf_counter()
+print(json.dumps({
+    'import': (imported - start) * 1000,
+    'first_response': (first - imported) * 1000,
+    'first_db_response': (first_db - first) * 1000
+}))
+'''
+
+
+def sample(env):
+    result = subprocess.run([sys.executable, '-c', PROBE], cwd=ROOT, env=env,
+                            check=True, capture_output=True, text=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--samples', type=int, default=5)
+    parser.add_argument('--budget', type=json.loads, default={},
+                        help='JSON object overriding budget entries, e.g. \'{"import": 900}\'')
+    args = parser.parse_args()
+    budget = dict(BUDGET, **args.budget)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, DATABASE_URL=f'sqlite:///{os.path.join(tmp, "cold.db")}')
+        subprocess.run([sys.executable, '-m', 'flask', '--app', 'app', 'init-db'], cwd=ROOT, env=env,
+                       check=True, capture_output=True)
+
+        # Without any cache, and with templates precompiled the way the build does it
+        precompiled = os.path.join(tmp, 'jinja_cache')
+        subprocess.run([sys.executable, '-m', 'flask', '--app', 'app', 'precompile-templates'], cwd=ROOT,
+                       env=dict(env, JINJA_PRECOMPILED_DIR=precompiled), check=True, capture_output=True)
+
+        results = []
+        for label, precompiled_dir in (('no bytecode cache', None), ('precompiled', precompiled)):
+            runs = []
+            for i in range(args.samples):
+                # A fresh writable cache per sample, as on a new serverless instance
+                runs.append(sample(dict(env,
+                                        JINJA_PRECOMPILED_DIR=precompiled_dir or os.path.join(tmp, 'missing'),
+                                        JINJA_BYTECODE_CACHE_DIR=os.path.join(tmp, f'{label}-{i}'))))
+            results.append((label, {key: statistics.median(r[key] for r in runs) for key in BUDGET}))
+
+    print(f'{"":<20}' + ''.join(f'{key:>20}' for key in BUDGET))
+    for label, medians in results:
+        print(f'{label:<20}' + ''.join(f'{medians[key]:>18.1f}ms' for key in BUDGET))
+    print(f'{"budget":<20}' + ''.join(f'{budget[key]:>18.1f}ms' for key in BUDGET))
+
+    # The budget applies to the configuration we deploy: with precompiled templates
+    _, deployed = results[-1]
+    over = [key for key in BUDGET if deployed[key] > budget[key]]
+    if over:
+        print(f'Cold start over budget: {", ".join(over)}')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
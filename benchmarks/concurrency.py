@@ -0,0 +1,171 @@
+"""Compare idle-connection capacity of the WSGI and ASGI serving modes.
+
+Starts the app under each server, opens N notification streams
+(/api/notifications/stream) that stay idle, then measures how many streams
+were accepted, the latency of ordinary /api/notifications requests while
+they are held open, and the server's thread count and resident memory.
+
+    python benchmarks/concurrency.py --connections 2000
+"""
+import argparse
+import asyncio
+import os
+import resource
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SERVERS = {
+    'wsgi': [sys.executable, '-c', 'import sys; from app import app; app.run(port=int(sys.argv[1]), threaded=True)'],
+    'asgi': [sys.executable, '-m', 'uvicorn', 'asgi:application', '--log-level', 'warning', '--port']
+}
+
+
+def seed_database(path):
+    env = dict(os.environ, DATABASE_URL=f'sqlite:///{path}')
+    script = (
+        "from app import app, init_db, db\n"
+        "from models import User\n"
+        "init_db()\n"
+        "with app.app_context():\n"
+        "    db.session.add(User(username='bench', email='bench@roomtrack.com', password='bench', role='tenant'))\n"
+        "    db.session.commit()\n"
+    )
+    subprocess.run([sys.executable, '-c', script], cwd=ROOT, env=env, check=True, capture_output=True)
+    return env
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, timeout=20):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f'Server did not start on port {port}')
+
+
+def login(port):
+    class NoRedirect(urllib.request.HTTPRedirectHandler):
+        def redirect_request(self, *args, **kwargs):
+            return None
+
+    opener = urllib.request.build_opener(NoRedirect)
+    data = urllib.parse.urlencode({'username': 'bench', 'password': 'bench'}).encode()
+    try:
+        opener.open(f'http://127.0.0.1:{port}/login', data)
+    except urllib.error.HTTPError as e:
+        return e.headers['Set-Cookie'].split(';')[0]
+    raise RuntimeError('Login did not redirect')
+
+
+def process_stats(pid):
+    stats = {}
+    with open(f'/proc/{pid}/status') as f:
+        for line in f:
+            key, _, value = line.partition(':')
+            if key in ('Threads', 'VmRSS'):
+                stats[key] = value.strip()
+    return stats
+
+
+async def open_stream(port, cookie, timeout):
+    reader, writer = await asyncio.wait_for(asyncio.open_connection('127.0.0.1', port), timeout)
+    writer.write(f'GET /api/notifications/stream HTTP/1.1\r\nHost: localhost\r\nCookie: {cookie}\r\n\r\n'.encode())
+    await writer.drain()
+    status = await asyncio.wait_for(reader.readline(), timeout)
+    if b' 200 ' not in status:
+        writer.close()
+        raise RuntimeError(status)
+    return writer
+
+
+async def probe(port, cookie, count):
+    latencies = []
+    for _ in range(count):
+        start = time.perf_counter()
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(f'GET /api/notifications HTTP/1.1\r\nHost: localhost\r\nCookie: {cookie}\r\nConnection: close\r\n\r\n'.encode())
+        await writer.drain()
+        await reader.read()
+        writer.close()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+async def hold_streams(port, cookie, connections, timeout, probes):
+    results = await asyncio.gather(*(open_stream(port, cookie, timeout) for _ in range(connections)),
+                                   return_exceptions=True)
+    writers = [r for r in results if not isinstance(r, BaseException)]
+    try:
+        latencies = await asyncio.wait_for(probe(port, cookie, probes), timeout * probes)
+    except asyncio.TimeoutError:
+        latencies = []
+    return writers, latencies
+
+
+def run_mode(mode, env, connections, timeout, probes):
+    port = free_port()
+    server = subprocess.Popen(SERVERS[mode] + [str(port)], cwd=ROOT, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for_port(port)
+        cookie = login(port)
+        return asyncio.run(run_and_measure(port, cookie, connections, timeout, probes, server.pid))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+async def run_and_measure(port, cookie, connections, timeout, probes, pid):
+    writers, latencies = await hold_streams(port, cookie, connections, timeout, probes)
+    stats = process_stats(pid)
+    for writer in writers:
+        writer.close()
+    return {'accepted': len(writers), **stats}, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--connections', type=int, default=1000)
+    parser.add_argument('--timeout', type=float, default=10.0)
+    parser.add_argument('--probes', type=int, default=20)
+    parser.add_argument('--modes', nargs='+', default=['wsgi', 'asgi'], choices=sorted(SERVERS))
+    args = parser.parse_args()
+
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = seed_database(os.path.join(tmp, 'bench.db'))
+        env['NOTIFICATION_STREAM_INTERVAL'] = '5'
+
+        print(f'{"mode":<6} {"streams":>9} {"threads":>8} {"rss":>10} {"probe p50":>10} {"probe p95":>10}')
+        for mode in args.modes:
+            stats, latencies = run_mode(mode, env, args.connections, args.timeout, args.probes)
+            if latencies:
+                p50 = f'{statistics.median(latencies):.1f}ms'
+                p95 = f'{sorted(latencies)[int(len(latencies) * 0.95) - 1]:.1f}ms'
+            else:
+                p50 = p95 = 'timeout'
+            print(f'{mode:<6} {stats["accepted"]:>5}/{args.connections:<3} {stats.get("Threads", "?"):>8} '
+                  f'{stats.get("VmRSS", "?"):>10} {p50:>10} {p95:>10}')
+
+
+if __name__ == '__main__':
+    main()
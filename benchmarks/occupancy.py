@@ -0,0 +1,104 @@
+"""Time the occupancy history API on a large portfolio.
+
+Seeds one landlord with --units units spread over --properties properties
+and --years of back-to-back leases with vacancy gaps, then times
+/api/landlord/occupancy-history over the whole period: monthly with an
+empty cache, monthly again once closed months are cached, with per-unit
+totals, and daily. Exits non-zero when the cold monthly run exceeds the
+budget.
+
+    python benchmarks/occupancy.py --units 10000 --years 5
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BUDGET_MS = 1000
+
+
+def seed(properties, units, years, rng):
+    from app import app, db, init_db
+    from models import User, Property, Unit, Lease
+
+    init_db()
+    with app.app_context():
+        landlord = User(username='bench', email='bench@roomtrack.com', password='bench', role='landlord')
+        tenant = User(username='tenant', email='tenant@roomtrack.com', password='bench', role='tenant')
+        db.session.add_all([landlord, tenant])
+        db.session.flush()
+        per_property = units // properties
+        db.session.execute(Property.__table__.insert(), [
+            dict(id=p + 1, name=f'Property {p:03d}', address='Bench Road', total_units=per_property,
+                 occupied_units=0, landlord_id=landlord.id)
+            for p in range(properties)])
+        db.session.execute(Unit.__table__.insert(), [
+            dict(id=u + 1, unit_number=f'U{u:05d}', rent_amount=15000, status='vacant', property_id=u // per_property + 1)
+            for u in range(per_property * properties)])
+
+        today = date.today()
+        history_start = today - timedelta(days=365 * years)
+        leases = []
+        for unit_id in range(1, per_property * properties + 1):
+            day = history_start + timedelta(days=rng.randrange(90))
+            while day < today:
+                end = day + timedelta(days=rng.choice([180, 365, 365, 730]))
+                leases.append(dict(tenant_id=tenant.id, unit_id=unit_id, start_date=day, end_date=end,
+                                   monthly_rent=15000, security_deposit=0,
+                                   status='active' if end >= today else 'ended'))
+                day = end + timedelta(days=rng.choice([1, 1, 15, 45, 120]))
+        for i in range(0, len(leases), 5000):
+            db.session.execute(Lease.__table__.insert(), leases[i:i + 5000])
+        db.session.commit()
+        return len(leases)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--properties', type=int, default=100)
+    parser.add_argument('--units', type=int, default=10000)
+    parser.add_argument('--years', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['DATABASE_URL'] = f'sqlite:///{os.path.join(tmp, "occupancy.db")}'
+        os.environ['SQL_INSTRUMENTATION'] = '0'
+        sys.path.insert(0, ROOT)
+
+        started = time.perf_counter()
+        leases = seed(args.properties, args.units, args.years, random.Random(args.seed))
+        print(f'Seeded {args.units:,} units and {leases:,} leases in {time.perf_counter() - started:.1f}s\n')
+
+        from app import app
+        client = app.test_client()
+        client.post('/login', data={'username': 'bench', 'password': 'bench'})
+
+        today = date.today()
+        start = (today - timedelta(days=365 * args.years)).isoformat()
+        runs = [
+            ('monthly, cold cache', f'start={start[:7]}'),
+            ('monthly, cached', f'start={start[:7]}'),
+            ('monthly + per-unit', f'start={start[:7]}&units=1'),
+            ('daily', f'start={start}&granularity=day')
+        ]
+        timings = {}
+        for label, query in runs:
+            began = time.perf_counter()
+            response = client.get(f'/api/landlord/occupancy-history?{query}')
+            timings[label] = (time.perf_counter() - began) * 1000
+            if response.status_code != 200:
+                raise RuntimeError(f'{label} returned {response.status_code}')
+            print(f'{label:<24}{timings[label]:>10.1f}ms{len(response.data) / 1024:>10.0f}KB')
+
+        if timings['monthly, cold cache'] > BUDGET_MS:
+            print(f'Cold monthly history over budget ({BUDGET_MS}ms)')
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
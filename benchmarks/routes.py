@@ -0,0 +1,476 @@
+"""Route-level benchmarks with SQL query budgets.
+
+Seeds a parameterized dataset (landlords x properties x units x months of
+payments), then calls every route in app.py through the Flask test client
+and records latency percentiles, SQL statement count and peak Python memory
+per route. Results are compared with benchmarks/baseline.json; the run
+fails when a route issues more statements than its budget or when a route
+has no benchmark at all.
+
+    python benchmarks/routes.py                    # compare with the baseline
+    python benchmarks/routes.py --update-baseline  # accept the current numbers
+    python benchmarks/routes.py --only landlord_tenant_payments
+"""
+import argparse
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE = os.path.join(ROOT, 'benchmarks', 'baseline.json')
+PNG = b'\x89PNG\r\n\x1a\n' + bytes(range(256)) * 400
+DEFAULT_DATASET = {'landlords': 3, 'properties': 3, 'units': 10, 'months': 12}
+
+# Routes that cannot be benchmarked meaningfully through the test client
+SKIPPED = {
+    'static': 'served by the web server in production',
+    'admin_profile_file': 'file download of a saved profile'
+}
+
+
+def configure_environment(tmp):
+    os.environ['DATABASE_URL'] = f'sqlite:///{os.path.join(tmp, "bench.db")}'
+    os.environ['NOTIFICATION_STREAM_INTERVAL'] = '0'
+    os.environ['ATTACHMENT_DIR'] = os.path.join(tmp, 'attachments')
+    sys.path.insert(0, ROOT)
+
+
+def seed(dataset, rng):
+    """Insert the dataset with executemany batches and return ids for the route specs."""
+    from app import app, db, init_db
+    from models import User, Property, Unit, Lease, Payment, MaintenanceRequest, Message, Notification
+    from conversations import backfill_conversations
+
+    init_db()
+    with app.app_context():
+        today = date.today()
+        users, properties, units, leases, payments = [], [], [], [], []
+        maintenance, messages, notifications = [], [], []
+
+        next_user = 1000
+        for landlord in range(dataset['landlords']):
+            landlord_id = next_user
+            next_user += 1
+            users.append(dict(id=landlord_id, username=f'landlord{landlord}', email=f'landlord{landlord}@bench',
+                              password='pass', role='landlord', full_name=f'Landlord {landlord}'))
+            for p in range(dataset['properties']):
+                property_id = len(properties) + 1
+                occupied = 0
+                for u in range(dataset['units']):
+                    unit_id = len(units) + 1
+                    is_occupied = rng.random() < 0.8
+                    units.append(dict(id=unit_id, unit_number=f'{chr(65 + p)}{u + 1:03d}', unit_name=None,
+                                      rent_amount=rng.choice([15000, 20000, 25000, 30000]),
+                                      status='occupied' if is_occupied else 'vacant',
+                                      bedrooms=rng.randint(1, 4), bathrooms=rng.randint(1, 2),
+                                      square_feet=rng.randint(400, 1500), property_id=property_id))
+                    if not is_occupied:
+                        continue
+                    occupied += 1
+                    tenant_id = next_user
+                    next_user += 1
+                    users.append(dict(id=tenant_id, username=f'tenant{tenant_id}', email=f'tenant{tenant_id}@bench',
+                                      password='pass', role='tenant', full_name=f'Tenant {tenant_id}'))
+                    lease_id = len(leases) + 1
+                    start = today - timedelta(days=30 * dataset['months'])
+                    leases.append(dict(id=lease_id, tenant_id=tenant_id, unit_id=unit_id, start_date=start,
+                                       end_date=start + timedelta(days=365 * 2), monthly_rent=units[-1]['rent_amount'],
+                                       security_deposit=0, status='active'))
+                    for m in range(dataset['months']):
+                        paid = start + timedelta(days=30 * m)
+                        payments.append(dict(lease_id=lease_id, amount=units[-1]['rent_amount'], payment_date=paid,
+                                             due_date=paid + timedelta(days=30), transaction_code=f'TX{lease_id}-{m}',
+                                             payment_method=rng.choice(['mpesa', 'bank']),
+                                             status='approved' if m < dataset['months'] - 1 else 'pending',
+                                             receipt_generated=False,
+                                             created_at=datetime.combine(paid, datetime.min.time())))
+                    if u % 3 == 0:
+                        maintenance.append(dict(tenant_id=tenant_id, unit_id=unit_id, title='Leaking tap',
+                                                description='The kitchen tap is leaking water', urgency='medium',
+                                                status='pending'))
+                    messages.append(dict(sender_id=tenant_id, receiver_id=landlord_id, subject='Rent',
+                                         message='Rent has been paid via mpesa', is_read=False))
+                    notifications.append(dict(user_id=landlord_id, title='New Payment Submitted',
+                                              message='A tenant submitted a payment', type='payment_submitted',
+                                              is_read=False))
+                properties.append(dict(id=property_id, name=f'Property {landlord}-{p}', address='Nairobi',
+                                       total_units=dataset['units'], occupied_units=occupied, landlord_id=landlord_id))
+
+        for model, rows in ((User, users), (Property, properties), (Unit, units), (Lease, leases),
+                            (Payment, payments), (MaintenanceRequest, maintenance), (Message, messages),
+                            (Notification, notifications)):
+            if rows:
+                db.session.execute(model.__table__.insert(), rows)
+        db.session.commit()
+        backfill_conversations()
+
+        landlord = User.query.filter_by(username='landlord0').one()
+        prop = Property.query.filter_by(landlord_id=landlord.id).first()
+        lease = Lease.query.join(Unit).filter(Unit.property_id == prop.id).first()
+        return {
+            'landlord_username': landlord.username,
+            'landlord_id': landlord.id,
+            'property_id': prop.id,
+            'tenant_username': lease.tenant.username,
+            'tenant_id': lease.tenant_id,
+            'lease_id': lease.id,
+            'payment_id': Payment.query.filter_by(lease_id=lease.id).first().id,
+            'maintenance_id': MaintenanceRequest.query.join(Unit).filter(Unit.property_id == prop.id).first().id,
+            'notification_id': Notification.query.filter_by(user_id=landlord.id).first().id,
+            'message_id': Message.query.filter_by(sender_id=lease.tenant_id).first().id,
+            'conversation_id': Message.query.filter_by(sender_id=lease.tenant_id).first().conversation_id,
+            'counts': {'users': len(users), 'units': len(units), 'leases': len(leases), 'payments': len(payments)}
+        }
+
+
+class Fixtures:
+    """Creates the rows that mutating routes consume, outside the measured request."""
+
+    def __init__(self, ctx):
+        from app import app, db
+        self.app, self.db, self.ctx = app, db, ctx
+        self.counter = 0
+        self.empty_properties = []
+
+    def unique(self, prefix):
+        self.counter += 1
+        return f'{prefix}{self.counter}'
+
+    def tenant(self):
+        from models import User
+        with self.app.app_context():
+            name = self.unique('fixture_tenant')
+            user = User(username=name, email=f'{name}@bench', password='pass', role='tenant')
+            self.db.session.add(user)
+            self.db.session.commit()
+            return user.id
+
+    def vacant_unit(self):
+        from models import Unit
+        with self.app.app_context():
+            unit = Unit(unit_number=self.unique('F'), rent_amount=20000, status='vacant',
+                        property_id=self.ctx['property_id'])
+            self.db.session.add(unit)
+            self.db.session.commit()
+            return unit.id
+
+    def empty_property(self):
+        # Drop the previous call's property and units so they do not grow the landlord's other pages
+        from models import Property, Unit
+        with self.app.app_context():
+            Unit.query.filter(Unit.property_id.in_(self.empty_properties)).delete()
+            Property.query.filter(Property.id.in_(self.empty_properties)).delete()
+            prop = Property(name=self.unique('Empty Property '), address='Nairobi', total_units=0, occupied_units=0,
+                            landlord_id=self.ctx['landlord_id'])
+            self.db.session.add(prop)
+            self.db.session.commit()
+            self.empty_properties = [prop.id]
+            return prop.id
+
+    def leased_tenant(self):
+        from models import Lease, Unit, Property
+        tenant_id, unit_id = self.tenant(), self.vacant_unit()
+        with self.app.app_context():
+            self.db.session.add(Lease(tenant_id=tenant_id, unit_id=unit_id, start_date=date.today(),
+                                      end_date=date.today() + timedelta(days=365), monthly_rent=20000))
+            self.db.session.get(Unit, unit_id).status = 'occupied'
+            self.db.session.get(Property, self.ctx['property_id']).occupied_units += 1
+            self.db.session.commit()
+        return tenant_id
+
+    def pending_payment(self):
+        from models import Payment
+        with self.app.app_context():
+            payment = Payment(lease_id=self.ctx['lease_id'], amount=1000, payment_date=date.today(),
+                              due_date=date.today() + timedelta(days=30), transaction_code='FIX',
+                              payment_method='mpesa', status='pending')
+            self.db.session.add(payment)
+            self.db.session.commit()
+            return payment.id
+
+    def clear_pending_payments(self):
+        from models import Payment
+        with self.app.app_context():
+            Payment.query.filter_by(lease_id=self.ctx['lease_id'], status='pending').delete()
+            self.db.session.commit()
+
+    def attachment(self):
+        from attachments import Attachment, store_stream
+        with self.app.app_context():
+            sha256, size, content_type = store_stream(io.BytesIO(PNG), self.app.config)
+            attachment = Attachment(owner_type='maintenance_request', owner_id=self.ctx['maintenance_id'], sha256=sha256,
+                                    filename='leak.png', content_type=content_type, size=size,
+                                    uploaded_by=self.ctx['landlord_id'])
+            self.db.session.add(attachment)
+            self.db.session.commit()
+            return attachment.id
+
+    def clear_attachments(self):
+        from attachments import Attachment
+        with self.app.app_context():
+            Attachment.query.delete()
+            self.db.session.commit()
+
+    def assignment(self):
+        return {'tenant_id': self.tenant(), 'unit_id': self.vacant_unit(),
+                'start_date': date.today().isoformat(),
+                'end_date': (date.today() + timedelta(days=365)).isoformat()}
+
+    def new_user(self, role='tenant'):
+        name = self.unique('bench_user')
+        return {'username': name, 'email': f'{name}@bench', 'password': 'pass', 'role': role, 'full_name': name}
+
+
+def route_specs(ctx, fx):
+    """endpoint -> (role, method, prepare); prepare() returns (path, request kwargs)."""
+    c = ctx
+    get = lambda path: (lambda: (path, {}))
+    return {
+        'index': ('landlord', 'GET', get('/')),
+        'login': ('anonymous', 'POST', lambda: ('/login', {'data': {'username': c['landlord_username'], 'password': 'pass'}})),
+        'logout': ('fresh_landlord', 'GET', get('/logout')),
+        'metrics': ('admin', 'GET', get('/metrics')),
+
+        'admin_dashboard': ('admin', 'GET', get('/admin/dashboard')),
+        'admin_users': ('admin', 'GET', get('/admin/users')),
+        'admin_tenants': ('admin', 'GET', get('/admin/tenants')),
+        'admin_slow_queries': ('admin', 'GET', get('/admin/slow-queries')),
+        'admin_profiles': ('admin', 'GET', get('/admin/profiles')),
+        'admin_register_tenant': ('admin', 'GET', get('/admin/register-tenant')),
+        'admin_assign_unit': ('admin', 'POST', lambda: ('/admin/assign-unit', {'json': fx.assignment()})),
+        'create_user': ('admin', 'POST', lambda: ('/admin/create-user', {'json': fx.new_user()})),
+
+        'landlord_dashboard': ('landlord', 'GET', get('/landlord/dashboard')),
+        'landlord_properties': ('landlord', 'GET', get('/landlord/properties')),
+        'landlord_payments': ('landlord', 'GET', get('/landlord/payments')),
+        'landlord_tenants': ('landlord', 'GET', get('/landlord/tenants')),
+        'landlord_units': ('landlord', 'GET', get('/landlord/units')),
+        'landlord_maintenance_reports': ('landlord', 'GET', get('/landlord/maintenance-reports')),
+        'landlord_tenant_payments': ('landlord', 'GET', get('/landlord/tenant-payments')),
+        'landlord_add_tenant': ('landlord', 'GET', get('/landlord/add-tenant')),
+        'landlord_add_unit': ('landlord', 'GET', get('/landlord/add-unit')),
+        'landlord_assign_unit': ('landlord', 'POST', lambda: ('/landlord/assign-unit', {'json': fx.assignment()})),
+        'landlord_remove_tenant': ('landlord', 'POST', lambda: (f'/landlord/remove-tenant/{fx.leased_tenant()}', {})),
+        'landlord_delete_tenant': ('landlord', 'POST', lambda: (f'/landlord/delete-tenant/{fx.tenant()}', {})),
+        'create_unit': ('landlord', 'POST', lambda: ('/api/landlord/create-unit', {'json': {
+            'property_id': c['property_id'], 'unit_number': fx.unique('N'), 'rent_amount': 20000}})),
+        'create_property': ('landlord', 'POST', lambda: ('/api/landlord/create-property', {'json': {
+            'name': fx.unique('Bench Property '), 'address': 'Nairobi', 'total_units': 10}})),
+        'bulk_create_units': ('landlord', 'POST', lambda: ('/api/landlord/create-units', {'json': {
+            'property_id': fx.empty_property(), 'pattern': {'floors': 10, 'units_per_floor': 20, 'format': 'A{floor}{nn}',
+                                                            'rent_amount': [20000, 25000], 'bedrooms': [1, 2]}}})),
+        'create_sample_units': ('landlord', 'POST', lambda: (f'/api/property/{fx.empty_property()}/create-sample-units', {})),
+        'approve_payment': ('landlord', 'POST', get(f'/api/payment/approve/{c["payment_id"]}')),
+        'reject_payment': ('landlord', 'POST', get(f'/api/payment/reject/{c["payment_id"]}')),
+        'update_maintenance_status': ('landlord', 'POST', lambda: (
+            f'/api/maintenance/update-status/{c["maintenance_id"]}', {'json': {'status': 'in_progress'}})),
+        'landlord_payment_stats': ('landlord', 'GET', get('/api/landlord/payment-stats')),
+        'landlord_occupancy_stats': ('landlord', 'GET', get('/api/landlord/occupancy-stats')),
+        'get_vacant_units': ('landlord', 'GET', get(f'/api/property/{c["property_id"]}/vacant-units')),
+        'api_property_units': ('landlord', 'GET', get(f'/api/property/{c["property_id"]}/units')),
+        'landlord_occupancy_history': ('landlord', 'GET', get('/api/landlord/occupancy-history?units=1')),
+        'search_vacant_units': ('landlord', 'GET', get('/api/units/vacant?min_rent=10000&max_rent=30000')),
+        'landlord_lease_expirations': ('landlord', 'GET', get('/api/landlord/lease-expirations?days=90')),
+        'landlord_renew_leases': ('landlord', 'POST', lambda: ('/api/landlord/renew-leases', {'json': {
+            'lease_ids': [c['lease_id']], 'months': 12, 'rent_change_percent': 5}})),
+        'search_maintenance_requests': ('landlord', 'GET', get('/api/search/maintenance?q=leak')),
+
+        'tenant_dashboard': ('tenant', 'GET', get('/tenant/dashboard')),
+        'tenant_payments': ('tenant', 'GET', get('/tenant/payments')),
+        'tenant_maintenance': ('tenant', 'GET', get('/tenant/maintenance')),
+        'tenant_payment_history': ('tenant', 'GET', get('/api/tenant/payment-history')),
+        'tenant_summary': ('tenant', 'GET', get('/api/tenant/summary')),
+        'submit_payment': ('tenant', 'POST', lambda: (fx.clear_pending_payments(), ('/tenant/submit-payment', {'json': {
+            'amount': 20000, 'transaction_code': fx.unique('TX'), 'payment_method': 'mpesa'}}))[1]),
+        'edit_payment': ('tenant', 'POST', lambda: (f'/tenant/edit-payment/{fx.pending_payment()}', {'json': {
+            'amount': 21000, 'transaction_code': 'EDIT'}})),
+        'submit_maintenance': ('tenant', 'POST', lambda: ('/tenant/submit-maintenance', {'json': {
+            'title': 'Broken window', 'description': 'The bedroom window is cracked', 'urgency': 'high'}})),
+
+        'get_notifications': ('landlord', 'GET', get('/api/notifications')),
+        'mark_notification_read': ('landlord', 'POST', get(f'/api/notifications/mark-read/{c["notification_id"]}')),
+        'stream_notifications': ('tenant', 'STREAM', get('/api/notifications/stream')),
+        'get_messages': ('tenant', 'GET', get('/api/messages')),
+        'send_message': ('tenant', 'POST', lambda: ('/api/messages/send', {'json': {
+            'receiver_id': c['landlord_id'], 'subject': 'Hello', 'message': 'Benchmark message'}})),
+        'search_user_messages': ('tenant', 'GET', get('/api/search/messages?q=rent')),
+        'get_conversations': ('landlord', 'GET', get('/api/conversations')),
+        'get_conversation_messages': ('tenant', 'GET', get(f'/api/conversations/{c["conversation_id"]}/messages')),
+        'mark_conversation_as_read': ('landlord', 'POST', get(f'/api/conversations/{c["conversation_id"]}/read')),
+
+        'upload_maintenance_attachment': ('landlord', 'POST', lambda: (fx.clear_attachments(), (
+            f'/api/maintenance/{c["maintenance_id"]}/attachments?filename=leak.png', {'data': PNG}))[1]),
+        'upload_message_attachment': ('tenant', 'POST', lambda: (fx.clear_attachments(), (
+            f'/api/messages/{c["message_id"]}/attachments?filename=leak.png', {'data': PNG}))[1]),
+        'download_attachment': ('landlord', 'GET', lambda: (f'/attachments/{fx.attachment()}', {}))
+    }
+
+
+class StatementCounter:
+    def __init__(self, engine):
+        from sqlalchemy import event
+        self.count = 0
+        event.listen(engine, 'before_cursor_execute', self.before)
+
+    def before(self, *args):
+        self.count += 1
+
+
+def login(app, username, password):
+    client = app.test_client()
+    client.post('/login', data={'username': username, 'password': password})
+    return client
+
+
+def measure(app, client_for, endpoint, spec, counter, iterations):
+    role, method, prepare = spec
+
+    def call():
+        path, kwargs = prepare()
+        client = client_for(role)
+        counter.count = 0
+        start = time.perf_counter()
+        if method == 'STREAM':
+            # Read the retry hint and the first poll, then hang up
+            response = client.get(path, buffered=False)
+            stream = response.response
+            next(stream), next(stream)
+            response.close()
+        else:
+            response = client.open(path, method=method, **kwargs)
+            response.get_data()  # streamed pages run their queries while the body is read
+        elapsed = (time.perf_counter() - start) * 1000
+        if response.status_code >= 500:
+            raise RuntimeError(f'{endpoint} returned {response.status_code}')
+        return elapsed, counter.count, response.status_code
+
+    call()  # warm-up: first-render template compilation is not what we budget
+    latencies, queries, statuses = [], [], set()
+    for _ in range(iterations):
+        elapsed, count, status = call()
+        latencies.append(elapsed)
+        queries.append(count)
+        statuses.add(status)
+
+    tracemalloc.start()
+    call()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    latencies.sort()
+    pct = lambda p: latencies[min(len(latencies) - 1, int(round(p / 100 * (len(latencies) - 1))))]
+    return {
+        'queries': max(queries),
+        'p50_ms': round(pct(50), 2),
+        'p95_ms': round(pct(95), 2),
+        'p99_ms': round(pct(99), 2),
+        'peak_kb': round(peak / 1024, 1),
+        'status': sorted(statuses)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    for key, value in DEFAULT_DATASET.items():
+        parser.add_argument(f'--{key}', type=int, default=None, help=f'dataset size (baseline: {value})')
+    parser.add_argument('--iterations', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--only', nargs='+', help='benchmark only these endpoints')
+    parser.add_argument('--update-baseline', action='store_true')
+    parser.add_argument('--latency-tolerance', type=float, default=None,
+                        help='also fail when p95 exceeds the baseline by this factor, e.g. 2.0')
+    args = parser.parse_args()
+
+    baseline = {}
+    if os.path.exists(BASELINE):
+        with open(BASELINE) as f:
+            baseline = json.load(f)
+    dataset = dict(baseline.get('dataset', DEFAULT_DATASET))
+    for key in DEFAULT_DATASET:
+        if getattr(args, key) is not None:
+            dataset[key] = getattr(args, key)
+    comparable = dataset == baseline.get('dataset')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        configure_environment(tmp)
+        ctx = seed(dataset, random.Random(args.seed))
+        from app import app, db
+        app.config['TESTING'] = True
+
+        fx = Fixtures(ctx)
+        specs = route_specs(ctx, fx)
+        endpoints = sorted(rule.endpoint for rule in app.url_map.iter_rules())
+        missing = [e for e in endpoints if e not in specs and e not in SKIPPED]
+        if missing:
+            print(f'No benchmark defined for: {", ".join(missing)}')
+            sys.exit(1)
+
+        clients = {}
+        credentials = {'admin': ('admin', 'admin123'), 'landlord': (ctx['landlord_username'], 'pass'),
+                       'tenant': (ctx['tenant_username'], 'pass')}
+
+        def client_for(role):
+            if role == 'anonymous':
+                return app.test_client()
+            if role.startswith('fresh_'):
+                return login(app, *credentials[role[len('fresh_'):]])
+            if role not in clients:
+                clients[role] = login(app, *credentials[role])
+            return clients[role]
+
+        with app.app_context():
+            counter = StatementCounter(db.engine)
+
+        results = {}
+        for endpoint in sorted(specs):
+            if args.only and endpoint not in args.only:
+                continue
+            results[endpoint] = measure(app, client_for, endpoint, specs[endpoint], counter, args.iterations)
+
+    print(f'Dataset: {dataset} -> {ctx["counts"]}')
+    print(f'{"route":<32}{"queries":>8}{"budget":>8}{"p50":>10}{"p95":>10}{"p99":>10}{"peak":>11}')
+    failures = []
+    for endpoint, result in results.items():
+        base = baseline.get('routes', {}).get(endpoint, {})
+        budget = base.get('budget', base.get('queries')) if comparable else None
+        flag = ''
+        if budget is not None and result['queries'] > budget:
+            failures.append(f'{endpoint}: {result["queries"]} queries > budget {budget}')
+            flag = '  OVER BUDGET'
+        if comparable and args.latency_tolerance and base.get('p95_ms') \
+                and result['p95_ms'] > base['p95_ms'] * args.latency_tolerance:
+            failures.append(f'{endpoint}: p95 {result["p95_ms"]}ms > {args.latency_tolerance}x baseline {base["p95_ms"]}ms')
+            flag += '  SLOW'
+        print(f'{endpoint:<32}{result["queries"]:>8}{budget if budget is not None else "-":>8}'
+              f'{result["p50_ms"]:>8.1f}ms{result["p95_ms"]:>8.1f}ms{result["p99_ms"]:>8.1f}ms'
+              f'{result["peak_kb"]:>9.0f}KB{flag}')
+
+    if args.update_baseline:
+        routes = baseline.get('routes', {}) if comparable else {}
+        for endpoint, result in results.items():
+            entry = {key: result[key] for key in ('queries', 'p50_ms', 'p95_ms', 'peak_kb')}
+            # Hand-set budgets survive baseline updates
+            if 'budget' in routes.get(endpoint, {}):
+                entry['budget'] = routes[endpoint]['budget']
+            routes[endpoint] = entry
+        with open(BASELINE, 'w') as f:
+            json.dump({'dataset': dataset, 'routes': dict(sorted(routes.items()))}, f, indent=2)
+            f.write('\n')
+        print(f'Baseline written to {os.path.relpath(BASELINE, ROOT)}')
+        return
+
+    if not comparable:
+        print('Dataset differs from the baseline; query budgets not enforced')
+    if failures:
+        print('\n'.join(['', 'Budget failures:'] + failures))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+"""Compare concurrent writes for different landlords on one database and on shards.
+
+Creates --landlords landlords, each with a property, a unit and a leased
+tenant, once in a single SQLite file and once spread over --shards shard
+files (SHARD_URLS). Then every tenant submits --requests maintenance
+requests at the same time from its own worker process, and the total throughput and
+per-request latency are printed for both layouts. A second round runs
+with SQLite's busy timeout at 0 and counts the writes that found the
+database locked by another landlord's write ("locked"). "cpu" is the CPU
+time the worker processes spent per request in the first round. Each
+layout runs in its own process because the shard configuration is read at
+import time.
+
+Reading the results: sharding removes lock collisions only between
+landlords on different shards, so with more landlords than shards the
+landlords sharing a shard still collide (about half of them with the
+defaults). It also costs CPU on every write: the routing lookup in the
+directory, the id sequence updates and the recipient lookup for
+notifications. When there are fewer cores than concurrent writers, as on
+a 1-CPU machine, throughput is bound by CPU and the sharded layout is
+slower than one file. Its p50 is higher too: with no lock to wait on, the
+writers are time-sliced on the core together, while on one file the lock
+holder runs alone and the waiters pay in p95. Expect sharding to pay off
+when writers have cores to run on and wait on each other's locks.
+
+    python benchmarks/sharding.py --landlords 8 --shards 4 --requests 50
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def seed(landlords):
+    from app import app, db, init_db
+    from models import User, Property, Unit, Lease
+    from sharding import place_landlord, route_tenant, use_shard
+
+    init_db()
+    with app.app_context():
+        for i in range(landlords):
+            landlord = User(username=f'landlord{i}', email=f'landlord{i}@roomtrack.com', password='bench', role='landlord')
+            tenant = User(username=f'tenant{i}', email=f'tenant{i}@roomtrack.com', password='bench', role='tenant')
+            db.session.add_all([landlord, tenant])
+            db.session.flush()
+            landlord_id, tenant_id = landlord.id, tenant.id
+            shard = place_landlord(landlord_id)
+            route_tenant(tenant_id, landlord_id)
+            db.session.commit()
+
+            with use_shard(shard):
+                prop = Property(name=f'Property {i}', address='Bench Road', total_units=1, occupied_units=1,
+                                landlord_id=landlord_id)
+                db.session.add(prop)
+                db.session.flush()
+                unit = Unit(unit_number='1', rent_amount=15000, status='occupied', property_id=prop.id)
+                db.session.add(unit)
+                db.session.flush()
+                db.session.add(Lease(tenant_id=tenant_id, unit_id=unit.id, start_date=date(2024, 1, 1),
+                                     end_date=date(2030, 12, 31), monthly_rent=15000, status='active'))
+                db.session.commit()
+
+
+def hammer(landlords, requests, no_wait):
+    # One worker process per tenant, as under a pre-forking server, so the
+    # processes only share the database files and not an interpreter lock
+    context = multiprocessing.get_context('fork')
+    start = context.Barrier(landlords + 1)
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    results = context.Queue()
+    workers = [context.Process(target=tenant_worker, args=(i, requests, no_wait, start, results)) for i in range(landlords)]
+    for worker in workers:
+        worker.start()
+    start.wait()
+    began = time.perf_counter()
+    latencies, errors = [], 0
+    for _ in workers:
+        worker_latencies, worker_errors = results.get()
+        latencies += worker_latencies
+        errors += worker_errors
+    elapsed = time.perf_counter() - began
+    for worker in workers:
+        worker.join()
+    finished = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu = finished.ru_utime + finished.ru_stime - usage.ru_utime - usage.ru_stime
+    return {'requests': len(latencies), 'errors': errors, 'seconds': elapsed, 'cpu': cpu * 1000 / len(latencies),
+            'p50': statistics.median(latencies), 'p95': sorted(latencies)[int(len(latencies) * 0.95) - 1]}
+
+
+def tenant_worker(i, requests, no_wait, start, results):
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+    from app import app, db
+
+    if no_wait:
+        # Fail instead of waiting for a lock, so every collision with another writer shows up
+        event.listen(Engine, 'connect', lambda dbapi_connection, record: dbapi_connection.execute('PRAGMA busy_timeout = 0'))
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+    client = app.test_client()
+    client.post('/login', data={'username': f'tenant{i}', 'password': 'bench'})
+    latencies, errors = [], 0
+    start.wait()
+    for n in range(requests):
+        began = time.perf_counter()
+        try:
+            # Without a busy timeout even the error page can find the database locked
+            ok = client.post('/tenant/submit-maintenance',
+                             json={'title': f'Request {n}', 'description': 'bench'}).status_code == 200
+        except Exception:
+            ok = False
+        latencies.append((time.perf_counter() - began) * 1000)
+        errors += not ok
+    results.put((latencies, errors))
+
+
+def run_layout(layout, directory, args):
+    env = dict(os.environ, DATABASE_URL=f'sqlite:///{os.path.join(directory, f"{layout}.db")}',
+               SQL_INSTRUMENTATION='0', METRICS_ENABLED='0', PROFILING_ENABLED='0')
+    env.pop('SHARD_URLS', None)
+    if layout == 'sharded':
+        env['SHARD_URLS'] = ','.join(f'sqlite:///{os.path.join(directory, f"shard{i}.db")}' for i in range(args.shards))
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), '--worker', str(args.landlords), str(args.requests)],
+                            cwd=ROOT, env=env, check=True, capture_output=True, text=True).stdout
+    return [json.loads(line) for line in output.strip().splitlines()[-2:]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--landlords', type=int, default=8)
+    parser.add_argument('--shards', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=50, help='maintenance requests per tenant')
+    parser.add_argument('--dir', help='where to create the database files (default: a temporary directory)')
+    parser.add_argument('--worker', nargs=2, type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        sys.path.insert(0, ROOT)
+        landlords, requests = args.worker
+        seed(landlords)
+        print(json.dumps(hammer(landlords, requests, no_wait=False)))
+        print(json.dumps(hammer(landlords, requests, no_wait=True)))
+        return
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+        print(f'{args.landlords} tenants of different landlords, {args.requests} writes each\n')
+        print(f'{"layout":<16} {"req/s":>8} {"p50":>9} {"p95":>9} {"errors":>7} {"locked":>9} {"cpu":>9}')
+        for layout in ('single', 'sharded'):
+            result, no_wait = run_layout(layout, tmp, args)
+            label = layout if layout == 'single' else f'{args.shards} shards'
+            print(f'{label:<16} {result["requests"] / result["seconds"]:>8.0f} {result["p50"]:>8.1f}ms '
+                  f'{result["p95"]:>8.1f}ms {result["errors"]:>7} {no_wait["errors"]:>4}/{no_wait["requests"]} '
+                  f'{result["cpu"]:>7.1f}ms')
+        print(f'\n{os.cpu_count()} CPU(s); see the module docstring for how to read these numbers')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""Time-to-first-byte and peak memory of the streamed table pages.
+
+Seeds one landlord with a long payment history (50k rows by default), then
+fetches /landlord/payments and /landlord/tenant-payments through the test
+client with streaming on and off, recording the time until the first chunk
+arrives, the total time, the number of chunks and, in a second pass, the
+peak Python memory while the response is consumed.
+
+    python benchmarks/streaming.py --rows 50000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PAGES = ['/landlord/payments', '/landlord/tenant-payments']
+
+
+def seed(rows, units):
+    from app import app, db, init_db
+    from models import User, Property, Unit, Lease, Payment
+
+    init_db()
+    with app.app_context():
+        landlord = User(username='bench', email='bench@roomtrack.com', password='bench', role='landlord')
+        db.session.add(landlord)
+        db.session.flush()
+        prop = Property(name='Bench Court', address='1 Bench Road', total_units=units,
+                        occupied_units=units, landlord_id=landlord.id)
+        db.session.add(prop)
+        db.session.flush()
+
+        tenants = [dict(id=landlord.id + 1 + i, username=f'tenant{i}', email=f'tenant{i}@bench', password='bench',
+                        role='tenant', full_name=f'Tenant {i}') for i in range(units)]
+        db.session.execute(User.__table__.insert(), tenants)
+        db.session.execute(Unit.__table__.insert(), [
+            dict(id=i + 1, unit_number=f'U{i:04d}', rent_amount=15000, status='occupied', property_id=prop.id)
+            for i in range(units)])
+        db.session.execute(Lease.__table__.insert(), [
+            dict(id=i + 1, tenant_id=tenants[i]['id'], unit_id=i + 1, start_date=date(2015, 1, 1),
+                 end_date=date(2030, 1, 1), monthly_rent=15000, security_deposit=0, status='active',
+                 created_at=datetime(2015, 1, 1))
+            for i in range(units)])
+
+        start = datetime(2015, 1, 1)
+        batch = []
+        for i in range(rows):
+            paid = start + timedelta(minutes=7 * i)
+            batch.append(dict(lease_id=i % units + 1, amount=15000, payment_date=paid.date(), due_date=paid.date(),
+                              transaction_code=f'BENCH{i:07d}', payment_method='mpesa',
+                              status='pending' if i % 20 == 0 else 'approved', receipt_generated=False,
+                              created_at=paid))
+            if len(batch) == 5000:
+                db.session.execute(Payment.__table__.insert(), batch)
+                batch = []
+        if batch:
+            db.session.execute(Payment.__table__.insert(), batch)
+        db.session.commit()
+
+
+def measure(client, path):
+    # Timed without tracemalloc, which slows rendering several times over
+    start = time.perf_counter()
+    response = client.get(path, buffered=False)
+    first = None
+    chunks = size = 0
+    for chunk in response.response:
+        if first is None:
+            first = time.perf_counter()
+        chunks += 1
+        size += len(chunk)
+    total = time.perf_counter()
+    response.close()
+
+    tracemalloc.start()
+    response = client.get(path, buffered=False)
+    for chunk in response.response:
+        pass
+    response.close()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'ttfb': (first - start) * 1000, 'total': (total - start) * 1000,
+            'chunks': chunks, 'size': size, 'peak': peak}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=50000)
+    parser.add_argument('--units', type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['DATABASE_URL'] = f'sqlite:///{os.path.join(tmp, "streaming.db")}'
+        os.environ['SQL_INSTRUMENTATION'] = '0'
+        sys.path.insert(0, ROOT)
+
+        started = time.perf_counter()
+        seed(args.rows, args.units)
+        print(f'Seeded {args.rows:,} payments in {time.perf_counter() - started:.1f}s\n')
+
+        from app import app
+        client = app.test_client()
+        client.post('/login', data={'username': 'bench', 'password': 'bench'})
+
+        print(f'{"page":<28}{"mode":<10}{"ttfb":>10}{"total":>11}{"chunks":>8}{"size":>10}{"peak mem":>11}')
+        for path in PAGES:
+            for mode, enabled in (('buffered', False), ('streamed', True)):
+                app.config['STREAM_PAGES'] = enabled
+                client.get(path).close()  # warm the template and statement caches
+                r = measure(client, path)
+                print(f'{path:<28}{mode:<10}{r["ttfb"]:>8.1f}ms{r["total"]:>9.1f}ms{r["chunks"]:>8}'
+                      f'{r["size"] / 1024 / 1024:>8.1f}MB{r["peak"] / 1024 / 1024:>9.1f}MB')
+
+
+if __name__ == '__main__':
+    main()
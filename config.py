@@ -1,6 +1,55 @@
 import os
+import tempfile
 
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'roomtrack-secret-key-2024'
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///roomtrack.db'
-    SQLALCHEMY_TRACK_MODIFICATIONS = False
\ No newline at end of file
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    NOTIFICATION_STREAM_INTERVAL = int(os.environ.get('NOTIFICATION_STREAM_INTERVAL', 5))
+    # Merge similar unread notifications updated within this many seconds into one digest (0 disables)
+    NOTIFICATION_COALESCE_WINDOW = int(os.environ.get('NOTIFICATION_COALESCE_WINDOW', 3600))
+    # Jinja bytecode: precompiled copy written by the deploy build (per Python version), then a writable cache
+    JINJA_PRECOMPILED_DIR = os.environ.get('JINJA_PRECOMPILED_DIR') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'jinja_cache')
+    JINJA_BYTECODE_CACHE_DIR = os.environ.get('JINJA_BYTECODE_CACHE_DIR') or os.path.join(tempfile.gettempdir(), 'roomtrack-jinja')
+    # Per-request SQL counts and Server-Timing header; warn when one statement repeats this often
+    SQL_INSTRUMENTATION = os.environ.get('SQL_INSTRUMENTATION', '1') != '0'
+    SQL_REPEAT_THRESHOLD = int(os.environ.get('SQL_REPEAT_THRESHOLD', 10))
+    # Statements slower than this are logged with their query plan
+    SLOW_QUERY_THRESHOLD_MS = float(os.environ.get('SLOW_QUERY_THRESHOLD_MS', 100))
+    SLOW_QUERY_LOG = os.environ.get('SLOW_QUERY_LOG') or os.path.join(tempfile.gettempdir(), 'roomtrack-logs', 'slow_queries.log')
+    SLOW_QUERY_LOG_MAX_BYTES = int(os.environ.get('SLOW_QUERY_LOG_MAX_BYTES', 5 * 1024 * 1024))
+    SLOW_QUERY_LOG_BACKUPS = int(os.environ.get('SLOW_QUERY_LOG_BACKUPS', 3))
+    SLOW_QUERY_EXPLAIN = os.environ.get('SLOW_QUERY_EXPLAIN', '1') != '0'
+    # Prometheus metrics at /metrics; METRICS_DIR shares them between worker processes
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') != '0'
+    METRICS_DIR = os.environ.get('METRICS_DIR')
+    METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', 5))
+    # Bearer token for scrapers; otherwise only admins can read /metrics (anyone in debug mode)
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+    # Request profiling: admins send `X-Profile: 1`; routes sampled 1 in N as 'endpoint:N,...'
+    PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', '1') != '0'
+    PROFILE_DIR = os.environ.get('PROFILE_DIR') or os.path.join(tempfile.gettempdir(), 'roomtrack-profiles')
+    PROFILE_SAMPLE_ROUTES = os.environ.get('PROFILE_SAMPLE_ROUTES', '')
+    PROFILE_MAX_PER_MINUTE = int(os.environ.get('PROFILE_MAX_PER_MINUTE', 6))
+    PROFILE_INTERVAL_MS = float(os.environ.get('PROFILE_INTERVAL_MS', 5))
+    # Retention: rows older than these are moved to the archive tables by `flask archive`
+    ARCHIVE_NOTIFICATIONS_AFTER_DAYS = int(os.environ.get('ARCHIVE_NOTIFICATIONS_AFTER_DAYS', 90))
+    ARCHIVE_MESSAGES_AFTER_DAYS = int(os.environ.get('ARCHIVE_MESSAGES_AFTER_DAYS', 180))
+    ARCHIVE_LEASES_AFTER_DAYS = int(os.environ.get('ARCHIVE_LEASES_AFTER_DAYS', 365))
+    ARCHIVE_CHUNK_SIZE = int(os.environ.get('ARCHIVE_CHUNK_SIZE', 1000))
+    # Long table pages are streamed, flushing every STREAM_FLUSH_ROWS rows
+    STREAM_PAGES = os.environ.get('STREAM_PAGES', '1') != '0'
+    STREAM_FLUSH_ROWS = int(os.environ.get('STREAM_FLUSH_ROWS', 100))
+    # Maintenance and message attachments, stored once per content hash under ATTACHMENT_DIR
+    ATTACHMENT_DIR = os.environ.get('ATTACHMENT_DIR') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'attachments')
+    ATTACHMENT_MAX_BYTES = int(os.environ.get('ATTACHMENT_MAX_BYTES', 10 * 1024 * 1024))
+    ATTACHMENT_MAX_PER_ITEM = int(os.environ.get('ATTACHMENT_MAX_PER_ITEM', 10))
+    ATTACHMENT_TYPES = os.environ.get('ATTACHMENT_TYPES', 'image/jpeg,image/png,image/gif,image/webp,application/pdf').split(',')
+    ATTACHMENT_CHUNK_BYTES = int(os.environ.get('ATTACHMENT_CHUNK_BYTES', 64 * 1024))
+    # Hand file downloads to the web server with X-Sendfile instead of reading them in the worker
+    USE_X_SENDFILE = os.environ.get('USE_X_SENDFILE') == '1'
+    # Per-landlord shards (see sharding.py): comma-separated SQLite URLs; the main database becomes the directory
+    SHARD_URLS = [url.strip() for url in os.environ.get('SHARD_URLS', '').split(',') if url.strip()]
+    SQLALCHEMY_BINDS = {f'shard{i}': url for i, url in enumerate(SHARD_URLS)}
+    # Seconds a landlord's requests are held off before their rows are copied to another shard
+    SHARD_MOVE_GRACE_SECONDS = float(os.environ.get('SHARD_MOVE_GRACE_SECONDS', 2))
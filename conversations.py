@@ -0,0 +1,132 @@
+from sqlalchemy import case, exists, func, insert, literal, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from models import db, Conversation, ConversationMember, Message
+
+# Conversation threads.
+# Every message belongs to the conversation of its two users. The
+# conversation keeps a copy of its latest message and each member row keeps
+# the member's unread count and the time of the latest message, indexed by
+# (user_id, last_message_at), so an inbox is one index range and never
+# touches the message table. send_message updates these fields in its own
+# transaction with single UPDATE statements, incrementing counters in SQL
+# so concurrent sends are not lost.
+
+PREVIEW_LENGTH = 200
+
+
+def conversation_between(user_id, other_id, now):
+    """The conversation of two users, created with both member rows on first use."""
+    low, high = sorted((user_id, other_id))
+    conversation = Conversation.query.filter_by(user_low_id=low, user_high_id=high).first()
+    if conversation is not None:
+        return conversation
+    try:
+        with db.session.begin_nested():
+            conversation = Conversation(user_low_id=low, user_high_id=high, created_at=now)
+            db.session.add(conversation)
+            db.session.flush()
+            db.session.add_all([ConversationMember(conversation_id=conversation.id, user_id=user, last_message_at=now)
+                                for user in (low, high)])
+    except IntegrityError:
+        # The other user started the same conversation at the same moment
+        conversation = Conversation.query.filter_by(user_low_id=low, user_high_id=high).one()
+    return conversation
+
+
+def record_message(conversation_id, message):
+    """Make a flushed message the conversation's latest and count it as unread for its receiver."""
+    db.session.execute(
+        update(Conversation)
+        .where(Conversation.id == conversation_id,
+               or_(Conversation.last_message_id.is_(None), Conversation.last_message_id < message.id))
+        .values(last_message_id=message.id, last_sender_id=message.sender_id, last_subject=message.subject,
+                last_preview=message.message[:PREVIEW_LENGTH], last_message_at=message.created_at),
+        execution_options={'synchronize_session': False}
+    )
+    db.session.execute(
+        update(ConversationMember)
+        .where(ConversationMember.conversation_id == conversation_id)
+        .values(unread_count=ConversationMember.unread_count
+                + case((ConversationMember.user_id == message.receiver_id, 1), else_=0),
+                last_message_at=case((ConversationMember.last_message_at > message.created_at,
+                                      ConversationMember.last_message_at), else_=message.created_at)),
+        execution_options={'synchronize_session': False}
+    )
+
+
+def mark_conversation_read(conversation_id, user_id):
+    """Mark the messages a user received in a conversation as read; returns how many changed."""
+    marked = db.session.execute(
+        update(Message)
+        .where(Message.conversation_id == conversation_id, Message.receiver_id == user_id, Message.is_read == False)
+        .values(is_read=True),
+        execution_options={'synchronize_session': False}
+    ).rowcount
+    if marked:
+        # Subtract rather than reset, so a message arriving meanwhile stays unread
+        db.session.execute(
+            update(ConversationMember)
+            .where(ConversationMember.conversation_id == conversation_id, ConversationMember.user_id == user_id)
+            .values(unread_count=ConversationMember.unread_count - marked),
+            execution_options={'synchronize_session': False}
+        )
+    return marked
+
+
+def backfill_conversations():
+    """Put messages without a conversation into one and rebuild the copied fields.
+
+    For messages from before threads existed and for bulk-loaded data; returns
+    the number of messages linked. The rebuild covers every conversation, so
+    it is meant for migrations and seeding, not for requests.
+    """
+    unlinked = (Message.conversation_id.is_(None), Message.sender_id != Message.receiver_id)
+    if not db.session.scalar(select(exists().where(*unlinked))):
+        return 0
+
+    low = case((Message.sender_id < Message.receiver_id, Message.sender_id), else_=Message.receiver_id)
+    high = case((Message.sender_id < Message.receiver_id, Message.receiver_id), else_=Message.sender_id)
+    pairs = select(low.label('low'), high.label('high'), func.min(Message.created_at).label('created_at'))\
+        .where(*unlinked).group_by(low, high).subquery()
+    db.session.execute(insert(Conversation).from_select(
+        ['user_low_id', 'user_high_id', 'created_at'],
+        select(pairs.c.low, pairs.c.high, pairs.c.created_at).where(~exists().where(
+            Conversation.user_low_id == pairs.c.low, Conversation.user_high_id == pairs.c.high))
+    ))
+    linked = db.session.execute(
+        update(Message).where(*unlinked).values(conversation_id=select(Conversation.id).where(
+            Conversation.user_low_id == low, Conversation.user_high_id == high).scalar_subquery()),
+        execution_options={'synchronize_session': False}
+    ).rowcount
+
+    db.session.execute(
+        update(Conversation).values(last_message_id=select(func.max(Message.id))
+                                    .where(Message.conversation_id == Conversation.id).scalar_subquery()),
+        execution_options={'synchronize_session': False}
+    )
+    latest = lambda column: select(column).where(Message.id == Conversation.last_message_id).scalar_subquery()
+    db.session.execute(
+        update(Conversation).values(
+            last_sender_id=latest(Message.sender_id), last_subject=latest(Message.subject),
+            last_preview=latest(func.substr(Message.message, 1, PREVIEW_LENGTH)),
+            last_message_at=latest(Message.created_at)),
+        execution_options={'synchronize_session': False}
+    )
+
+    for user_column in (Conversation.user_low_id, Conversation.user_high_id):
+        db.session.execute(insert(ConversationMember).from_select(
+            ['conversation_id', 'user_id', 'unread_count', 'last_message_at'],
+            select(Conversation.id, user_column, literal(0), Conversation.last_message_at).where(~exists().where(
+                ConversationMember.conversation_id == Conversation.id, ConversationMember.user_id == user_column))
+        ))
+    db.session.execute(
+        update(ConversationMember).values(
+            unread_count=select(func.count()).select_from(Message).where(
+                Message.conversation_id == ConversationMember.conversation_id,
+                Message.receiver_id == ConversationMember.user_id, Message.is_read == False).scalar_subquery(),
+            last_message_at=select(Conversation.last_message_at)
+            .where(Conversation.id == ConversationMember.conversation_id).scalar_subquery()),
+        execution_options={'synchronize_session': False}
+    )
+    db.session.commit()
+    return linked
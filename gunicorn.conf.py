@@ -0,0 +1,64 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+# Production server settings: `gunicorn -c gunicorn.conf.py`
+#
+# Signals to the master process:
+#   HUP   graceful reload: start new workers, then stop old ones once idle.
+#         With preload_app the code is not re-imported; use USR2 for deploys.
+#   USR2  re-exec a new master with the new code alongside the old one,
+#         then send WINCH and TERM to the old master for a zero-downtime deploy.
+#   TERM  graceful shutdown, waiting up to graceful_timeout for requests.
+
+wsgi_app = 'wsgi:application'
+bind = os.environ.get('ROOMTRACK_BIND', '0.0.0.0:5000')
+
+workers = int(os.environ.get('ROOMTRACK_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('ROOMTRACK_THREADS', 4))
+worker_class = 'gthread'
+
+# Recycle workers to cap memory growth; jitter keeps them from restarting together
+max_requests = int(os.environ.get('ROOMTRACK_MAX_REQUESTS', 1000))
+max_requests_jitter = int(os.environ.get('ROOMTRACK_MAX_REQUESTS_JITTER', max_requests // 10))
+
+timeout = int(os.environ.get('ROOMTRACK_TIMEOUT', 30))
+graceful_timeout = int(os.environ.get('ROOMTRACK_GRACEFUL_TIMEOUT', 30))
+keepalive = 5
+
+# Import the app, create tables and warm template caches once in the master;
+# workers inherit the warmed state copy-on-write
+preload_app = True
+
+# Workers share /metrics through per-process snapshot files
+os.environ.setdefault('METRICS_DIR', os.path.join(tempfile.gettempdir(), 'roomtrack-metrics'))
+
+accesslog = os.environ.get('ROOMTRACK_ACCESS_LOG', '-')
+errorlog = '-'
+loglevel = os.environ.get('ROOMTRACK_LOG_LEVEL', 'info')
+
+
+def on_starting(server):
+    # Snapshots from a previous run would be counted as dead workers' totals
+    shutil.rmtree(os.environ['METRICS_DIR'], ignore_errors=True)
+    os.makedirs(os.environ['METRICS_DIR'], exist_ok=True)
+
+
+def when_ready(server):
+    server.log.info('RoomTrack ready: %s workers x %s threads', workers, threads)
+
+
+def post_fork(server, worker):
+    # Each worker opens its own database connections, for every shard bind too
+    from models import db
+    from app import app
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+
+
+def worker_exit(server, worker):
+    # Write the final metrics snapshot; /metrics folds it into dead.json
+    import metrics
+    metrics.flush()
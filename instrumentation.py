@@ -0,0 +1,142 @@
+from flask import request, before_render_template, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from contextvars import ContextVar
+from time import perf_counter
+from streaming import when_sent
+
+# Per-request SQL instrumentation.
+# Counts statements and database time for each request, spots the same
+# statement shape repeating (the signature of an N+1 loop), and reports
+# db/render/total time in a Server-Timing header. A streamed page sends its
+# headers before its body has been queried or rendered, so its header only
+# has the time to the headers and the full figures are logged once the body
+# is complete. Recording a statement is a
+# couple of perf_counter() calls and a dict increment, cheap enough to leave
+# on in production; set SQL_INSTRUMENTATION = False to remove it. Statement
+# listeners (the query-time metric) time statements either way.
+
+_current = ContextVar('roomtrack_request_stats', default=None)
+
+
+class RequestStats:
+    __slots__ = ('start', 'queries', 'db_time', 'render_time', 'render_start', 'shapes', 'endpoint', 'token')
+
+    def __init__(self, endpoint):
+        self.start = perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.render_time = 0.0
+        self.render_start = None
+        self.shapes = {}
+        self.endpoint = endpoint
+        self.token = None
+
+    def server_timing(self):
+        total = (perf_counter() - self.start) * 1000
+        return (f'db;dur={self.db_time * 1000:.1f};desc="{self.queries} queries", '
+                f'render;dur={self.render_time * 1000:.1f}, total;dur={total:.1f}')
+
+    def log_streamed(self):
+        # Rendering a streamed page includes the queries its rows run
+        _logger.info('Streamed %s: %d queries, db %.1fms, render %.1fms, total %.1fms', self.endpoint, self.queries,
+                     self.db_time * 1000, self.render_time * 1000, (perf_counter() - self.start) * 1000)
+
+
+def current_stats():
+    """The RequestStats of the request being handled, or None."""
+    return _current.get()
+
+
+# Statement hooks; the listeners receive each statement after parameter binding
+# placeholders are in place, so the text itself is the statement's shape.
+_repeat_threshold = 10
+_statement_listeners = []
+_logger = None
+
+
+def add_statement_listener(listener):
+    """Call listener(statement, parameters, elapsed, stats, conn) after every statement.
+
+    Works with SQL_INSTRUMENTATION off too; stats is then None.
+    """
+    _statement_listeners.append(listener)
+    _time_statements()
+
+
+def _time_statements():
+    # Listening on the Engine class covers every engine the app creates
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('roomtrack_query_start', []).append(perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('roomtrack_query_start')
+    if not starts:
+        return
+    elapsed = perf_counter() - starts.pop()
+
+    stats = _current.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_time += elapsed
+        count = stats.shapes.get(statement, 0) + 1
+        stats.shapes[statement] = count
+        if count == _repeat_threshold:
+            _logger.warning('Possible N+1 in %s: statement repeated %d times: %s',
+                            stats.endpoint, count, ' '.join(statement.split()))
+
+    for listener in _statement_listeners:
+        listener(statement, parameters, elapsed, stats, conn)
+
+
+def init_instrumentation(app):
+    global _repeat_threshold, _logger
+    if not app.config.get('SQL_INSTRUMENTATION', True):
+        return
+
+    _repeat_threshold = app.config.get('SQL_REPEAT_THRESHOLD', 10)
+    _logger = app.logger
+
+    _time_statements()
+
+    @app.before_request
+    def start_request_stats():
+        stats = RequestStats(request.endpoint)
+        stats.token = _current.set(stats)
+
+    @app.after_request
+    def add_server_timing(response):
+        stats = _current.get()
+        if stats is not None and response.is_streamed:
+            headers = (perf_counter() - stats.start) * 1000
+            response.headers['Server-Timing'] = f'headers;dur={headers:.1f};desc="body streamed, not included"'
+            when_sent(response, stats.log_streamed)
+        elif stats is not None:
+            response.headers['Server-Timing'] = stats.server_timing()
+        return response
+
+    @app.teardown_request
+    def end_request_stats(exc):
+        stats = _current.get()
+        if stats is not None and stats.token is not None:
+            _current.reset(stats.token)
+
+    def render_started(sender, template, context, **extra):
+        stats = _current.get()
+        if stats is not None:
+            stats.render_start = perf_counter()
+
+    def render_finished(sender, template, context, **extra):
+        stats = _current.get()
+        if stats is not None and stats.render_start is not None:
+            stats.render_time += perf_counter() - stats.render_start
+            stats.render_start = None
+
+    before_render_template.connect(render_started, app, weak=False)
+    template_rendered.connect(render_finished, app, weak=False)
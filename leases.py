@@ -0,0 +1,225 @@
+from sqlalchemy import and_, case, exists, func, select, update
+from sqlalchemy.orm import aliased
+from datetime import date, timedelta
+from models import db, User, Property, Unit, Lease
+from notifications import notify
+
+# Lease lifecycle: start, end, expiry and renewal.
+# A unit is claimed with one conditional UPDATE (WHERE status = 'vacant')
+# whose rowcount says whether this request won it, and occupied_units is
+# changed with SQL increments, so concurrent assignments cannot double-book
+# a unit or lose a count without any lock held across the request.
+# Active leases whose end date has passed are flipped to 'expired' by the
+# expire-leases command in a handful of set-based UPDATEs (leases, their
+# units, the properties' occupied_units counters) rather than row by row.
+# Upcoming expirations are read through ix_lease_status_end. Bulk renewal
+# extends many leases, optionally changing the rent, in one transaction.
+
+EXPIRY_WINDOWS = (30, 60, 90)
+MAX_RENEWALS = 1000
+
+
+def add_months(day, months):
+    month = day.month - 1 + months
+    year, month = day.year + month // 12, month % 12 + 1
+    # The 31st of a short month becomes its last day
+    last_day = ((date(year, month, 28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)).day
+    return day.replace(year=year, month=month, day=min(day.day, last_day))
+
+
+def start_lease(tenant_id, unit, start_date, end_date, monthly_rent, security_deposit=0):
+    """Lease a unit to a tenant if it is still vacant; returns the lease, or None when it is not.
+
+    The caller commits, or rolls back on None.
+    """
+    claimed = db.session.execute(
+        update(Unit).where(Unit.id == unit.id, Unit.status == 'vacant')
+        .values(status='occupied', version=Unit.version + 1),
+        execution_options={'synchronize_session': False}
+    ).rowcount
+    if not claimed:
+        return None
+    db.session.execute(
+        update(Property).where(Property.id == unit.property_id)
+        .values(occupied_units=Property.occupied_units + 1),
+        execution_options={'synchronize_session': False}
+    )
+    lease = Lease(tenant_id=tenant_id, unit_id=unit.id, start_date=start_date, end_date=end_date,
+                  monthly_rent=monthly_rent, security_deposit=security_deposit, status='active')
+    db.session.add(lease)
+
+    from occupancy import invalidate_occupancy
+
+    invalidate_occupancy([unit.property_id], start_date)
+    # The unit row changed behind the ORM's back
+    db.session.expire(unit, ['status', 'version'])
+    return lease
+
+
+def end_lease(lease, today):
+    """End an active lease today and free its unit; returns False when it was no longer active.
+
+    The caller commits.
+    """
+    lease_id, unit_id, property_id = lease.id, lease.unit_id, lease.unit.property_id
+    since = min(lease.end_date, today)
+    ended = db.session.execute(
+        update(Lease).where(Lease.id == lease_id, Lease.status == 'active').values(status='ended', end_date=today),
+        execution_options={'synchronize_session': False}
+    ).rowcount
+    if not ended:
+        return False
+    current = aliased(Lease)
+    freed = db.session.execute(
+        update(Unit).where(
+            Unit.id == unit_id, Unit.status == 'occupied',
+            ~exists().where(current.unit_id == Unit.id, current.status == 'active')
+        ).values(status='vacant', version=Unit.version + 1),
+        execution_options={'synchronize_session': False}
+    ).rowcount
+    if freed:
+        db.session.execute(
+            update(Property).where(Property.id == property_id)
+            .values(occupied_units=Property.occupied_units - 1),
+            execution_options={'synchronize_session': False}
+        )
+
+    from occupancy import invalidate_occupancy
+
+    invalidate_occupancy([property_id], since)
+    db.session.expire(lease, ['status', 'end_date'])
+    db.session.expire(lease.unit, ['status', 'version'])
+    return True
+
+
+def expiring_leases_query(landlord_id, today, days, property_ids=None):
+    """Active leases of a landlord ending within days of today, including overdue ones."""
+    query = db.session.query(Lease, User, Unit.unit_number, Property.id, Property.name)\
+        .join(Unit, Unit.id == Lease.unit_id)\
+        .join(Property, Property.id == Unit.property_id)\
+        .join(User, User.id == Lease.tenant_id)\
+        .filter(Lease.status == 'active', Lease.end_date <= today + timedelta(days=days),
+                Property.landlord_id == landlord_id)
+    if property_ids:
+        query = query.filter(Property.id.in_(property_ids))
+    return query
+
+
+def expiry_summary(landlord_id, today, property_ids=None):
+    """Per property: active leases already past their end date and ending within each window."""
+    buckets = [func.sum(case((Lease.end_date < today, 1), else_=0)).label('overdue')]
+    for window in EXPIRY_WINDOWS:
+        buckets.append(func.sum(case((and_(Lease.end_date >= today, Lease.end_date <= today + timedelta(days=window)), 1),
+                                     else_=0)).label(f'within_{window}'))
+    query = db.session.query(Property.id, Property.name, *buckets)\
+        .join(Unit, Unit.property_id == Property.id)\
+        .join(Lease, Lease.unit_id == Unit.id)\
+        .filter(Lease.status == 'active', Lease.end_date <= today + timedelta(days=max(EXPIRY_WINDOWS)),
+                Property.landlord_id == landlord_id)
+    if property_ids:
+        query = query.filter(Property.id.in_(property_ids))
+    return [{
+        'property_id': property_id,
+        'property_name': name,
+        'overdue': overdue,
+        **{f'within_{window}': count for window, count in zip(EXPIRY_WINDOWS, counts)}
+    } for property_id, name, overdue, *counts in query.group_by(Property.id, Property.name).order_by(Property.name)]
+
+
+def expire_leases(today=None, dry_run=False):
+    """Mark active leases past their end date as expired and free their units.
+
+    Returns {'leases': n, 'units': n, 'properties': n}.
+    """
+    today = today or date.today()
+    overdue = and_(Lease.status == 'active', Lease.end_date < today)
+    if dry_run:
+        return {'leases': db.session.scalar(select(func.count()).select_from(Lease).where(overdue))}
+
+    # Earliest lapsed end date per property, for the occupancy cache, and expiries per landlord
+    affected = db.session.execute(
+        select(Unit.property_id, Property.landlord_id, func.min(Lease.end_date), func.count())
+        .join(Unit, Unit.id == Lease.unit_id).join(Property, Property.id == Unit.property_id)
+        .where(overdue).group_by(Unit.property_id, Property.landlord_id)
+    ).all()
+    if not affected:
+        return {'leases': 0, 'units': 0, 'properties': 0}
+    property_ids = [property_id for property_id, _, _, _ in affected]
+
+    # A unit stays occupied while another of its leases is still running
+    current = aliased(Lease)
+    units = db.session.execute(
+        update(Unit).where(
+            Unit.status == 'occupied',
+            Unit.id.in_(select(Lease.unit_id).where(overdue)),
+            ~exists().where(current.unit_id == Unit.id, current.status == 'active', current.end_date >= today)
+        ).values(status='vacant', version=Unit.version + 1),
+        execution_options={'synchronize_session': False}
+    ).rowcount
+    leases = db.session.execute(
+        update(Lease).where(overdue).values(status='expired'),
+        execution_options={'synchronize_session': False}
+    ).rowcount
+    db.session.execute(
+        update(Property).where(Property.id.in_(property_ids)).values(occupied_units=(
+            select(func.count()).select_from(Unit)
+            .where(Unit.property_id == Property.id, Unit.status == 'occupied').scalar_subquery()
+        )),
+        execution_options={'synchronize_session': False}
+    )
+
+    from occupancy import invalidate_occupancy
+
+    # Cached months counted the lapsed leases as occupied up to the day they were computed
+    for property_id, _, since, _ in affected:
+        invalidate_occupancy([property_id], since)
+
+    expired_by_landlord = {}
+    for _, landlord_id, _, count in affected:
+        expired_by_landlord[landlord_id] = expired_by_landlord.get(landlord_id, 0) + count
+    for landlord_id, count in expired_by_landlord.items():
+        notify(landlord_id, 'lease_expired', 'Leases Expired',
+               f'{count} lease(s) reached their end date and were marked expired.')
+
+    db.session.commit()
+    return {'leases': leases, 'units': units, 'properties': len(property_ids)}
+
+
+def renew_leases(landlord_id, lease_ids, end_date=None, months=None, monthly_rent=None, rent_change_percent=None):
+    """Extend active leases of a landlord, optionally changing the rent, in one transaction.
+
+    Either end_date (a new end date for every lease) or months (added to each
+    lease's own end date) is required. Returns (renewed rows, error message).
+    """
+    lease_ids = set(lease_ids)
+    rows = db.session.execute(
+        select(Lease.id, Lease.tenant_id, Lease.end_date, Lease.monthly_rent, Unit.unit_number)
+        .join(Unit, Unit.id == Lease.unit_id).join(Property, Property.id == Unit.property_id)
+        .where(Lease.id.in_(lease_ids), Lease.status == 'active', Property.landlord_id == landlord_id)
+    ).all()
+    missing = lease_ids - {row.id for row in rows}
+    if missing:
+        return None, f'Leases not found or not active: {sorted(missing)}'
+
+    changes = []
+    for row in rows:
+        new_end = end_date if end_date is not None else add_months(row.end_date, months)
+        if new_end <= row.end_date:
+            return None, f'Lease {row.id} already ends on {row.end_date.isoformat()}'
+        rent = row.monthly_rent
+        if monthly_rent is not None:
+            rent = monthly_rent
+        elif rent_change_percent is not None:
+            rent = round(rent * (1 + rent_change_percent / 100), 2)
+        changes.append({'id': row.id, 'end_date': new_end, 'monthly_rent': rent})
+
+    # One executemany UPDATE by primary key. Occupancy history is unaffected:
+    # an active lease already counts as occupied up to today.
+    db.session.execute(update(Lease), changes)
+    for row, change in zip(rows, changes):
+        notify(row.tenant_id, 'lease_renewed', 'Lease Renewed',
+               f'Your lease for unit {row.unit_number} now ends on {change["end_date"].isoformat()} '
+               f'at a monthly rent of {change["monthly_rent"]:,.2f}.',
+               ref=('lease', row.id))
+    db.session.commit()
+    return changes, None
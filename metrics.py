@@ -0,0 +1,313 @@
+from flask import g, request
+from time import perf_counter, sleep
+from streaming import when_sent
+import fcntl
+import json
+import logging
+import os
+import threading
+
+# In-process metrics with Prometheus text exposition.
+# Recording a metric is a dict update under a lock. With several worker
+# processes (gunicorn), set METRICS_DIR: a background thread in each process
+# writes a snapshot of its values to <METRICS_DIR>/<pid>.json every
+# METRICS_FLUSH_INTERVAL seconds, and /metrics sums the snapshots of all
+# workers. Counters and histograms of exited workers are
+# folded into dead.json so totals never go backwards; gauges only count live
+# processes.
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_lock = threading.Lock()
+_registry = {}
+_collectors = []
+_store = {'directory': None, 'interval': 5, 'flusher': None}
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        _registry[name] = self
+
+    def empty(self):
+        return 0
+
+    def merge(self, current, value):
+        return current + value
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, *labelvalues, amount=1):
+        with _lock:
+            self.values[labelvalues] = self.values.get(labelvalues, 0) + amount
+
+
+class Gauge(Metric):
+    # Summed over live processes
+    kind = 'gauge'
+
+    def inc(self, *labelvalues, amount=1):
+        with _lock:
+            self.values[labelvalues] = self.values.get(labelvalues, 0) + amount
+
+    def dec(self, *labelvalues, amount=1):
+        self.inc(*labelvalues, amount=-amount)
+
+    def set(self, value, *labelvalues):
+        with _lock:
+            self.values[labelvalues] = value
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def empty(self):
+        # Per-bucket counts, then +Inf, sum and count
+        return [0] * (len(self.buckets) + 1) + [0.0, 0]
+
+    def merge(self, current, value):
+        return [a + b for a, b in zip(current, value)]
+
+    def observe(self, value, *labelvalues):
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = i
+                break
+        with _lock:
+            series = self.values.get(labelvalues)
+            if series is None:
+                series = self.values[labelvalues] = self.empty()
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+
+REQUESTS = Counter('roomtrack_http_requests_total', 'HTTP requests', ('endpoint', 'method', 'status'))
+REQUEST_LATENCY = Histogram('roomtrack_http_request_duration_seconds', 'Time to produce the response, including a streamed body',
+                            ('endpoint', 'method', 'status'))
+IN_PROGRESS = Gauge('roomtrack_http_requests_in_progress', 'Requests being handled')
+DB_QUERIES = Histogram('roomtrack_db_query_duration_seconds', 'SQL statement execution time',
+                       buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1.0))
+DB_POOL = Gauge('roomtrack_db_pool_connections', 'Database connections held by the pool', ('state',))
+CACHE_LOOKUPS = Counter('roomtrack_cache_lookups_total', 'Cache lookups', ('cache', 'result'))
+EVENTS = Counter('roomtrack_events_total', 'Business events', ('event',))
+
+
+def record_event(event):
+    EVENTS.inc(event)
+
+
+def record_cache(cache, hit):
+    CACHE_LOOKUPS.inc(cache, 'hit' if hit else 'miss')
+
+
+def add_collector(collector):
+    """Call collector() before each snapshot, to sample gauges such as pool usage."""
+    _collectors.append(collector)
+
+
+def _reset_after_fork():
+    # A forked worker starts from zero; the parent's values are in its own file
+    global _lock
+    _lock = threading.Lock()
+    for metric in _registry.values():
+        metric.values = {}
+    _store['flusher'] = None
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def snapshot():
+    for collector in _collectors:
+        collector()
+    with _lock:
+        return {name: [[list(labels), value] for labels, value in metric.values.items()]
+                for name, metric in _registry.items()}
+
+
+def _write_json(path, data):
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+def flush():
+    directory = _store['directory']
+    if directory:
+        _write_json(os.path.join(directory, f'{os.getpid()}.json'), snapshot())
+
+
+def _flush_periodically():
+    while True:
+        sleep(_store['interval'])
+        try:
+            flush()
+        except Exception:
+            logging.getLogger(__name__).exception('Could not write metrics snapshot')
+
+
+def ensure_flusher():
+    # Started lazily so that each forked worker gets its own thread
+    if _store['directory'] and _store['flusher'] is None:
+        _store['flusher'] = threading.Thread(target=_flush_periodically, name='metrics-flush', daemon=True)
+        _store['flusher'].start()
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _merge_into(totals, data, include_gauges=True):
+    for name, series in data.items():
+        metric = _registry.get(name)
+        if metric is None or (metric.kind == 'gauge' and not include_gauges):
+            continue
+        values = totals.setdefault(name, {})
+        for labels, value in series:
+            key = tuple(labels)
+            values[key] = metric.merge(values.get(key, metric.empty()), value)
+
+
+def _collect_directory(directory):
+    totals = {}
+    with open(os.path.join(directory, 'lock'), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        dead_path = os.path.join(directory, 'dead.json')
+        dead = {}
+        _merge_into(dead, _read_json(dead_path), include_gauges=False)
+        retired = []
+        for filename in os.listdir(directory):
+            pid, ext = os.path.splitext(filename)
+            if ext != '.json' or not pid.isdigit():
+                continue
+            path = os.path.join(directory, filename)
+            if _pid_alive(int(pid)):
+                _merge_into(totals, _read_json(path))
+            else:
+                _merge_into(dead, _read_json(path), include_gauges=False)
+                retired.append(path)
+        if retired:
+            _write_json(dead_path, {name: [[list(k), v] for k, v in values.items()]
+                                    for name, values in dead.items()})
+            for path in retired:
+                os.remove(path)
+    for name, values in dead.items():
+        _merge_into(totals, {name: [[list(k), v] for k, v in values.items()]})
+    return totals
+
+
+def collect():
+    """Values of every metric, summed over all worker processes."""
+    if _store['directory']:
+        flush()
+        return _collect_directory(_store['directory'])
+    totals = {}
+    _merge_into(totals, snapshot())
+    return totals
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)] + list(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value)) if abs(value) < 1e15 else repr(value)
+    return repr(value)
+
+
+def render_metrics():
+    totals = collect()
+    lines = []
+    for name, metric in _registry.items():
+        lines.append(f'# HELP {name} {metric.documentation}')
+        lines.append(f'# TYPE {name} {metric.kind}')
+        for labels, value in sorted(totals.get(name, {}).items()):
+            if metric.kind == 'histogram':
+                cumulative = 0
+                for bound, count in zip(metric.buckets + ('+Inf',), value):
+                    cumulative += count
+                    le = 'le="+Inf"' if bound == '+Inf' else f'le="{bound}"'
+                    lines.append(f'{name}_bucket{_labels(metric.labelnames, labels, [le])} {cumulative}')
+                lines.append(f'{name}_sum{_labels(metric.labelnames, labels)} {_number(value[-2])}')
+                lines.append(f'{name}_count{_labels(metric.labelnames, labels)} {value[-1]}')
+            else:
+                lines.append(f'{name}{_labels(metric.labelnames, labels)} {_number(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+def init_metrics(app):
+    if not app.config.get('METRICS_ENABLED', True):
+        return
+
+    directory = app.config.get('METRICS_DIR')
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    _store['directory'] = directory
+    _store['interval'] = app.config.get('METRICS_FLUSH_INTERVAL', 5)
+
+    @app.before_request
+    def start_request_metrics():
+        ensure_flusher()
+        g.metrics_start = perf_counter()
+        IN_PROGRESS.inc()
+
+    @app.after_request
+    def record_request_metrics(response):
+        start = g.get('metrics_start')
+        if start is not None:
+            labels = (request.endpoint or 'unmatched', request.method, str(response.status_code))
+            REQUESTS.inc(*labels)
+            when_sent(response, lambda: REQUEST_LATENCY.observe(perf_counter() - start, *labels))
+        return response
+
+    @app.teardown_request
+    def finish_request_metrics(exc):
+        if g.pop('metrics_start', None) is not None:
+            IN_PROGRESS.dec()
+
+    def sample_pool():
+        # The engine belongs to the app; snapshots may run outside a request
+        with app.app_context():
+            pool = app.extensions['sqlalchemy'].engine.pool
+            if hasattr(pool, 'checkedout'):
+                DB_POOL.set(pool.checkedout(), 'checked_out')
+                DB_POOL.set(pool.checkedin(), 'idle')
+
+    add_collector(sample_pool)
+
+    from instrumentation import add_statement_listener
+    add_statement_listener(lambda statement, parameters, elapsed, stats, conn: DB_QUERIES.observe(elapsed))
@@ -1,21 +1,23 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.orm import foreign
 from flask_login import UserMixin
+from sharding import RoutingSession
 from datetime import datetime
 import json
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
     password = db.Column(db.String(200), nullable=False)
-    role = db.Column(db.String(20), nullable=False)  # admin, landlord, tenant
+    role = db.Column(db.String(20), nullable=False, index=True)  # admin, landlord, tenant
     full_name = db.Column(db.String(200))
     id_number = db.Column(db.String(50))
     passport_number = db.Column(db.String(50))
     phone = db.Column(db.String(20))
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     
     # Relationships
     landlord_properties = db.relationship('Property', backref='landlord', lazy=True)
@@ -37,12 +39,21 @@ class Property(db.Model):
 class Unit(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     unit_number = db.Column(db.String(50), nullable=False)
+    unit_name = db.Column(db.String(200))
     rent_amount = db.Column(db.Float, nullable=False)
     status = db.Column(db.String(20), default='vacant')  # vacant, occupied
     bedrooms = db.Column(db.Integer, default=1)
     bathrooms = db.Column(db.Integer, default=1)
     square_feet = db.Column(db.Integer)
     property_id = db.Column(db.Integer, db.ForeignKey('property.id'), nullable=False)
+    # Bumped on every change; ORM updates of a unit changed meanwhile raise StaleDataError
+    version = db.Column(db.Integer, nullable=False, server_default='0')
+    
+    __table_args__ = (
+        db.Index('ix_unit_property_number', 'property_id', 'unit_number'),
+        db.Index('ix_unit_status_property_rent', 'status', 'property_id', 'rent_amount'),
+    )
+    __mapper_args__ = {'version_id_col': version}
     
     # Relationships
     leases = db.relationship('Lease', backref='unit', lazy=True, cascade='all, delete-orphan')
@@ -59,6 +70,12 @@ class Lease(db.Model):
     status = db.Column(db.String(20), default='active')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    __table_args__ = (
+        db.Index('ix_lease_tenant_status', 'tenant_id', 'status'),
+        db.Index('ix_lease_unit_status', 'unit_id', 'status'),
+        db.Index('ix_lease_status_end', 'status', 'end_date'),
+    )
+    
     # Relationship
     payments = db.relationship('Payment', backref='lease', lazy=True, cascade='all, delete-orphan')
 
@@ -73,6 +90,10 @@ class Payment(db.Model):
     status = db.Column(db.String(20), default='pending')  # pending, approved, rejected
     receipt_generated = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_payment_lease_status_due', 'lease_id', 'status', 'due_date'),
+    )
 
 class MaintenanceRequest(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -85,6 +106,10 @@ class MaintenanceRequest(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    __table_args__ = (
+        db.Index('ix_maintenance_request_unit_created', 'unit_id', 'created_at'),
+    )
+    
     # Relationships are defined in User and Unit models
 
 class Message(db.Model):
@@ -95,11 +120,44 @@ class Message(db.Model):
     message = db.Column(db.Text, nullable=False)
     is_read = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    conversation_id = db.Column(db.Integer, db.ForeignKey('conversation.id'))
+    
+    __table_args__ = (
+        db.Index('ix_message_conversation_created', 'conversation_id', 'created_at'),
+    )
     
     # Relationships
     sender = db.relationship('User', foreign_keys=[sender_id], backref='sent_messages')
     receiver = db.relationship('User', foreign_keys=[receiver_id], backref='received_messages')
 
+class Conversation(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    # Lower user id first, so two users share exactly one conversation
+    user_low_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_high_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    # Copied from the latest message when it is sent (see conversations.py)
+    last_message_id = db.Column(db.Integer)
+    last_sender_id = db.Column(db.Integer)
+    last_subject = db.Column(db.String(200))
+    last_preview = db.Column(db.String(200))
+    last_message_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.UniqueConstraint('user_low_id', 'user_high_id', name='uq_conversation_users'),
+    )
+
+class ConversationMember(db.Model):
+    conversation_id = db.Column(db.Integer, db.ForeignKey('conversation.id'), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    unread_count = db.Column(db.Integer, nullable=False, default=0)
+    # The conversation's last_message_at, repeated here so an inbox is one index range
+    last_message_at = db.Column(db.DateTime, nullable=False)
+    
+    __table_args__ = (
+        db.Index('ix_conversation_member_inbox', 'user_id', 'last_message_at', 'conversation_id'),
+    )
+
 class Notification(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -108,6 +166,89 @@ class Notification(db.Model):
     type = db.Column(db.String(50), nullable=False)  # payment_due, payment_approved, maintenance, etc.
     is_read = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Digests: similar notifications are merged into one row (see notifications.py)
+    count = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    refs = db.Column(db.Text)  # JSON list of [kind, id] for the entities the notification is about
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    
+    __table_args__ = (
+        db.Index('ix_notification_user_unread_updated', 'user_id', 'is_read', 'updated_at'),
+        db.Index('ix_notification_user_unread_id', 'user_id', 'is_read', 'id'),
+        # The id is the stream position, so SQLite must never hand out a deleted row's id again
+        {'sqlite_autoincrement': True},
+    )
     
     # Relationship
-    user = db.relationship('User', backref='notifications')
\ No newline at end of file
+    user = db.relationship('User', backref='notifications')
+    
+    @property
+    def ref_list(self):
+        return json.loads(self.refs) if self.refs else []
+
+class ShardAssignment(db.Model):
+    # Directory routing (see sharding.py): a landlord and their tenants share the landlord's shard
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    landlord_id = db.Column(db.Integer, nullable=False, index=True)
+    shard = db.Column(db.Integer)  # None while the data is still in the directory database
+    moving = db.Column(db.Boolean, nullable=False, default=False)
+
+class ShardSequence(db.Model):
+    # Next block of ids per table in this database (see sharding.allocate_ids)
+    name = db.Column(db.String(50), primary_key=True)
+    next_value = db.Column(db.Integer, nullable=False)
+
+
+# Archive tables (see archive.py): the hot table's columns plus archived_at,
+# no foreign keys or unique constraints, only the indexes the history views need
+def _archive_table(source, indexes):
+    columns = [db.Column(c.name, c.type, primary_key=c.primary_key, autoincrement=False) for c in source.columns]
+    table = db.Table(f'archived_{source.name}', db.metadata, *columns, db.Column('archived_at', db.DateTime, nullable=False))
+    for columns in indexes:
+        db.Index(f'ix_archived_{source.name}_{"_".join(columns)}', *(table.c[name] for name in columns))
+    return table
+
+class ArchivedLease(db.Model):
+    __table__ = _archive_table(Lease.__table__, [('tenant_id',), ('unit_id',)])
+
+class ArchivedPayment(db.Model):
+    __table__ = _archive_table(Payment.__table__, [('lease_id',)])
+
+class ArchivedMessage(db.Model):
+    __table__ = _archive_table(Message.__table__, [('sender_id', 'created_at'), ('receiver_id', 'created_at')])
+    
+    sender = db.relationship(User, primaryjoin=lambda: foreign(ArchivedMessage.sender_id) == User.id, viewonly=True)
+    receiver = db.relationship(User, primaryjoin=lambda: foreign(ArchivedMessage.receiver_id) == User.id, viewonly=True)
+
+class ArchivedNotification(db.Model):
+    __table__ = _archive_table(Notification.__table__, [('user_id', 'created_at')])
+
+class OccupancyMonth(db.Model):
+    # Cached monthly occupancy for closed months (see occupancy.py)
+    __tablename__ = 'occupancy_month'
+    
+    property_id = db.Column(db.Integer, primary_key=True)
+    month = db.Column(db.Date, primary_key=True)
+    units = db.Column(db.Integer, nullable=False)
+    unit_days = db.Column(db.Integer, nullable=False)
+    occupied_days = db.Column(db.Integer, nullable=False)
+    move_ins = db.Column(db.Integer, nullable=False)
+    move_outs = db.Column(db.Integer, nullable=False)
+    computed_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class Attachment(db.Model):
+    # Uploaded file metadata; the bytes live under ATTACHMENT_DIR (see attachments.py)
+    __tablename__ = 'attachment'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    owner_type = db.Column(db.String(30), nullable=False)  # maintenance_request, message
+    owner_id = db.Column(db.Integer, nullable=False)
+    sha256 = db.Column(db.String(64), nullable=False, index=True)
+    filename = db.Column(db.String(255), nullable=False)
+    content_type = db.Column(db.String(100), nullable=False)
+    size = db.Column(db.Integer, nullable=False)
+    uploaded_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_attachment_owner', 'owner_type', 'owner_id'),
+    )
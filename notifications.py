@@ -0,0 +1,109 @@
+from flask import current_app, g
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+from datetime import datetime, timedelta
+from models import db, Notification
+from sharding import RoutingSession, allocate_ids, shard_engine, shard_slot, sharding_enabled, user_shard
+import json
+
+# Notification coalescing.
+# Notifications of a digest type are merged into the recipient's latest
+# unread notification of the same type when it was updated within
+# NOTIFICATION_COALESCE_WINDOW seconds: the count goes up, the entity is
+# appended to the refs and the message becomes a summary. The merged digest
+# is written as a new row that replaces the old one, so every change a
+# stream has to deliver is an insert and streams follow notifications by
+# id. Ids come from the database's own autoincrement (or, when sharding,
+# from the shard's id sequence) and SQLite lets one writer at a time hold
+# the database, so ids become visible in the order they were handed out.
+#
+# With sharding, a notification is written to the recipient's database. When
+# that is not the database the request is routed to, it is written there in
+# a transaction of its own once the request's commit has succeeded.
+
+# type -> summary used once a notification stands for more than one event
+DIGEST_MESSAGES = {
+    'payment_submitted': '{count} payments were submitted. Latest: {message}',
+    'payment_updated': '{count} payments were updated. Latest: {message}',
+    'maintenance_request': '{count} new maintenance requests. Latest: {message}',
+    'maintenance_update': '{count} maintenance requests were updated. Latest: {message}',
+    'new_message': 'You have {count} new messages. Latest: {message}'
+}
+MAX_REFS = 50
+
+
+def notify(user_id, type, title, message, ref=None):
+    """Add a notification for user_id, merging it into a recent digest when possible.
+
+    ref is a (kind, id) pair such as ('payment', 12). The caller commits.
+    Returns None when the recipient is on another shard; the notification
+    is written there after the commit.
+    """
+    if sharding_enabled():
+        shard = user_shard(user_id)
+        if shard != g.get('shard'):
+            db.session.info.setdefault('remote_notifications', []).append(
+                (shard, (user_id, type, title, message, ref)))
+            return None
+    return add_notification(db.session, user_id, type, title, message, ref)
+
+
+def add_notification(session, user_id, type, title, message, ref=None):
+    now = datetime.utcnow()
+    window = current_app.config.get('NOTIFICATION_COALESCE_WINDOW', 0)
+    refs = [list(ref)] if ref else []
+
+    if window and type in DIGEST_MESSAGES:
+        digest = session.scalars(
+            select(Notification).where(
+                Notification.user_id == user_id,
+                Notification.is_read == False,
+                Notification.type == type,
+                Notification.updated_at >= now - timedelta(seconds=window)
+            ).order_by(Notification.updated_at.desc()).limit(1)
+        ).first()
+        if digest is not None:
+            count = digest.count + 1
+            notification = Notification(user_id=user_id, title=digest.title, type=type, count=count,
+                                        message=DIGEST_MESSAGES[type].format(count=count, message=message),
+                                        refs=json.dumps((digest.ref_list + refs)[-MAX_REFS:]),
+                                        created_at=digest.created_at, updated_at=now)
+            session.add(notification)
+            session.delete(digest)
+            return notification
+
+    notification = Notification(user_id=user_id, title=title, message=message, type=type,
+                                refs=json.dumps(refs) if refs else None, created_at=now, updated_at=now)
+    session.add(notification)
+    return notification
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def deliver_remote_notifications(session):
+    for shard, args in session.info.pop('remote_notifications', ()):
+        with Session(shard_engine(shard)) as remote:
+            notification = add_notification(remote, *args)
+            notification.id = allocate_ids('notification', 1, remote, shard_slot(shard))[0]
+            remote.commit()
+
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def drop_remote_notifications(session):
+    session.info.pop('remote_notifications', None)
+
+
+def stream_cursor(notification):
+    """SSE event id: the notification's id, which is its stream position."""
+    return str(notification.id)
+
+
+def parse_stream_cursor(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def changed_since(cursor):
+    """Condition for notifications created, or digests merged, after stream position cursor."""
+    return Notification.id > cursor
@@ -0,0 +1,254 @@
+from sqlalchemy import and_, delete, insert, or_, select, union_all
+from sqlalchemy.exc import IntegrityError
+from datetime import date, datetime, timedelta
+from itertools import accumulate
+from models import db, Property, Unit, Lease, ArchivedLease, OccupancyMonth
+
+# Historical occupancy from lease intervals.
+# Each unit's leases (hot and archived) are merged into occupied intervals;
+# back-to-back leases count as continuous occupancy. A property's daily
+# occupied-unit counts come from a sweep over those intervals (+1 on the
+# first day, -1 after the last) instead of a query per day. An active lease
+# runs at least until today. Unit counts are the property's current units.
+# Monthly figures for closed months are cached in occupancy_month and
+# dropped by invalidate_occupancy() when a lease changes.
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def next_month(day):
+    return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def months_between(start, end):
+    """First days of the months from start's month through end's month."""
+    months = []
+    month = month_start(start)
+    while month <= end:
+        months.append(month)
+        month = next_month(month)
+    return months
+
+
+def merge_intervals(intervals):
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1] + timedelta(days=1):
+            if end > merged[-1][1]:
+                merged[-1][1] = end
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def load_units(property_ids):
+    """(unit id -> property id, unit id -> unit number)"""
+    rows = db.session.execute(
+        select(Unit.id, Unit.property_id, Unit.unit_number).where(Unit.property_id.in_(property_ids))
+    ).all()
+    return {unit_id: property_id for unit_id, property_id, _ in rows}, {unit_id: number for unit_id, _, number in rows}
+
+
+def load_intervals(unit_property, start, end, today):
+    """Merged occupied intervals per unit for leases overlapping [start, end]."""
+    property_ids = set(unit_property.values())
+    queries = []
+    for lease_model in (Lease, ArchivedLease):
+        queries.append(
+            select(lease_model.unit_id, lease_model.start_date, lease_model.end_date, lease_model.status)
+            .join(Unit, Unit.id == lease_model.unit_id)
+            .where(Unit.property_id.in_(property_ids), lease_model.start_date <= end,
+                   or_(lease_model.end_date >= start, lease_model.status == 'active'))
+        )
+    intervals = {}
+    for unit_id, lease_start, lease_end, status in db.session.execute(union_all(*queries)):
+        if status == 'active' and lease_end < today:
+            lease_end = today
+        intervals.setdefault(unit_id, []).append((lease_start, lease_end))
+    return {unit_id: merge_intervals(unit_intervals) for unit_id, unit_intervals in intervals.items()}
+
+
+class Sweep:
+    """Daily occupancy of each property over [start, end] from merged unit intervals."""
+
+    def __init__(self, unit_property, intervals, start, end, today):
+        self.start = start
+        self.end = end
+        days = (end - start).days + 1
+        self.units = {}
+        diffs, self.move_ins, self.move_outs = {}, {}, {}
+        self.unit_totals = {}
+        for unit_id, property_id in unit_property.items():
+            self.units[property_id] = self.units.get(property_id, 0) + 1
+            if property_id not in diffs:
+                diffs[property_id] = [0] * (days + 1)
+                self.move_ins[property_id] = [0] * days
+                self.move_outs[property_id] = [0] * days
+
+            occupied = moves = 0
+            diff, ins, outs = diffs[property_id], self.move_ins[property_id], self.move_outs[property_id]
+            for first, last in intervals.get(unit_id, ()):
+                if last < start or first > end:
+                    continue
+                a = (max(first, start) - start).days
+                b = (min(last, end) - start).days
+                diff[a] += 1
+                diff[b + 1] -= 1
+                occupied += b - a + 1
+                if first >= start and first <= today:
+                    ins[a] += 1
+                # Only move-outs that have happened; a lease's scheduled end is not turnover yet
+                if last <= end and last < today:
+                    outs[b] += 1
+                    moves += 1
+            self.unit_totals[unit_id] = (occupied, days - occupied, moves)
+
+        self.occupied = {property_id: list(accumulate(diff[:days])) for property_id, diff in diffs.items()}
+
+    def _index(self, day):
+        return (day - self.start).days
+
+    def month(self, property_id, month):
+        """Figures for one month of the range, as stored in occupancy_month."""
+        a = self._index(max(month, self.start))
+        b = self._index(min(next_month(month) - timedelta(days=1), self.end)) + 1
+        units = self.units.get(property_id, 0)
+        return {
+            'units': units,
+            'unit_days': units * (b - a),
+            'occupied_days': sum(self.occupied[property_id][a:b]) if units else 0,
+            'move_ins': sum(self.move_ins[property_id][a:b]) if units else 0,
+            'move_outs': sum(self.move_outs[property_id][a:b]) if units else 0
+        }
+
+    def days(self, property_id):
+        units = self.units.get(property_id, 0)
+        occupied = self.occupied.get(property_id) or [0] * ((self.end - self.start).days + 1)
+        return [(self.start + timedelta(days=i), units, count) for i, count in enumerate(occupied)]
+
+
+def summarize(period, figures):
+    unit_days, occupied_days = figures['unit_days'], figures['occupied_days']
+    return {
+        'period': period,
+        'units': figures['units'],
+        'occupied_days': occupied_days,
+        'vacancy_days': unit_days - occupied_days,
+        'occupancy_rate': round(occupied_days / unit_days * 100, 2) if unit_days else 0,
+        'move_ins': figures['move_ins'],
+        'move_outs': figures['move_outs'],
+        'turnover_rate': round(figures['move_outs'] / figures['units'] * 100, 2) if figures['units'] else 0
+    }
+
+
+def monthly_figures(property_ids, start, end, today):
+    """{property id: {month: figures}} for whole months, reusing cached closed months."""
+    months = months_between(start, end)
+    current = month_start(today)
+    closed = [month for month in months if month < current]
+
+    figures = {property_id: {} for property_id in property_ids}
+    if closed:
+        rows = db.session.execute(
+            select(OccupancyMonth.property_id, OccupancyMonth.month, OccupancyMonth.units, OccupancyMonth.unit_days,
+                   OccupancyMonth.occupied_days, OccupancyMonth.move_ins, OccupancyMonth.move_outs)
+            .where(OccupancyMonth.property_id.in_(property_ids), OccupancyMonth.month.in_(closed))
+        )
+        for property_id, month, units, unit_days, occupied_days, move_ins, move_outs in rows:
+            figures[property_id][month] = {
+                'units': units, 'unit_days': unit_days, 'occupied_days': occupied_days,
+                'move_ins': move_ins, 'move_outs': move_outs
+            }
+
+    # Sweep each property from its first month that is not cached through the end of the range
+    pending = {}
+    for property_id in property_ids:
+        missing = [month for month in months if month not in figures[property_id]]
+        if missing:
+            pending[property_id] = missing
+    if not pending:
+        return figures
+
+    sweep_start = max(start, min(missing[0] for missing in pending.values()))
+    unit_property, _ = load_units(list(pending))
+    sweep = Sweep(unit_property, load_intervals(unit_property, sweep_start, end, today), sweep_start, end, today)
+
+    cached = []
+    for property_id, missing in pending.items():
+        for month in missing:
+            figures[property_id][month] = month_figures = sweep.month(property_id, month)
+            if month < current:
+                cached.append(dict(month_figures, property_id=property_id, month=month, computed_at=datetime.utcnow()))
+    if cached:
+        try:
+            db.session.execute(insert(OccupancyMonth), cached)
+            db.session.commit()
+        except IntegrityError:
+            # Another request cached the same months first
+            db.session.rollback()
+    return figures
+
+
+def occupancy_history(properties, start, end, granularity='month', include_units=False, today=None):
+    """Occupancy, vacancy days and turnover per property and for the whole portfolio."""
+    today = today or date.today()
+    # Caching commits, which expires the Property objects
+    properties = [(prop.id, prop.name) for prop in properties]
+    property_ids = [property_id for property_id, _ in properties]
+    result = {'start': start.isoformat(), 'end': end.isoformat(), 'granularity': granularity}
+
+    if granularity == 'day':
+        unit_property, unit_numbers = load_units(property_ids)
+        sweep = Sweep(unit_property, load_intervals(unit_property, start, end, today), start, end, today)
+        series = {property_id: sweep.days(property_id) for property_id in property_ids}
+        portfolio = {}
+        for rows in series.values():
+            for day, units, occupied in rows:
+                totals = portfolio.setdefault(day, [0, 0])
+                totals[0] += units
+                totals[1] += occupied
+        daily = lambda day, units, occupied: {
+            'period': day.isoformat(), 'units': units, 'occupied': occupied,
+            'occupancy_rate': round(occupied / units * 100, 2) if units else 0
+        }
+        result['portfolio'] = [daily(day, *portfolio[day]) for day in sorted(portfolio)]
+        result['properties'] = [{'id': property_id, 'name': name, 'series': [daily(*row) for row in series[property_id]]}
+                                for property_id, name in properties]
+    else:
+        figures = monthly_figures(property_ids, start, end, today)
+        months = months_between(start, end)
+        result['portfolio'] = []
+        for month in months:
+            totals = {'units': 0, 'unit_days': 0, 'occupied_days': 0, 'move_ins': 0, 'move_outs': 0}
+            for property_id in property_ids:
+                for key, value in figures[property_id][month].items():
+                    totals[key] += value
+            result['portfolio'].append(summarize(month.strftime('%Y-%m'), totals))
+        result['properties'] = [{
+            'id': property_id,
+            'name': name,
+            'series': [summarize(month.strftime('%Y-%m'), figures[property_id][month]) for month in months]
+        } for property_id, name in properties]
+
+    if include_units:
+        if granularity != 'day':
+            unit_property, unit_numbers = load_units(property_ids)
+            sweep = Sweep(unit_property, load_intervals(unit_property, start, end, today), start, end, today)
+        result['units'] = [{
+            'id': unit_id,
+            'unit_number': unit_numbers[unit_id],
+            'property_id': unit_property[unit_id],
+            'occupied_days': occupied,
+            'vacancy_days': vacant,
+            'turnover': moves
+        } for unit_id, (occupied, vacant, moves) in sorted(sweep.unit_totals.items())]
+    return result
+
+
+def invalidate_occupancy(property_ids, since):
+    """Drop cached months from since onwards after a lease for these properties changed."""
+    db.session.execute(delete(OccupancyMonth).where(
+        and_(OccupancyMonth.property_id.in_(list(property_ids)), OccupancyMonth.month >= month_start(since))
+    ))
@@ -0,0 +1,189 @@
+from flask import request, url_for
+from sqlalchemy import and_, or_, func
+from datetime import datetime, date
+import base64
+import json
+
+# Keyset ("seek") pagination shared by the list views.
+# Rows are ordered by (sort column, id) and each page remembers the sort key
+# of its first and last row, so fetching the next page is an index range scan
+# instead of an OFFSET that reads and discards every earlier row.
+
+DEFAULT_PER_PAGE = 25
+MAX_PER_PAGE = 100
+COUNT_CAP = 10000
+
+
+def encode_cursor(values):
+    payload = []
+    for value in values:
+        if isinstance(value, (datetime, date)):
+            value = value.isoformat()
+        payload.append(value)
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, columns):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        return None
+
+    if not isinstance(payload, list) or len(payload) != len(columns):
+        return None
+
+    values = []
+    try:
+        for value, column in zip(payload, columns):
+            try:
+                python_type = column.type.python_type
+            except NotImplementedError:
+                python_type = None
+            if value is not None and python_type is datetime:
+                value = datetime.fromisoformat(value)
+            elif value is not None and python_type is date:
+                value = date.fromisoformat(value)
+            elif value is not None and not isinstance(value, (str, int, float)):
+                raise TypeError('cursor values are scalars')
+            values.append(value)
+    except (ValueError, TypeError):
+        # Decodes but was not written by encode_cursor(): start from the first page
+        return None
+    return values
+
+
+def estimate_count(query, cap=COUNT_CAP):
+    # Count at most cap + 1 rows so huge tables never get a full COUNT(*)
+    limited = query.order_by(None).limit(cap + 1).subquery()
+    total = query.session.query(func.count()).select_from(limited).scalar()
+    if total > cap:
+        return cap, True
+    return total, False
+
+
+class KeysetPage:
+    def __init__(self, items, sort, direction, per_page, sort_columns,
+                 next_cursor=None, prev_cursor=None, total=None, total_is_estimate=False):
+        self.items = items
+        self.sort = sort
+        self.direction = direction
+        self.per_page = per_page
+        self.sort_columns = sort_columns
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.total = total
+        self.total_is_estimate = total_is_estimate
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+    @property
+    def total_display(self):
+        if self.total is None:
+            return ''
+        return f'{self.total:,}+' if self.total_is_estimate else f'{self.total:,}'
+
+    def url(self, **overrides):
+        # Keep the current filters, drop the old cursors, then apply overrides
+        args = {key: value for key, value in request.args.items() if key not in ('after', 'before')}
+        args.update(overrides)
+        args = {key: value for key, value in args.items() if value not in (None, '')}
+        return url_for(request.endpoint, **(request.view_args or {}), **args)
+
+    @property
+    def next_url(self):
+        return self.url(after=self.next_cursor) if self.has_next else None
+
+    @property
+    def prev_url(self):
+        return self.url(before=self.prev_cursor) if self.has_prev else None
+
+    @property
+    def first_url(self):
+        return self.url()
+
+    def sort_url(self, column):
+        direction = 'desc' if self.sort == column and self.direction == 'asc' else 'asc'
+        return self.url(sort=column, dir=direction)
+
+    def sort_indicator(self, column):
+        if self.sort != column:
+            return ''
+        return '▲' if self.direction == 'asc' else '▼'
+
+
+def _seek_condition(columns, values, ascending):
+    # (a, b) > (x, y)  ==  a > x OR (a = x AND b > y), which SQLite can serve from an index
+    conditions = []
+    for i, (column, value) in enumerate(zip(columns, values)):
+        equal = [c == v for c, v in zip(columns[:i], values[:i])]
+        step = column > value if ascending else column < value
+        conditions.append(and_(*equal, step))
+    return or_(*conditions)
+
+
+def paginate(query, sort_columns, id_column, default_sort, default_direction='asc',
+             default_per_page=DEFAULT_PER_PAGE, max_per_page=MAX_PER_PAGE, count=True, count_cap=COUNT_CAP):
+    """Apply keyset pagination and sorting from the request args to a query.
+
+    ``sort_columns`` maps the sort names accepted from ``?sort=`` to column
+    expressions; they should be non-null (wrap nullable ones in coalesce).
+    """
+    sort = request.args.get('sort', default_sort)
+    if sort not in sort_columns:
+        sort = default_sort
+    direction = request.args.get('dir', default_direction)
+    if direction not in ('asc', 'desc'):
+        direction = default_direction
+
+    per_page = request.args.get('per_page', default_per_page, type=int)
+    per_page = max(1, min(per_page, max_per_page))
+
+    total, total_is_estimate = (None, False)
+    if count:
+        total, total_is_estimate = estimate_count(query, count_cap)
+
+    entity_count = len(query.column_descriptions)
+    key_columns = [sort_columns[sort], id_column]
+    ascending = direction == 'asc'
+
+    after = decode_cursor(request.args.get('after') or '', key_columns)
+    before = decode_cursor(request.args.get('before') or '', key_columns)
+    backwards = False
+
+    if after is not None:
+        query = query.filter(_seek_condition(key_columns, after, ascending))
+    elif before is not None:
+        # Walk the index the other way, then flip the page back into display order
+        query = query.filter(_seek_condition(key_columns, before, not ascending))
+        backwards = True
+
+    walk_ascending = ascending != backwards
+    order = [c.asc() if walk_ascending else c.desc() for c in key_columns]
+    rows = query.order_by(*order).add_columns(*key_columns).limit(per_page + 1).all()
+
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+
+    # The sort key is appended to every row so cursors never need a second lookup
+    keys = [tuple(row[entity_count:]) for row in rows]
+    items = [row[0] if entity_count == 1 else tuple(row[:entity_count]) for row in rows]
+
+    next_cursor = prev_cursor = None
+    if keys:
+        if has_more or backwards:
+            next_cursor = encode_cursor(keys[-1])
+        if (after is not None) or (backwards and has_more):
+            prev_cursor = encode_cursor(keys[0])
+
+    return KeysetPage(items, sort, direction, per_page, sort_columns,
+                      next_cursor=next_cursor, prev_cursor=prev_cursor,
+                      total=total, total_is_estimate=total_is_estimate)
@@ -0,0 +1,221 @@
+from flask import g, request
+from flask_login import current_user
+from streaming import when_sent
+from collections import deque
+from datetime import datetime
+from time import perf_counter, sleep, time
+import json
+import os
+import random
+import sys
+import threading
+import tracemalloc
+import uuid
+
+# On-demand request profiling.
+# An admin can profile a single request by sending `X-Profile: 1` (or adding
+# `?_profile=1`); `X-Profile: cprofile` uses cProfile instead of the sampler.
+# Routes listed in PROFILE_SAMPLE_ROUTES are also profiled at random, 1 in N
+# requests, at most PROFILE_MAX_PER_MINUTE times a minute per process.
+# Each profile is written to PROFILE_DIR as:
+#   <id>.json       metadata and the top allocation sites (tracemalloc)
+#   <id>.collapsed  sampled stacks in collapsed format (flamegraph.pl, speedscope)
+#   <id>.prof       cProfile stats when cprofile was requested (snakeviz, pstats)
+
+_settings = {'directory': None, 'routes': {}, 'max_per_minute': 6, 'interval': 0.005, 'top_allocations': 25}
+_recent = deque()
+_recent_lock = threading.Lock()
+# Concurrent profiles share tracemalloc; the last one to finish stops it
+_tracing = {'users': 0, 'owned': False}
+_tracing_lock = threading.Lock()
+
+
+def parse_sample_routes(value):
+    """'landlord_dashboard:100,landlord_tenant_payments:50' -> {endpoint: N}"""
+    routes = {}
+    for item in (value or '').split(','):
+        endpoint, _, every = item.strip().partition(':')
+        if endpoint:
+            routes[endpoint] = max(1, int(every or 100))
+    return routes
+
+
+class StackSampler(threading.Thread):
+    # Samples one thread's Python stack every `interval` seconds
+    def __init__(self, thread_id, interval):
+        super().__init__(name='profile-sampler', daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = {}
+        self.samples = 0
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.is_set():
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                    frame = frame.f_back
+                key = ';'.join(reversed(stack))
+                self.stacks[key] = self.stacks.get(key, 0) + 1
+                self.samples += 1
+            sleep(self.interval)
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+    def collapsed(self):
+        return ''.join(f'{stack} {count}\n' for stack, count in sorted(self.stacks.items()))
+
+
+class RequestProfile:
+    def __init__(self, mode, trigger):
+        self.id = f'{datetime.utcnow().strftime("%Y%m%d-%H%M%S")}-{uuid.uuid4().hex[:8]}'
+        self.mode = mode
+        self.trigger = trigger
+        self.sampler = None
+        self.profiler = None
+        # A streamed body finishes after the request context is gone
+        self.endpoint = request.endpoint
+        self.path = request.full_path.rstrip('?')
+        self.method = request.method
+
+    def start(self):
+        with _tracing_lock:
+            if _tracing['users'] == 0 and not tracemalloc.is_tracing():
+                tracemalloc.start()
+                _tracing['owned'] = True
+            _tracing['users'] += 1
+        if self.mode == 'cprofile':
+            import cProfile
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        else:
+            self.sampler = StackSampler(threading.get_ident(), _settings['interval'])
+            self.sampler.start()
+        self.start_time = perf_counter()
+
+    def stop(self, status_code):
+        duration = perf_counter() - self.start_time
+        if self.profiler is not None:
+            self.profiler.disable()
+        if self.sampler is not None:
+            self.sampler.stop()
+        with _tracing_lock:
+            snapshot = tracemalloc.take_snapshot()
+            _tracing['users'] -= 1
+            if _tracing['users'] == 0 and _tracing['owned']:
+                tracemalloc.stop()
+                _tracing['owned'] = False
+
+        # tracemalloc is process-wide: concurrent requests show up here too
+        allocations = [{
+            'site': f'{stat.traceback[0].filename}:{stat.traceback[0].lineno}',
+            'size_kb': round(stat.size / 1024, 1),
+            'count': stat.count
+        } for stat in snapshot.statistics('lineno')[:_settings['top_allocations']]]
+
+        directory = _settings['directory']
+        files = []
+        if self.sampler is not None:
+            files.append(f'{self.id}.collapsed')
+            with open(os.path.join(directory, files[-1]), 'w') as f:
+                f.write(self.sampler.collapsed())
+        if self.profiler is not None:
+            files.append(f'{self.id}.prof')
+            self.profiler.dump_stats(os.path.join(directory, files[-1]))
+
+        meta = {
+            'id': self.id,
+            'time': datetime.utcnow().isoformat(timespec='seconds'),
+            'endpoint': self.endpoint,
+            'path': self.path,
+            'method': self.method,
+            'status': status_code,
+            'duration_ms': round(duration * 1000, 2),
+            'mode': self.mode,
+            'trigger': self.trigger,
+            'samples': self.sampler.samples if self.sampler is not None else None,
+            'files': files,
+            'allocations': allocations
+        }
+        with open(os.path.join(directory, f'{self.id}.json'), 'w') as f:
+            json.dump(meta, f)
+
+
+def _take_sample_slot():
+    # At most max_per_minute sampled profiles in any 60 seconds
+    now = time()
+    with _recent_lock:
+        while _recent and now - _recent[0] > 60:
+            _recent.popleft()
+        if len(_recent) >= _settings['max_per_minute']:
+            return False
+        _recent.append(now)
+        return True
+
+
+def _requested_mode():
+    flag = request.headers.get('X-Profile') or request.args.get('_profile')
+    if not flag:
+        return None
+    if not (current_user.is_authenticated and current_user.role == 'admin'):
+        return None
+    return 'cprofile' if flag == 'cprofile' else 'sample'
+
+
+def list_profiles(limit=100):
+    directory = _settings['directory']
+    if not directory or not os.path.isdir(directory):
+        return []
+    names = sorted((n for n in os.listdir(directory) if n.endswith('.json')), reverse=True)[:limit]
+    profiles = []
+    for name in names:
+        try:
+            with open(os.path.join(directory, name)) as f:
+                profiles.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return profiles
+
+
+def init_profiling(app):
+    if not app.config.get('PROFILING_ENABLED', True):
+        return
+    directory = app.config.get('PROFILE_DIR')
+    try:
+        os.makedirs(directory, exist_ok=True)
+    except OSError:
+        app.logger.warning('Request profiling disabled: %s is not writable', directory)
+        return
+    _settings.update(
+        directory=directory,
+        routes=parse_sample_routes(app.config.get('PROFILE_SAMPLE_ROUTES')),
+        max_per_minute=app.config.get('PROFILE_MAX_PER_MINUTE', 6),
+        interval=app.config.get('PROFILE_INTERVAL_MS', 5) / 1000
+    )
+
+    @app.before_request
+    def start_profile():
+        mode, trigger = _requested_mode(), 'admin'
+        if mode is None:
+            every = _settings['routes'].get(request.endpoint)
+            if not every or random.randrange(every) or not _take_sample_slot():
+                return
+            mode, trigger = 'sample', f'1 in {every}'
+        g.profile = RequestProfile(mode, trigger)
+        g.profile.start()
+
+    @app.after_request
+    def finish_profile(response):
+        profile = g.pop('profile', None)
+        if profile is not None:
+            # A streamed page does most of its work while the body is sent
+            status_code = response.status_code
+            when_sent(response, lambda: profile.stop(status_code))
+            response.headers['X-Profile-Id'] = profile.id
+        return response
@@ -0,0 +1,215 @@
+from sqlalchemy import DDL, event, text, or_
+from markupsafe import escape
+from models import db, MaintenanceRequest, Message, Unit, Property
+import re
+
+# Full-text search over maintenance requests and messages.
+# On SQLite the index is an external-content FTS5 table per source table,
+# kept in sync by triggers so the ORM code paths need no changes.
+
+SNIPPET_START = '\x02'
+SNIPPET_END = '\x03'
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+FTS_INDEXES = {
+    'maintenance_request': ('maintenance_request_fts', ['title', 'description']),
+    'message': ('message_fts', ['subject', 'message'])
+}
+
+
+def _index_ddl(table, fts_table, columns):
+    cols = ', '.join(columns)
+    new_cols = ', '.join(f'new.{c}' for c in columns)
+    old_cols = ', '.join(f'old.{c}' for c in columns)
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts_table} USING fts5("
+        f"{cols}, content='{table}', content_rowid='id', tokenize='porter unicode61')",
+        f"CREATE TRIGGER IF NOT EXISTS {fts_table}_ai AFTER INSERT ON {table} BEGIN "
+        f"INSERT INTO {fts_table}(rowid, {cols}) VALUES (new.id, {new_cols}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts_table}_ad AFTER DELETE ON {table} BEGIN "
+        f"INSERT INTO {fts_table}({fts_table}, rowid, {cols}) VALUES ('delete', old.id, {old_cols}); END",
+        # Only reindex when the searchable text changes, not on status updates
+        f"CREATE TRIGGER IF NOT EXISTS {fts_table}_au AFTER UPDATE OF {cols} ON {table} BEGIN "
+        f"INSERT INTO {fts_table}({fts_table}, rowid, {cols}) VALUES ('delete', old.id, {old_cols}); "
+        f"INSERT INTO {fts_table}(rowid, {cols}) VALUES (new.id, {new_cols}); END"
+    ]
+
+
+# Build the index whenever create_all() creates the source tables
+for _model in (MaintenanceRequest, Message):
+    _fts_table, _columns = FTS_INDEXES[_model.__tablename__]
+    for _statement in _index_ddl(_model.__tablename__, _fts_table, _columns):
+        event.listen(_model.__table__, 'after_create', DDL(_statement).execute_if(dialect='sqlite'))
+
+
+def fts_enabled():
+    return db.engine.dialect.name == 'sqlite'
+
+
+def ensure_search_index(engine=None, tables=None):
+    # create_all() skips existing tables, so older databases need the index created explicitly
+    if not fts_enabled():
+        return False
+
+    with (engine or db.engine).begin() as conn:
+        existing = {row[0] for row in conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'table'"))}
+        for table, (fts_table, columns) in FTS_INDEXES.items():
+            if tables is not None and table not in tables:
+                continue
+            for statement in _index_ddl(table, fts_table, columns):
+                conn.execute(text(statement))
+            if fts_table not in existing:
+                conn.execute(text(f"INSERT INTO {fts_table}({fts_table}) VALUES ('rebuild')"))
+    return True
+
+
+def rebuild_search_index(engine=None, tables=None):
+    # A shard only holds maintenance requests, so it passes tables=['maintenance_request']
+    if not ensure_search_index(engine, tables):
+        return False
+
+    with (engine or db.engine).begin() as conn:
+        for table, (fts_table, _) in FTS_INDEXES.items():
+            if tables is not None and table not in tables:
+                continue
+            conn.execute(text(f"INSERT INTO {fts_table}({fts_table}) VALUES ('rebuild')"))
+            conn.execute(text(f"INSERT INTO {fts_table}({fts_table}) VALUES ('optimize')"))
+    return True
+
+
+def build_match_query(query):
+    # Quote every term so user input can never be parsed as FTS5 syntax;
+    # the last term is a prefix match to support search-as-you-type
+    terms = re.findall(r'\w+', query or '')
+    if not terms:
+        return None
+    quoted = ['"%s"' % term for term in terms]
+    quoted[-1] += '*'
+    return ' '.join(quoted)
+
+
+def format_snippet(snippet):
+    if snippet is None:
+        return ''
+    return str(escape(snippet)).replace(SNIPPET_START, '<mark>').replace(SNIPPET_END, '</mark>')
+
+
+def _clamp_limit(limit):
+    return max(1, min(limit or DEFAULT_LIMIT, MAX_LIMIT))
+
+
+def search_maintenance(landlord_id, query, property_id=None, limit=DEFAULT_LIMIT):
+    match = build_match_query(query)
+    if not match:
+        return []
+    limit = _clamp_limit(limit)
+
+    if not fts_enabled():
+        return _like_search_maintenance(landlord_id, query, property_id, limit)
+
+    sql = f"""
+        SELECT mr.id, mr.title, mr.status, mr.urgency, mr.created_at,
+               u.unit_number, p.id AS property_id, p.name AS property_name,
+               snippet(maintenance_request_fts, -1, '{SNIPPET_START}', '{SNIPPET_END}', '…', 12) AS snippet,
+               bm25(maintenance_request_fts, 5.0, 1.0) AS rank
+        FROM maintenance_request_fts
+        JOIN maintenance_request mr ON mr.id = maintenance_request_fts.rowid
+        JOIN unit u ON u.id = mr.unit_id
+        JOIN property p ON p.id = u.property_id
+        WHERE maintenance_request_fts MATCH :match
+          AND p.landlord_id = :landlord_id
+          {'AND p.id = :property_id' if property_id else ''}
+        ORDER BY rank
+        LIMIT :limit
+    """
+    params = {'match': match, 'landlord_id': landlord_id, 'property_id': property_id, 'limit': limit}
+    rows = db.session.execute(text(sql), params).mappings().all()
+
+    return [{
+        'id': row['id'],
+        'title': row['title'],
+        'status': row['status'],
+        'urgency': row['urgency'],
+        'created_at': str(row['created_at'])[:16],
+        'unit_number': row['unit_number'],
+        'property_id': row['property_id'],
+        'property_name': row['property_name'],
+        'snippet': format_snippet(row['snippet']),
+        'rank': row['rank']
+    } for row in rows]
+
+
+def search_messages(user_id, query, limit=DEFAULT_LIMIT):
+    match = build_match_query(query)
+    if not match:
+        return []
+    limit = _clamp_limit(limit)
+
+    if not fts_enabled():
+        return _like_search_messages(user_id, query, limit)
+
+    sql = f"""
+        SELECT m.id, m.subject, m.sender_id, m.receiver_id, m.is_read, m.created_at,
+               snippet(message_fts, -1, '{SNIPPET_START}', '{SNIPPET_END}', '…', 12) AS snippet,
+               bm25(message_fts, 3.0, 1.0) AS rank
+        FROM message_fts
+        JOIN message m ON m.id = message_fts.rowid
+        WHERE message_fts MATCH :match
+          AND (m.sender_id = :user_id OR m.receiver_id = :user_id)
+        ORDER BY rank
+        LIMIT :limit
+    """
+    rows = db.session.execute(text(sql), {'match': match, 'user_id': user_id, 'limit': limit}).mappings().all()
+
+    return [{
+        'id': row['id'],
+        'subject': row['subject'],
+        'is_read': bool(row['is_read']),
+        'created_at': str(row['created_at'])[:16],
+        'direction': 'sent' if row['sender_id'] == user_id else 'received',
+        'snippet': format_snippet(row['snippet']),
+        'rank': row['rank']
+    } for row in rows]
+
+
+# Fallbacks for server databases without FTS5; unranked substring matching
+
+def _like_search_maintenance(landlord_id, query, property_id, limit):
+    pattern = f'%{query.strip()}%'
+    q = db.session.query(MaintenanceRequest, Unit, Property)\
+        .join(Unit, Unit.id == MaintenanceRequest.unit_id)\
+        .join(Property, Property.id == Unit.property_id)\
+        .filter(Property.landlord_id == landlord_id)\
+        .filter(or_(MaintenanceRequest.title.ilike(pattern), MaintenanceRequest.description.ilike(pattern)))
+    if property_id:
+        q = q.filter(Property.id == property_id)
+
+    return [{
+        'id': mr.id,
+        'title': mr.title,
+        'status': mr.status,
+        'urgency': mr.urgency,
+        'created_at': mr.created_at.strftime('%Y-%m-%d %H:%M'),
+        'unit_number': unit.unit_number,
+        'property_id': prop.id,
+        'property_name': prop.name,
+        'snippet': str(escape(mr.description[:120])),
+        'rank': 0
+    } for mr, unit, prop in q.order_by(MaintenanceRequest.created_at.desc()).limit(limit)]
+
+
+def _like_search_messages(user_id, query, limit):
+    pattern = f'%{query.strip()}%'
+    q = Message.query.filter(or_(Message.sender_id == user_id, Message.receiver_id == user_id))\
+        .filter(or_(Message.subject.ilike(pattern), Message.message.ilike(pattern)))
+
+    return [{
+        'id': m.id,
+        'subject': m.subject,
+        'is_read': m.is_read,
+        'created_at': m.created_at.strftime('%Y-%m-%d %H:%M'),
+        'direction': 'sent' if m.sender_id == user_id else 'received',
+        'snippet': str(escape(m.message[:120])),
+        'rank': 0
+    } for m in q.order_by(Message.created_at.desc()).limit(limit)]
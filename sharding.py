@@ -0,0 +1,406 @@
+from flask import current_app, g, has_app_context, jsonify, request, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import delete, event, func, insert, select, update
+from contextlib import contextmanager
+import time
+
+# Per-landlord sharding (opt-in with SHARD_URLS).
+# A landlord's operational rows -- properties, units, leases, payments,
+# maintenance requests, notifications and the occupancy cache -- live in one
+# of the SHARD_URLS SQLite databases. The main database is the directory: it
+# keeps users, messages, attachments and shard_assignment, which says which
+# shard each landlord and their tenants are routed to. Users without an
+# assignment (everything from before sharding was turned on) stay in the
+# directory database until `flask shard-move` or `flask shard-rebalance`
+# moves their landlord.
+#
+# A request is routed once, before the user is loaded: every statement of
+# the request then runs on one connection to its shard, which has the
+# directory ATTACHed, so joins between users and shard tables keep working
+# and the views need no changes. Each shard is its own file with its own
+# write lock, so writes for landlords on different shards do not wait for
+# each other; writes to directory tables (users, messages) still do.
+#
+# Rows keep their ids when they move, so ids of the moving tables are handed
+# out per database from shard_sequence as n * SHARD_ID_STRIDE + slot, and
+# no two databases can ever produce the same id.
+
+SHARDED_TABLES = [
+    'property', 'unit', 'lease', 'payment', 'maintenance_request', 'notification',
+    'occupancy_month', 'archived_lease', 'archived_payment', 'archived_notification', 'shard_sequence'
+]
+# Tables whose ids come from shard_sequence while sharding is enabled
+SEQUENCED_TABLES = ['property', 'unit', 'lease', 'payment', 'maintenance_request', 'notification']
+SHARD_ID_STRIDE = 1024
+DIRECTORY_SLOT = SHARD_ID_STRIDE - 1
+MOVE_CHUNK_SIZE = 1000
+
+
+class RoutingSession(Session):
+    """Session that sends every statement of a request to the request's shard."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_app_context():
+            shard = g.get('shard')
+            if shard is not None:
+                return self._db.engines[f'shard{shard}']
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def sharding_enabled():
+    return has_app_context() and bool(current_app.config.get('SHARD_URLS'))
+
+
+def shard_count():
+    return len(current_app.config.get('SHARD_URLS') or [])
+
+
+def shard_engine(shard):
+    from models import db
+    return db.engines[None] if shard is None else db.engines[f'shard{shard}']
+
+
+def shard_slot(shard):
+    """The low part of the ids a database hands out (see allocate_ids)."""
+    return DIRECTORY_SLOT if shard is None else shard
+
+
+def user_shard(user_id):
+    """The database a user's rows live on: a shard number, or None for the directory."""
+    from models import db, ShardAssignment
+
+    # shard_assignment is only in the directory, which every shard connection has attached
+    return db.session.scalar(select(ShardAssignment.shard).where(ShardAssignment.user_id == user_id))
+
+
+def shard_label(shard):
+    return 'directory' if shard is None else f'shard {shard}'
+
+
+def init_sharding(app):
+    """Attach the directory to every shard connection and route each request."""
+    if not app.config.get('SHARD_URLS'):
+        return
+    from models import db
+
+    with app.app_context():
+        directory = db.engines[None].url
+        if directory.get_backend_name() != 'sqlite' or any(
+                db.engines[f'shard{i}'].url.get_backend_name() != 'sqlite' for i in range(shard_count())):
+            raise RuntimeError('SHARD_URLS needs SQLite databases for the directory and every shard')
+        for i in range(shard_count()):
+            event.listen(db.engines[f'shard{i}'], 'connect', _attach_directory(directory.database))
+
+    app.before_request(select_shard)
+
+
+def _attach_directory(path):
+    def attach(dbapi_connection, connection_record):
+        dbapi_connection.execute('ATTACH DATABASE ? AS directory', (path,))
+    return attach
+
+
+def select_shard():
+    """Pick the request's shard from the logged-in user before anything touches the session."""
+    from models import db, User, ShardAssignment
+
+    g.shard = None
+    user_id = session.get('_user_id')
+    if user_id is None:
+        return None
+    # A short-lived connection of its own: the request must not keep a
+    # directory connection open next to its shard connection
+    with db.engines[None].connect() as conn:
+        row = conn.execute(
+            select(User.role, ShardAssignment.shard, ShardAssignment.moving)
+            .outerjoin(ShardAssignment, ShardAssignment.user_id == User.id)
+            .where(User.id == int(user_id))
+        ).first()
+    if row is None:
+        return None
+    role, shard, moving = row
+    if moving:
+        response = jsonify({'error': 'This account is being moved to another database; try again shortly'})
+        response.headers['Retry-After'] = '5'
+        return response, 503
+    if role == 'admin':
+        # Admins look at one shard at a time: ?shard=N, or ?shard=directory for unassigned data
+        choice = request.args.get('shard')
+        if choice is not None:
+            session['shard'] = int(choice) if choice.isdigit() and int(choice) < shard_count() else None
+        shard = session.get('shard')
+    g.shard = shard
+    return None
+
+
+@contextmanager
+def use_shard(shard):
+    """Route the session to one shard (None for the directory) for the duration of a block."""
+    from models import db
+
+    previous = g.get('shard')
+    db.session.close()
+    g.shard = shard
+    try:
+        yield
+    finally:
+        db.session.close()
+        g.shard = previous
+
+
+def each_shard():
+    """Run the body once per database holding landlord data: for shard in each_shard(): ..."""
+    shards = [None] + list(range(shard_count())) if sharding_enabled() else [None]
+    for shard in shards:
+        with use_shard(shard):
+            yield shard
+
+
+@event.listens_for(RoutingSession, 'before_flush')
+def assign_sequenced_ids(session, flush_context, instances):
+    if not sharding_enabled():
+        return
+    pending = {}
+    for obj in session.new:
+        table = getattr(obj, '__tablename__', None)
+        if table in SEQUENCED_TABLES and obj.id is None:
+            pending.setdefault(table, []).append(obj)
+    for table, objects in pending.items():
+        for obj, new_id in zip(objects, allocate_ids(table, len(objects), session)):
+            obj.id = new_id
+
+
+def allocate_ids(table, count, session=None, slot=None):
+    """count new ids for a sequenced table in the current database, or None when not sharding.
+
+    The counter moves inside the caller's transaction, so the ids are only
+    used up when it commits. Bulk inserts that bypass the ORM must take their
+    ids from here. slot is the database's shard_slot(), by default the
+    request's shard; pass it when session is bound to another database.
+    """
+    from models import db, ShardSequence
+
+    if not sharding_enabled() or count == 0:
+        return None
+    session = session or db.session
+    sequence = ShardSequence.__table__
+    end = session.execute(
+        update(sequence).where(sequence.c.name == table)
+        .values(next_value=sequence.c.next_value + count).returning(sequence.c.next_value)
+    ).scalar_one()
+    slot = shard_slot(g.get('shard')) if slot is None else slot
+    return [n * SHARD_ID_STRIDE + slot for n in range(end - count, end)]
+
+
+def init_shards(add_missing_columns):
+    """Create the shard tables and sequences; run from init_db()."""
+    from models import db, ShardSequence
+
+    if not sharding_enabled():
+        return
+    tables = [db.metadata.tables[name] for name in SHARDED_TABLES]
+    for i in range(shard_count()):
+        engine = shard_engine(i)
+        db.metadata.create_all(engine, tables=tables)
+        for column in add_missing_columns(engine, tables):
+            print(f"Added column {column} to {shard_label(i)}")
+
+    # Start every sequence above all existing ids so the old ids can never come round again
+    sequence = ShardSequence.__table__
+    engines = [shard_engine(None)] + [shard_engine(i) for i in range(shard_count())]
+    for table in SEQUENCED_TABLES:
+        source = db.metadata.tables[table]
+        highest = 0
+        for engine in engines:
+            with engine.connect() as conn:
+                highest = max(highest, conn.scalar(select(func.max(source.c.id))) or 0)
+        for engine in engines:
+            with engine.begin() as conn:
+                if conn.scalar(select(sequence.c.next_value).where(sequence.c.name == table)) is None:
+                    conn.execute(insert(sequence).values(name=table, next_value=highest // SHARD_ID_STRIDE + 1))
+
+
+def place_landlord(landlord_id):
+    """Route a new landlord to the shard with the fewest landlords. The caller commits."""
+    from models import db, ShardAssignment
+
+    if not sharding_enabled():
+        return None
+    landlords = dict(db.session.execute(
+        select(ShardAssignment.shard, func.count())
+        .where(ShardAssignment.user_id == ShardAssignment.landlord_id, ShardAssignment.shard.is_not(None))
+        .group_by(ShardAssignment.shard)
+    ).all())
+    shard = min(range(shard_count()), key=lambda i: (landlords.get(i, 0), i))
+    db.session.add(ShardAssignment(user_id=landlord_id, landlord_id=landlord_id, shard=shard))
+    return shard
+
+
+def route_tenant(tenant_id, landlord_id):
+    """Route a tenant to their landlord's shard. The caller commits."""
+    from models import db, ShardAssignment
+
+    if not sharding_enabled():
+        return
+    landlord = db.session.get(ShardAssignment, landlord_id)
+    if landlord is not None:
+        db.session.merge(ShardAssignment(user_id=tenant_id, landlord_id=landlord_id, shard=landlord.shard,
+                                         moving=False))
+
+
+def landlord_rows(landlord_id):
+    """(table, condition) for a landlord's rows in a shard, parents before children."""
+    from models import db, Property, Unit, Lease, Payment, MaintenanceRequest, Notification, ShardAssignment
+    from archive import ArchivedLease, ArchivedPayment, ArchivedNotification
+    from occupancy import OccupancyMonth
+
+    properties = select(Property.id).where(Property.landlord_id == landlord_id)
+    units = select(Unit.id).where(Unit.property_id.in_(properties))
+    leases = select(Lease.id).where(Lease.unit_id.in_(units))
+    archived_leases = select(ArchivedLease.id).where(ArchivedLease.unit_id.in_(units))
+    users = select(ShardAssignment.user_id).where(ShardAssignment.landlord_id == landlord_id)
+    return [
+        (Property.__table__, Property.landlord_id == landlord_id),
+        (Unit.__table__, Unit.property_id.in_(properties)),
+        (Lease.__table__, Lease.unit_id.in_(units)),
+        (ArchivedLease.__table__, ArchivedLease.unit_id.in_(units)),
+        (Payment.__table__, Payment.lease_id.in_(leases)),
+        (ArchivedPayment.__table__, ArchivedPayment.lease_id.in_(leases) | ArchivedPayment.lease_id.in_(archived_leases)),
+        (MaintenanceRequest.__table__, MaintenanceRequest.unit_id.in_(units)),
+        (OccupancyMonth.__table__, OccupancyMonth.property_id.in_(properties)),
+        (Notification.__table__, Notification.user_id.in_(users)),
+        (ArchivedNotification.__table__, ArchivedNotification.user_id.in_(users))
+    ]
+
+
+class ShardMoveError(Exception):
+    pass
+
+
+def move_landlord(landlord_id, target, grace=None):
+    """Move a landlord, their tenants' routing and all their rows to shard target.
+
+    Requests of the landlord's users get 503 while the move runs. The rows
+    are copied with their ids in one transaction on the target, the routing
+    is switched, and only then are the rows deleted from the source, so a
+    failure part-way leaves the data readable where the routing points.
+    Returns {table: rows moved}.
+    """
+    from models import db, User, Property, Unit, Lease, ShardAssignment, ShardSequence
+
+    if not 0 <= target < shard_count():
+        raise ShardMoveError(f'No shard {target}')
+    directory = shard_engine(None)
+    grace = current_app.config['SHARD_MOVE_GRACE_SECONDS'] if grace is None else grace
+
+    with directory.begin() as conn:
+        role = conn.scalar(select(User.role).where(User.id == landlord_id))
+        if role != 'landlord':
+            raise ShardMoveError(f'User {landlord_id} is not a landlord')
+        assignment = conn.execute(select(ShardAssignment.shard, ShardAssignment.moving)
+                                  .where(ShardAssignment.user_id == landlord_id)).first()
+        if assignment is not None and assignment.moving:
+            raise ShardMoveError(f'Landlord {landlord_id} is already being moved')
+        source = assignment.shard if assignment is not None else None
+        if source == target:
+            return {}
+        if assignment is None:
+            conn.execute(insert(ShardAssignment).values(user_id=landlord_id, landlord_id=landlord_id, shard=None))
+
+    # Tenants follow the landlord they lease from unless another landlord already claimed them
+    with shard_engine(source).connect() as conn:
+        tenants = set(conn.scalars(
+            select(Lease.tenant_id).join(Unit, Unit.id == Lease.unit_id).join(Property, Property.id == Unit.property_id)
+            .where(Property.landlord_id == landlord_id)
+        ))
+    with directory.begin() as conn:
+        routed = set(conn.scalars(select(ShardAssignment.user_id).where(ShardAssignment.user_id.in_(tenants))))
+        if tenants - routed:
+            conn.execute(insert(ShardAssignment), [
+                {'user_id': tenant_id, 'landlord_id': landlord_id, 'shard': source, 'moving': False}
+                for tenant_id in sorted(tenants - routed)])
+        conn.execute(update(ShardAssignment).where(ShardAssignment.landlord_id == landlord_id).values(moving=True))
+
+    try:
+        # Let requests that were routed before the flag went up finish
+        time.sleep(grace)
+        moved = {}
+        tables = landlord_rows(landlord_id)
+        highest_notification = 0
+        with shard_engine(source).connect() as reader, shard_engine(target).begin() as writer:
+            for table, condition in tables:
+                moved[table.name] = 0
+                result = reader.execute(select(table).where(condition))
+                for rows in result.mappings().partitions(MOVE_CHUNK_SIZE):
+                    writer.execute(insert(table), [dict(row) for row in rows])
+                    moved[table.name] += len(rows)
+                    if table.name in ('notification', 'archived_notification'):
+                        highest_notification = max([highest_notification] + [row['id'] for row in rows])
+            # Streams follow notification ids, so the target must number new ones above the copied ones
+            sequence = ShardSequence.__table__
+            floor = highest_notification // SHARD_ID_STRIDE + 1
+            writer.execute(update(sequence).where(sequence.c.name == 'notification', sequence.c.next_value < floor)
+                           .values(next_value=floor))
+        with directory.begin() as conn:
+            conn.execute(update(ShardAssignment).where(ShardAssignment.landlord_id == landlord_id)
+                         .values(shard=target, moving=False))
+    except BaseException:
+        with directory.begin() as conn:
+            conn.execute(update(ShardAssignment).where(ShardAssignment.landlord_id == landlord_id)
+                         .values(moving=False))
+        raise
+
+    with shard_engine(source).begin() as conn:
+        for table, condition in reversed(tables):
+            conn.execute(delete(table).where(condition))
+    return moved
+
+
+def shard_loads():
+    """{shard: {landlord id: units}} for every database holding landlord data."""
+    from models import ShardAssignment, Property, Unit
+
+    with shard_engine(None).connect() as conn:
+        placed = dict(conn.execute(select(ShardAssignment.user_id, ShardAssignment.shard)
+                                   .where(ShardAssignment.user_id == ShardAssignment.landlord_id)).all())
+    loads = {shard: {} for shard in [None] + list(range(shard_count()))}
+    for shard in loads:
+        with shard_engine(shard).connect() as conn:
+            rows = conn.execute(
+                select(Property.landlord_id, func.count(Unit.id))
+                .outerjoin(Unit, Unit.property_id == Property.id).group_by(Property.landlord_id)
+            ).all()
+        for landlord_id, units in rows:
+            # Leftovers of an interrupted move stay where the routing does not point
+            if placed.get(landlord_id) == shard:
+                loads[shard][landlord_id] = units
+            elif shard is None and landlord_id not in placed:
+                loads[None][landlord_id] = units
+    return loads
+
+
+def plan_rebalance(loads, include_unassigned=False):
+    """[(landlord id, from shard, to shard)] evening out units per shard, largest landlords first."""
+    totals = {shard: sum(landlords.values()) for shard, landlords in loads.items() if shard is not None}
+    placed = {shard: dict(landlords) for shard, landlords in loads.items() if shard is not None}
+    plan = []
+    if include_unassigned:
+        for landlord_id, units in sorted(loads.get(None, {}).items(), key=lambda item: (-item[1], item[0])):
+            lightest = min(totals, key=lambda shard: (totals[shard], shard))
+            plan.append((landlord_id, None, lightest))
+            totals[lightest] += units
+            placed[lightest][landlord_id] = units
+    while True:
+        heaviest = max(totals, key=lambda shard: (totals[shard], -shard))
+        lightest = min(totals, key=lambda shard: (totals[shard], shard))
+        gap = totals[heaviest] - totals[lightest]
+        # Moving u units turns the gap into |gap - 2u|, which only shrinks while u < gap
+        candidates = [(units, landlord_id) for landlord_id, units in placed[heaviest].items() if 0 < units < gap]
+        if not candidates:
+            return plan
+        units, landlord_id = max(candidates)
+        plan.append((landlord_id, heaviest, lightest))
+        del placed[heaviest][landlord_id]
+        placed[lightest][landlord_id] = units
+        totals[heaviest] -= units
+        totals[lightest] += units
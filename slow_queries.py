@@ -0,0 +1,149 @@
+from logging.handlers import RotatingFileHandler
+from datetime import datetime
+import json
+import logging
+import os
+import re
+
+# Slow-query log.
+# Statements slower than SLOW_QUERY_THRESHOLD_MS are written as JSON lines to
+# a rotating log with their redacted parameters, the endpoint that ran them
+# and the database's query plan. The admin slow-queries page aggregates the
+# log by statement shape. Timing comes from the instrumentation hooks, so
+# SQL_INSTRUMENTATION must be on.
+
+logger = logging.getLogger('roomtrack.slow_queries')
+_settings = {'threshold': None, 'explain': True}
+
+_ISO_DATE = re.compile(r'^\d{4}-\d{2}-\d{2}([ T][\d:.]+)?$')
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r'\b\d+(\.\d+)?\b')
+_PLACEHOLDER_LIST = re.compile(r'\((?:\s*(?:\?|%s|:\w+)\s*,)+\s*(?:\?|%s|:\w+)\s*\)')
+_EXPLAINABLE = ('select', 'with', 'insert', 'update', 'delete')
+
+
+def redact_value(value):
+    # Numbers and dates help explain a plan; free text may be personal data
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    if isinstance(value, str) and _ISO_DATE.match(value):
+        return value
+    if isinstance(value, (str, bytes)):
+        return f'<{type(value).__name__}:{len(value)}>'
+    return f'<{type(value).__name__}>'
+
+
+def redact(parameters):
+    if isinstance(parameters, dict):
+        return {key: redact_value(value) for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [redact_value(value) for value in parameters]
+    return redact_value(parameters)
+
+
+def normalize(statement):
+    """Statement shape: literals replaced and IN lists collapsed."""
+    shape = ' '.join(statement.split())
+    shape = _STRING_LITERAL.sub('?', shape)
+    shape = _NUMBER_LITERAL.sub('?', shape)
+    return _PLACEHOLDER_LIST.sub('(?, ...)', shape)
+
+
+def explain(conn, statement, parameters):
+    if not statement.lstrip().lower().startswith(_EXPLAINABLE):
+        return None
+    sqlite = conn.dialect.name == 'sqlite'
+    prefix = 'EXPLAIN QUERY PLAN ' if sqlite else 'EXPLAIN '
+    # A raw DBAPI cursor, so the EXPLAIN itself is not instrumented
+    cursor = conn.connection.dbapi_connection.cursor()
+    try:
+        cursor.execute(prefix + statement, parameters)
+        # SQLite plan rows are (id, parent, notused, detail)
+        return [row[3] if sqlite else ' '.join(str(column) for column in row) for row in cursor.fetchall()]
+    except Exception as e:
+        return [f'EXPLAIN failed: {e}']
+    finally:
+        cursor.close()
+
+
+def record_statement(statement, parameters, elapsed, stats, conn):
+    if elapsed * 1000 < _settings['threshold']:
+        return
+    executemany = isinstance(parameters, list) and parameters and isinstance(parameters[0], (list, tuple, dict))
+    entry = {
+        'time': datetime.utcnow().isoformat(timespec='seconds'),
+        'duration_ms': round(elapsed * 1000, 2),
+        'endpoint': stats.endpoint if stats is not None else None,
+        'statement': ' '.join(statement.split()),
+        'shape': normalize(statement),
+        'parameters': f'<{len(parameters)} rows>' if executemany else redact(parameters),
+        'plan': explain(conn, statement, parameters) if _settings['explain'] and not executemany else None
+    }
+    logger.warning(json.dumps(entry, default=str))
+
+
+def init_slow_query_log(app):
+    if not app.config.get('SQL_INSTRUMENTATION', True):
+        return
+    path = app.config.get('SLOW_QUERY_LOG')
+    if not path:
+        return
+
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        handler = RotatingFileHandler(path, maxBytes=app.config.get('SLOW_QUERY_LOG_MAX_BYTES', 5 * 1024 * 1024),
+                                      backupCount=app.config.get('SLOW_QUERY_LOG_BACKUPS', 3), delay=True)
+    except OSError:
+        app.logger.warning('Slow-query log disabled: %s is not writable', path)
+        return
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.handlers = [handler]
+    logger.setLevel(logging.WARNING)
+    logger.propagate = False
+
+    _settings['threshold'] = app.config.get('SLOW_QUERY_THRESHOLD_MS', 100)
+    _settings['explain'] = app.config.get('SLOW_QUERY_EXPLAIN', True)
+
+    from instrumentation import add_statement_listener
+    add_statement_listener(record_statement)
+
+
+def read_entries(path, backups):
+    # Oldest file first, so entries come out in time order
+    paths = [f'{path}.{i}' for i in range(backups, 0, -1)] + [path]
+    for log_path in paths:
+        try:
+            with open(log_path) as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        continue
+        except OSError:
+            continue
+
+
+def top_offenders(path, backups, limit=50):
+    """Slow statements grouped by shape, most total time first."""
+    groups = {}
+    for entry in read_entries(path, backups):
+        group = groups.get(entry['shape'])
+        if group is None:
+            group = groups[entry['shape']] = {
+                'shape': entry['shape'], 'count': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+                'endpoints': set(), 'last_seen': None, 'example': None
+            }
+        group['count'] += 1
+        group['total_ms'] += entry['duration_ms']
+        if entry['endpoint']:
+            group['endpoints'].add(entry['endpoint'])
+        group['last_seen'] = entry['time']
+        if entry['duration_ms'] >= group['max_ms']:
+            group['max_ms'] = entry['duration_ms']
+            group['example'] = entry
+
+    offenders = sorted(groups.values(), key=lambda g: g['total_ms'], reverse=True)[:limit]
+    for group in offenders:
+        group['mean_ms'] = group['total_ms'] / group['count']
+        group['endpoints'] = sorted(group['endpoints'])
+    return offenders
@@ -41,4 +41,11 @@ function showNotification(title, message) {
 // Request notification permission
 if ('Notification' in window) {
     Notification.requestPermission();
-}
\ No newline at end of file
+}
+
+// Escape text before it is placed into innerHTML
+function escapeHtml(value) {
+    const div = document.createElement('div');
+    div.textContent = value == null ? '' : value;
+    return div.innerHTML;
+}
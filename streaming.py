@@ -0,0 +1,87 @@
+from flask import Response, current_app, render_template, stream_template
+
+# Streamed rendering for pages with long tables.
+# The template is rendered with stream_template() and its output buffered;
+# the buffer is sent when the table reaches its first row and then every
+# STREAM_FLUSH_ROWS rows, so the header and first rows go out before the
+# rest of the table has been queried. Row sources read their query with
+# yield_per(), which keeps memory flat however long the table is.
+# A streamed page runs its queries and rendering after the after_request
+# hooks; hooks that time the request finish through when_sent().
+
+_END = object()
+
+
+class RowSource:
+    """Rows for a streamed table; asks for a flush before the first row and every flush_every rows."""
+
+    def __init__(self, rows, flush_every):
+        self.rows = iter(rows)
+        self.flush_every = flush_every
+        # Flush requests; stream_page() shares one list between all sources of a page
+        self.flushes = []
+        self._next = None
+
+    def _peek(self):
+        if self._next is None:
+            self._next = next(self.rows, _END)
+        return self._next
+
+    def __bool__(self):
+        # Templates check {% if rows %} before opening the table
+        return self._peek() is not _END
+
+    def __iter__(self):
+        self.flushes.append(self)
+        count = 0
+        while True:
+            row = self._peek()
+            self._next = None
+            if row is _END:
+                return
+            yield row
+            count += 1
+            if count % self.flush_every == 0:
+                self.flushes.append(self)
+
+
+def stream_rows(query, transform=None):
+    """Wrap a query (or any iterable of rows) in a RowSource for stream_page()."""
+    batch = current_app.config['STREAM_FLUSH_ROWS']
+    rows = query.yield_per(batch) if hasattr(query, 'yield_per') else query
+    if transform is not None:
+        rows = (transform(row) for row in rows)
+    return RowSource(rows, batch)
+
+
+def when_sent(response, callback):
+    """Call callback once the response body is complete: now, or when a streamed body is closed."""
+    if response.is_streamed:
+        response.call_on_close(callback)
+    else:
+        callback()
+
+
+def stream_page(template_name, **context):
+    if not current_app.config['STREAM_PAGES']:
+        return render_template(template_name, **context)
+
+    flushes = []
+    for value in context.values():
+        if isinstance(value, RowSource):
+            value.flushes = flushes
+    pieces = stream_template(template_name, **context)
+
+    def generate():
+        # Checked once per template output piece, so it has to stay this cheap
+        buffer = []
+        for piece in pieces:
+            buffer.append(piece)
+            if flushes:
+                flushes.clear()
+                yield ''.join(buffer)
+                buffer = []
+        if buffer:
+            yield ''.join(buffer)
+
+    return Response(generate(), mimetype='text/html', headers={'X-Accel-Buffering': 'no'})
@@ -0,0 +1,322 @@
+"""Generate a large, realistic RoomTrack dataset for load and capacity testing.
+
+Rows are built from the real models in models.py and written with batched
+executemany inserts inside large transactions. The same --seed always
+produces the same data for the same --as-of date.
+
+    python synth_data.py --landlords 1000 --months 24 --seed 42
+    python synth_data.py --landlords 50 --reset       # drop and recreate all tables first
+
+The database is the one configured for the app (DATABASE_URL). Synthetic
+users log in with the password 'pass123'.
+"""
+import argparse
+import random
+import string
+import time
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import func, text
+
+FIRST_NAMES = ['Wanjiru', 'Kamau', 'Achieng', 'Otieno', 'Njeri', 'Mwangi', 'Akinyi', 'Kiprop', 'Chebet', 'Mutua',
+               'Wambui', 'Omondi', 'Nyambura', 'Kibet', 'Atieno', 'Karanja', 'Moraa', 'Onyango', 'Wairimu', 'Ruto',
+               'Amina', 'Hassan', 'Grace', 'David', 'Faith', 'Brian', 'Mercy', 'Kevin', 'Esther', 'Dennis']
+LAST_NAMES = ['Kariuki', 'Odhiambo', 'Wafula', 'Njoroge', 'Cheruiyot', 'Muthoni', 'Ochieng', 'Kimani', 'Barasa',
+              'Koech', 'Mugo', 'Owino', 'Wekesa', 'Macharia', 'Langat', 'Gitau', 'Okoth', 'Nyaga', 'Simiyu', 'Kiplagat']
+AREAS = {
+    # area: (address, base rent for a one-bedroom)
+    'Kilimani': ('Argwings Kodhek Road, Kilimani, Nairobi', 35000),
+    'Westlands': ('Waiyaki Way, Westlands, Nairobi', 40000),
+    'Kileleshwa': ('Othaya Road, Kileleshwa, Nairobi', 38000),
+    'South B': ('Mchumbu Road, South B, Nairobi', 22000),
+    'Roysambu': ('Thika Road, Roysambu, Nairobi', 15000),
+    'Kasarani': ('Mwiki Road, Kasarani, Nairobi', 12000),
+    'Nyali': ('Links Road, Nyali, Mombasa', 28000),
+    'Milimani': ('Milimani Road, Kisumu', 18000),
+    'Section 58': ('Kenyatta Avenue, Section 58, Nakuru', 14000),
+    'Ruiru': ('Kamiti Road, Ruiru, Kiambu', 11000)
+}
+PROPERTY_NAMES = ['Apartments', 'Court', 'Heights', 'Residences', 'Gardens', 'Towers', 'Villas', 'Place', 'Estate']
+MAINTENANCE_ISSUES = [
+    ('Leaking tap', 'The kitchen tap keeps dripping even when fully closed.'),
+    ('Blocked drain', 'The bathroom drain is blocked and water is not flowing out.'),
+    ('Broken window', 'One of the bedroom window panes is cracked.'),
+    ('No hot water', 'The water heater is not working since yesterday.'),
+    ('Power outage in unit', 'The sockets in the living room have no power.'),
+    ('Faulty door lock', 'The main door lock is stiff and sometimes does not open.'),
+    ('Damp wall', 'There is a damp patch spreading on the bedroom wall.'),
+    ('Pest control', 'We have noticed cockroaches in the kitchen.'),
+    ('Toilet not flushing', 'The toilet cistern does not refill after flushing.'),
+    ('Gate remote not working', 'The parking gate remote stopped working.')
+]
+MESSAGE_TOPICS = [
+    ('Rent', 'I have paid this month\'s rent via M-Pesa, kindly confirm.'),
+    ('Water', 'Is there a water rationing schedule this week?'),
+    ('Lease renewal', 'I would like to renew my lease for another year.'),
+    ('Visitor parking', 'Can my visitor use the spare parking slot this weekend?'),
+    ('Receipt', 'Please share the receipt for last month\'s payment.'),
+    ('Notice', 'Kindly note the caretaker will be inspecting units on Saturday.')
+]
+# Hour of day weights for user activity: quiet at night, peaks at lunch and in the evening
+HOUR_WEIGHTS = [1, 1, 1, 1, 1, 2, 4, 6, 8, 8, 7, 7, 9, 8, 6, 6, 7, 9, 12, 13, 12, 9, 5, 2]
+PASSWORD = 'pass123'
+
+
+def at_activity_time(day, rng):
+    hour = rng.choices(range(24), HOUR_WEIGHTS)[0]
+    return datetime.combine(day, datetime.min.time()) + timedelta(hours=hour, minutes=rng.randrange(60),
+                                                                   seconds=rng.randrange(60))
+
+
+def transaction_code(rng, method):
+    code = ''.join(rng.choices(string.ascii_uppercase + string.digits, k=10))
+    return code if method == 'mpesa' else f'{method.upper()}-{code}'
+
+
+def person(rng):
+    return f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}'
+
+
+def phone(rng):
+    return f'+2547{rng.randrange(10 ** 8):08d}'
+
+
+class Loader:
+    # Buffers rows per table and writes them in dependency order with executemany
+    def __init__(self, conn, tables, batch_size):
+        self.conn = conn
+        self.tables = tables
+        self.batch_size = batch_size
+        self.buffers = {name: [] for name in tables}
+        self.counts = {name: 0 for name in tables}
+
+    def add(self, name, row):
+        buffer = self.buffers[name]
+        buffer.append(row)
+        if len(buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        # Parents first, so foreign keys hold on databases that enforce them
+        for name, table in self.tables.items():
+            rows = self.buffers[name]
+            if rows:
+                self.conn.execute(table.insert(), rows)
+                self.counts[name] += len(rows)
+                self.buffers[name] = []
+
+
+class Synthesizer:
+    def __init__(self, loader, rng, args, first_ids):
+        self.loader = loader
+        self.rng = rng
+        self.args = args
+        self.ids = dict(first_ids)
+        self.today = args.as_of
+        self.history_start = self.today - timedelta(days=30 * args.months)
+
+    def next_id(self, table):
+        self.ids[table] += 1
+        return self.ids[table]
+
+    def add_user(self, role, name, created_at):
+        user_id = self.next_id('user')
+        first, last = name.lower().split(' ', 1)
+        self.loader.add('user', dict(
+            id=user_id, username=f'{role}{user_id}', email=f'{first}.{last}.{user_id}@example.co.ke',
+            password=PASSWORD, role=role, full_name=name,
+            id_number=str(self.rng.randrange(10 ** 7, 4 * 10 ** 7)) if role == 'tenant' else None,
+            passport_number=None, phone=phone(self.rng), created_at=created_at))
+        return user_id
+
+    def notify(self, user_id, title, message, type, created_at):
+        notification_id = self.next_id('notification')
+        self.loader.add('notification', dict(
+            id=notification_id, user_id=user_id, title=title, message=message, type=type,
+            is_read=(self.today - created_at.date()).days > 14 or self.rng.random() < 0.5,
+            count=1, refs=None, created_at=created_at, updated_at=created_at))
+
+    def run(self):
+        rng = self.rng
+        for _ in range(self.args.landlords):
+            joined = at_activity_time(self.history_start - timedelta(days=rng.randrange(365)), rng)
+            landlord_id = self.add_user('landlord', person(rng), joined)
+            # Most landlords own one or two properties, a few own many
+            for _ in range(max(1, min(int(rng.expovariate(1 / self.args.properties)) + 1, 4 * self.args.properties))):
+                self.add_property(landlord_id, joined)
+        self.loader.flush()
+
+    def add_property(self, landlord_id, joined):
+        rng = self.rng
+        area = rng.choice(list(AREAS))
+        address, base_rent = AREAS[area]
+        property_id = self.next_id('property')
+        unit_count = max(1, int(rng.gauss(self.args.units, self.args.units / 3)))
+
+        # Plan every unit first so rows can be written parents-first
+        units = [self.plan_unit(f'{chr(65 + (i // 4) % 26)}{i // 4 + 1}{i % 4 + 1:02d}', base_rent)
+                 for i in range(unit_count)]
+        self.loader.add('property', dict(
+            id=property_id, name=f'{rng.choice(LAST_NAMES)} {rng.choice(PROPERTY_NAMES)}', address=address,
+            total_units=unit_count, occupied_units=sum(unit['status'] == 'occupied' for unit, _ in units),
+            landlord_id=landlord_id, created_at=joined))
+        for unit, leases in units:
+            unit['id'] = self.next_id('unit')
+            unit['property_id'] = property_id
+            self.loader.add('unit', unit)
+            for start, end, current in leases:
+                self.add_lease(unit['id'], landlord_id, unit['rent_amount'], start, end, current)
+
+    def plan_unit(self, unit_number, base_rent):
+        rng = self.rng
+        bedrooms = rng.choices([0, 1, 2, 3, 4], [10, 35, 35, 15, 5])[0]
+        rent = round(base_rent * (0.6 + 0.45 * bedrooms) * rng.uniform(0.9, 1.1), -2)
+
+        # Walk the unit's history: leases of 6-24 months separated by short vacancies
+        leases = []
+        day = self.history_start - timedelta(days=rng.randrange(365))
+        while day < self.today:
+            end = day + timedelta(days=30 * rng.choice([6, 12, 12, 12, 24]))
+            current = end >= self.today and rng.random() < 0.92
+            if end < self.today or current:
+                leases.append((day, end, current))
+            day = end + timedelta(days=rng.choice([0, 0, 15, 30, 60]))
+
+        occupied = any(current for _, _, current in leases)
+        unit = dict(unit_number=unit_number, unit_name=None, rent_amount=rent,
+                    status='occupied' if occupied else 'vacant', bedrooms=bedrooms, bathrooms=1 + (bedrooms >= 3),
+                    square_feet=350 + 250 * bedrooms + rng.randrange(100))
+        return unit, leases
+
+    def add_lease(self, unit_id, landlord_id, rent, start, end, current):
+        rng = self.rng
+        tenant_name = person(rng)
+        tenant_id = self.add_user('tenant', tenant_name, at_activity_time(start - timedelta(days=rng.randrange(1, 20)), rng))
+        lease_id = self.next_id('lease')
+        self.loader.add('lease', dict(
+            id=lease_id, tenant_id=tenant_id, unit_id=unit_id, start_date=start, end_date=end, monthly_rent=rent,
+            security_deposit=rent, status='active' if current else rng.choice(['expired', 'expired', 'terminated']),
+            created_at=at_activity_time(start - timedelta(days=3), rng)))
+
+        last_day = min(end, self.today)
+        due = start
+        while due <= last_day:
+            self.add_payment(lease_id, tenant_id, tenant_name, landlord_id, rent, due)
+            due += timedelta(days=30)
+
+        # Maintenance requests arrive about twice a year per occupied unit
+        months = max(1, (last_day - start).days // 30)
+        for _ in range(sum(rng.random() < 1 / 6 for _ in range(months))):
+            self.add_maintenance(tenant_id, tenant_name, unit_id, landlord_id, start, last_day)
+        for _ in range(rng.randint(0, months // 2 + 1)):
+            self.add_message(tenant_id, landlord_id, start, last_day)
+
+    def add_payment(self, lease_id, tenant_id, tenant_name, landlord_id, rent, due):
+        rng = self.rng
+        # Most tenants pay within a few days of the due date; some are late
+        paid = due + timedelta(days=int(rng.gauss(1, 3)) + (int(rng.expovariate(1 / 10)) if rng.random() < 0.15 else 0))
+        if paid > self.today:
+            return
+        method = rng.choices(['mpesa', 'bank', 'cash'], [75, 20, 5])[0]
+        age = (self.today - paid).days
+        status = 'pending' if age < 5 and rng.random() < 0.7 else rng.choices(['approved', 'rejected'], [97, 3])[0]
+        submitted = at_activity_time(paid, rng)
+        amount = rent if rng.random() < 0.9 else round(rent * rng.choice([0.5, 0.75]), -2)
+        self.loader.add('payment', dict(
+            id=self.next_id('payment'), lease_id=lease_id, amount=amount, payment_date=paid, due_date=due,
+            transaction_code=transaction_code(rng, method), payment_method=method, status=status,
+            receipt_generated=status == 'approved', created_at=submitted))
+        self.notify(landlord_id, 'New Payment Submitted',
+                    f'Tenant {tenant_name} submitted a payment of KES {amount:,.2f}.', 'payment_submitted', submitted)
+        if status != 'pending':
+            reviewed = submitted + timedelta(hours=rng.randint(1, 72))
+            if status == 'approved':
+                self.notify(tenant_id, 'Payment Approved',
+                            f'Your payment of KES {amount:,.2f} has been approved. Receipt has been generated.',
+                            'payment_approved', reviewed)
+            else:
+                self.notify(tenant_id, 'Payment Rejected',
+                            f'Your payment of KES {amount:,.2f} was rejected. Please contact your landlord.',
+                            'payment_rejected', reviewed)
+
+    def add_maintenance(self, tenant_id, tenant_name, unit_id, landlord_id, start, last_day):
+        rng = self.rng
+        created = at_activity_time(start + timedelta(days=rng.randrange(max(1, (last_day - start).days))), rng)
+        age = (self.today - created.date()).days
+        status = ('completed' if age > 30 else rng.choice(['pending', 'in_progress', 'completed']))
+        title, description = rng.choice(MAINTENANCE_ISSUES)
+        self.loader.add('maintenance_request', dict(
+            id=self.next_id('maintenance_request'), tenant_id=tenant_id, unit_id=unit_id, title=title,
+            description=description, urgency=rng.choices(['low', 'medium', 'high', 'emergency'], [25, 45, 25, 5])[0],
+            status=status, created_at=created,
+            updated_at=created + timedelta(days=rng.randint(0, 10)) if status != 'pending' else created))
+        self.notify(landlord_id, 'New Maintenance Request',
+                    f'Tenant {tenant_name} submitted a maintenance request: {title}', 'maintenance_request', created)
+
+    def add_message(self, tenant_id, landlord_id, start, last_day):
+        rng = self.rng
+        sent = at_activity_time(start + timedelta(days=rng.randrange(max(1, (last_day - start).days))), rng)
+        subject, body = rng.choice(MESSAGE_TOPICS)
+        sender, receiver = (tenant_id, landlord_id) if rng.random() < 0.7 else (landlord_id, tenant_id)
+        self.loader.add('message', dict(
+            id=self.next_id('message'), sender_id=sender, receiver_id=receiver, subject=subject, message=body,
+            is_read=(self.today - sent.date()).days > 7 or rng.random() < 0.4, created_at=sent))
+        self.notify(receiver, 'New Message', 'You have a new message', 'new_message', sent)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--landlords', type=int, default=100)
+    parser.add_argument('--properties', type=int, default=2, help='mean properties per landlord')
+    parser.add_argument('--units', type=int, default=16, help='mean units per property')
+    parser.add_argument('--months', type=int, default=24, help='months of lease and payment history')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--as-of', type=date.fromisoformat, default=date.today(),
+                        help='date the history runs up to (YYYY-MM-DD); fix it to reproduce a dataset exactly')
+    parser.add_argument('--batch-size', type=int, default=20000)
+    parser.add_argument('--reset', action='store_true', help='drop and recreate all tables first')
+    args = parser.parse_args()
+
+    from app import app, db, init_db
+    from models import User, Property, Unit, Lease, Payment, MaintenanceRequest, Message, Notification
+    from search import FTS_INDEXES, fts_enabled, rebuild_search_index
+    from conversations import backfill_conversations
+
+    models = (User, Property, Unit, Lease, Payment, MaintenanceRequest, Message, Notification)
+    with app.app_context():
+        if args.reset:
+            import archive, occupancy, attachments  # register their tables so drop_all() removes them too
+            db.drop_all()
+        init_db()
+
+        started = time.perf_counter()
+        with db.engine.begin() as conn:
+            if fts_enabled():
+                # Bulk-load without per-row index triggers; the index is rebuilt once afterwards
+                conn.execute(text('PRAGMA synchronous = OFF'))
+                conn.execute(text('PRAGMA cache_size = -200000'))
+                conn.execute(text('PRAGMA temp_store = MEMORY'))
+                for fts_table, _ in FTS_INDEXES.values():
+                    conn.execute(text(f'DROP TRIGGER IF EXISTS {fts_table}_ai'))
+
+            first_ids = {m.__tablename__: conn.execute(db.select(func.coalesce(func.max(m.id), 0))).scalar()
+                         for m in models}
+            loader = Loader(conn, {m.__tablename__: m.__table__ for m in models}, args.batch_size)
+            Synthesizer(loader, random.Random(args.seed), args, first_ids).run()
+        # Group the loaded messages into conversations in a few set-based statements
+        backfill_conversations()
+        loaded = time.perf_counter() - started
+
+        if fts_enabled():
+            rebuild_search_index()
+        elapsed = time.perf_counter() - started
+
+    total = sum(loader.counts.values())
+    for table, count in loader.counts.items():
+        print(f'{table:<22} {count:>12,}')
+    print(f'{"total":<22} {total:>12,}')
+    print(f'Inserted in {loaded:.1f}s ({total / loaded:,.0f} rows/s), {elapsed:.1f}s including search index')
+
+
+if __name__ == '__main__':
+    main()
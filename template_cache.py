@@ -0,0 +1,72 @@
+from jinja2 import FileSystemBytecodeCache
+from hashlib import sha1
+from metrics import record_cache
+import os
+import sys
+
+# Jinja bytecode caching for cold starts.
+# Compiled templates are read from a precompiled directory that the deploy
+# build writes (`flask precompile-templates`, the buildCommand in
+# vercel.json) and otherwise from a writable cache directory, which
+# survives warm restarts of the same instance. The build runs on the
+# deployment's Python, and Jinja bytecode only loads on the Python version
+# that wrote it, so the precompiled directory has one subdirectory per
+# Python version; a deployment whose version has none logs a warning rather
+# than silently compiling every template on each cold start.
+
+
+class PortableBytecodeCache(FileSystemBytecodeCache):
+    # Key on the template name only: the absolute path differs between the
+    # build machine and the serverless runtime, and Jinja still rejects stale
+    # bytecode by comparing the source checksum stored in each bucket.
+    def get_cache_key(self, name, filename=None):
+        return sha1(name.encode('utf-8')).hexdigest()
+
+
+def versioned(directory):
+    """The subdirectory of a precompiled directory for the running Python version."""
+    return os.path.join(directory, f'python{sys.version_info[0]}.{sys.version_info[1]}')
+
+
+class LayeredBytecodeCache(PortableBytecodeCache):
+    def __init__(self, directory, precompiled_directory=None):
+        os.makedirs(directory, exist_ok=True)
+        super().__init__(directory)
+        self.precompiled = None
+        if precompiled_directory and os.path.isdir(versioned(precompiled_directory)):
+            self.precompiled = PortableBytecodeCache(versioned(precompiled_directory))
+
+    def load_bytecode(self, bucket):
+        if self.precompiled is not None:
+            self.precompiled.load_bytecode(bucket)
+            if bucket.code is not None:
+                record_cache('jinja_precompiled', True)
+                return
+        super().load_bytecode(bucket)
+        record_cache('jinja_bytecode', bucket.code is not None)
+
+
+def init_template_cache(app):
+    directory = app.config.get('JINJA_BYTECODE_CACHE_DIR')
+    if not directory:
+        return
+    precompiled = app.config.get('JINJA_PRECOMPILED_DIR')
+    if precompiled and os.path.isdir(precompiled) and not os.path.isdir(versioned(precompiled)):
+        app.logger.warning('No precompiled templates for this Python in %s; run flask precompile-templates '
+                           'with the deployed Python version', precompiled)
+    try:
+        app.jinja_env.bytecode_cache = LayeredBytecodeCache(directory, precompiled)
+    except OSError:
+        # Read-only filesystem; templates compile in memory as before
+        app.logger.warning('Jinja bytecode cache disabled: %s is not writable', directory)
+
+
+def precompile_templates(app, directory):
+    # Compile every template once and write its bytecode for this Python version
+    directory = versioned(directory)
+    os.makedirs(directory, exist_ok=True)
+    env = app.jinja_env.overlay(bytecode_cache=PortableBytecodeCache(directory), cache_size=0)
+    names = env.list_templates(extensions=['html'])
+    for name in names:
+        env.get_template(name)
+    return names
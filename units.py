@@ -0,0 +1,182 @@
+import csv
+import io
+import string
+from collections import Counter
+from datetime import date
+from sqlalchemy import case, func, insert, select, update
+from models import db, Property, Unit
+from sharding import allocate_ids
+
+# Bulk unit creation.
+# Units are generated from a pattern (floors x units per floor, a unit
+# number format such as 'A{floor}{nn}', rent and bedroom templates) or read
+# from an uploaded list, and inserted with one executemany INSERT. The
+# property row is updated first, which holds its row lock (SQLite's write
+# lock) until commit, so concurrent batches for one property are serialised
+# and the single set-based duplicate check that follows cannot race another
+# batch. total_units is raised in the same UPDATE to at least the number of
+# units the property will have.
+
+MAX_BULK_UNITS = 5000
+MAX_FLOORS = 200
+UNIT_FIELDS = ('unit_number', 'unit_name', 'rent_amount', 'bedrooms', 'bathrooms', 'square_feet')
+PATTERN_FIELDS = ('floor', 'n', 'nn', 'i')
+
+
+class UnitBatchError(Exception):
+    pass
+
+
+def template_value(template, position, floor_index, step=0):
+    """A number, or a list taken in turn by position on the floor, plus step per floor."""
+    value = template[position % len(template)] if isinstance(template, list) else template
+    return value + step * floor_index if step else value
+
+
+def check_format(name, value, limit):
+    """Reject anything in a user-supplied format but plain {floor}, {n}, {nn} and {i} fields."""
+    if not isinstance(value, str) or len(value) > limit:
+        raise UnitBatchError(f'{name} must be text of at most {limit} characters')
+    try:
+        parsed = list(string.Formatter().parse(value))
+    except ValueError as e:
+        raise UnitBatchError(f'Invalid {name}: {e}')
+    for _, field, spec, conversion in parsed:
+        if field is not None and (field not in PATTERN_FIELDS or spec or conversion):
+            raise UnitBatchError(f'{name} may only use {{floor}}, {{n}}, {{nn}} and {{i}}')
+    return value
+
+
+def expand_pattern(pattern):
+    """Unit rows for floors x units_per_floor from a pattern dict.
+
+    format and unit_name may use {floor}, {n} (position on the floor, from
+    1), {nn} (n zero-padded to two digits) and {i} (running number, from 1).
+    rent_amount, bedrooms and bathrooms are a number or a list used in turn
+    along each floor; rent_step_per_floor is added once per floor above the
+    first.
+    """
+    try:
+        floors = int(pattern.get('floors', 1))
+        units_per_floor = int(pattern['units_per_floor'])
+        first_floor = int(pattern.get('first_floor', 1))
+        rent_step = float(pattern.get('rent_step_per_floor', 0))
+    except (KeyError, TypeError, ValueError):
+        raise UnitBatchError('floors, units_per_floor and first_floor must be whole numbers')
+    if not 0 < floors <= MAX_FLOORS or units_per_floor <= 0:
+        raise UnitBatchError(f'floors must be between 1 and {MAX_FLOORS} and units_per_floor positive')
+    if floors * units_per_floor > MAX_BULK_UNITS:
+        raise UnitBatchError(f'At most {MAX_BULK_UNITS} units can be created at once')
+
+    templates = {}
+    for field, default in (('rent_amount', None), ('bedrooms', 1), ('bathrooms', 1)):
+        template = pattern.get(field, default)
+        values = template if isinstance(template, list) else [template]
+        if not values or not all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in values):
+            raise UnitBatchError(f'{field} must be a number or a list of numbers')
+        templates[field] = template
+    number_format = check_format('format', pattern.get('format') or '{floor}{nn}', 50)
+    name_format = check_format('unit_name', pattern['unit_name'], 200) if pattern.get('unit_name') else None
+
+    rows = []
+    for floor_index, floor in enumerate(range(first_floor, first_floor + floors)):
+        for position in range(units_per_floor):
+            fields = {'floor': floor, 'n': position + 1, 'nn': f'{position + 1:02d}', 'i': len(rows) + 1}
+            unit_number = number_format.format_map(fields).strip()[:50]
+            if not unit_number:
+                raise UnitBatchError('format must give a unit number')
+            rows.append({
+                'unit_number': unit_number,
+                'unit_name': (name_format.format_map(fields).strip()[:200] or None) if name_format else None,
+                'rent_amount': template_value(templates['rent_amount'], position, floor_index, rent_step),
+                'bedrooms': template_value(templates['bedrooms'], position, floor_index),
+                'bathrooms': template_value(templates['bathrooms'], position, floor_index),
+                'square_feet': None,
+            })
+    return rows
+
+
+def clean_unit_rows(items):
+    """Validate unit rows from a JSON list or an uploaded file into insertable dicts."""
+    if len(items) > MAX_BULK_UNITS:
+        raise UnitBatchError(f'At most {MAX_BULK_UNITS} units can be created at once')
+    rows = []
+    for line, item in enumerate(items, start=1):
+        if not isinstance(item, dict):
+            raise UnitBatchError(f'Unit {line}: expected an object')
+        unit_number = str(item.get('unit_number') or '').strip()
+        if not unit_number:
+            raise UnitBatchError(f'Unit {line}: unit_number is required')
+        try:
+            rows.append({
+                'unit_number': unit_number[:50],
+                'unit_name': (str(item['unit_name']).strip() or None) if item.get('unit_name') else None,
+                'rent_amount': float(item['rent_amount']),
+                'bedrooms': int(item.get('bedrooms') or 1),
+                'bathrooms': int(item.get('bathrooms') or 1),
+                'square_feet': int(item['square_feet']) if item.get('square_feet') else None,
+            })
+        except (KeyError, TypeError, ValueError):
+            raise UnitBatchError(f'Unit {line} ({unit_number}): rent_amount is required and numbers must be numeric')
+    return rows
+
+
+def read_unit_file(stream):
+    """Unit rows from an uploaded CSV file with a header row naming UNIT_FIELDS columns."""
+    reader = csv.DictReader(io.TextIOWrapper(stream, encoding='utf-8-sig', newline=''))
+    items = []
+    try:
+        if not reader.fieldnames or 'unit_number' not in reader.fieldnames:
+            raise UnitBatchError('The file needs a header row with unit_number and rent_amount columns')
+        for item in reader:
+            items.append(item)
+            if len(items) > MAX_BULK_UNITS:
+                break
+    except UnicodeDecodeError:
+        raise UnitBatchError('The file must be UTF-8 encoded CSV')
+    except csv.Error as e:
+        raise UnitBatchError(f'Invalid CSV: {e}')
+    return clean_unit_rows(items)
+
+
+def create_units(property, rows):
+    """Add vacant units to a property in one batch; returns the number created.
+
+    Raises UnitBatchError, leaving nothing written, when a unit number repeats
+    within rows or already exists in the property. The caller commits, or
+    rolls back on the error.
+    """
+    if not rows:
+        raise UnitBatchError('No units to create')
+    repeated = sorted(number for number, count in Counter(row['unit_number'] for row in rows).items() if count > 1)
+    if repeated:
+        raise UnitBatchError(f"Repeated unit numbers: {', '.join(repeated[:20])}")
+    property_id = property.id
+
+    existing_units = select(func.count()).select_from(Unit).where(Unit.property_id == property_id).scalar_subquery()
+    needed = existing_units + len(rows)
+    db.session.execute(
+        update(Property).where(Property.id == property_id)
+        .values(total_units=case((Property.total_units < needed, needed), else_=Property.total_units)),
+        execution_options={'synchronize_session': False}
+    )
+    taken = db.session.scalars(
+        select(Unit.unit_number).where(Unit.property_id == property_id,
+                                       Unit.unit_number.in_([row['unit_number'] for row in rows]))
+    ).all()
+    if taken:
+        raise UnitBatchError(f"Unit numbers already exist: {', '.join(sorted(taken)[:20])}")
+
+    ids = allocate_ids('unit', len(rows))
+    values = [dict(row, property_id=property_id, status='vacant', version=0) for row in rows]
+    if ids:
+        for row, unit_id in zip(values, ids):
+            row['id'] = unit_id
+    db.session.execute(insert(Unit.__table__), values)
+
+    from occupancy import invalidate_occupancy
+
+    # Cached months count the property's units
+    invalidate_occupancy([property_id], date.today())
+    db.session.expire(property, ['total_units'])
+    return len(values)
@@ -0,0 +1,9 @@
+from app import app, init_db, warm_up
+
+# Production WSGI entry point, e.g. `gunicorn -c gunicorn.conf.py`.
+# Schema setup and warm-up run once at import, which with preload_app
+# happens in the master before any worker is forked.
+init_db()
+warm_up()
+
+application = app